@@ -0,0 +1,187 @@
+"""
+Python bindings of the simulation: run it in this process, step by step,
+with the field and the particles as numpy arrays that share the memory of
+the simulation (no copies, no files in between).
+
+Build the shared library next to this file with `make lib` (it takes the
+PREC and OMP options of the program; not with MPI), then:
+
+    import habp
+    sim = habp.Simulation("run_1", {"Lx": 256, "Ly": 256, "t_total": 20000})
+    while sim.t <= sim.total_steps:
+        sim.step(100)
+        psi = sim.psi                   # psi[j, i], (Ly, Lx), a view
+        x, y = sim.particles["x"], sim.particles["y"]
+        ...
+    sim.close()
+
+The overrides update the defaults of input_creator and are passed to the
+library directly, as the text of a parameters.in (no file is written;
+input_creator.write_parameters_file writes one, for instance for
+simulation.exe to continue the run); with None, the parameters.in of the
+directory is read. The directory
+receives the usual output files: snapshots, statistics and checkpoints are
+written on the parameters' intervals, and a checkpoint.bin found there is
+restarted from, as with simulation.exe. Changes made to the arrays between
+calls of step() act on the simulation (positions must stay inside the box).
+The views are valid until close(); the particles are reordered in memory
+by the spatial sort, their global index being particles["id"] (1-based).
+
+Only one simulation at a time can be run in a process, and the later ones
+must use the lattice size of the first one. Invalid parameters, a restart
+without a usable checkpoint and a failed step (a particle instability)
+raise RuntimeError (the reason is printed by the library) instead of
+ending the process.
+"""
+import ctypes
+import os
+from pathlib import Path
+import numpy as np
+
+from input_creator import parameters_text
+
+LIBRARY = Path(os.environ.get("HABP_LIB", Path(__file__).with_name("libhabp.so")))
+
+REAL_ARRAYS = ("x", "y", "phi", "fx", "fy", "fx_pp", "fy_pp")
+INT_ARRAYS = ("ix", "iy", "id")
+
+_lib = None
+
+
+def _load():
+    """The shared library, loaded on first use."""
+    global _lib
+    if _lib is None:
+        if not LIBRARY.exists():
+            raise OSError(f"{LIBRARY} not found: build it with `make lib` in Code/")
+        lib = ctypes.CDLL(str(LIBRARY))
+        lib.habp_init.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        lib.habp_init.restype = ctypes.c_int
+        lib.habp_step.argtypes = [ctypes.c_int]
+        lib.habp_step.restype = ctypes.c_int
+        lib.habp_checkpoint.restype = ctypes.c_int
+        lib.habp_finish.restype = None
+        lib.habp_info.argtypes = [ctypes.POINTER(ctypes.c_int)]
+        lib.habp_info.restype = None
+        lib.habp_dt.restype = ctypes.c_double
+        lib.habp_field.restype = ctypes.c_void_p
+        lib.habp_particles.argtypes = [ctypes.c_char_p]
+        lib.habp_particles.restype = ctypes.c_void_p
+        _lib = lib
+    return _lib
+
+
+def _view(address, dtype, shape):
+    """numpy array over the memory at address (no copy)."""
+    size = int(np.prod(shape)) * dtype.itemsize
+    buf = (ctypes.c_char * size).from_address(address)
+    return np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+
+class Simulation:
+    """One simulation in directory, with the parameters of input_creator
+    updated by overrides (None: the parameters.in already there)."""
+
+    _running = None
+
+    def __init__(self, directory=".", overrides=None):
+        if Simulation._running is not None:
+            raise RuntimeError("a simulation is already running: close() it first")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        text = "" if overrides is None else parameters_text(overrides)
+        self._lib = _load()
+        if self._lib.habp_init(str(self.directory).encode(), text.encode()) != 0:
+            raise RuntimeError(f"could not start the simulation in {self.directory}")
+        Simulation._running = self
+        info = self._info()
+        self.Lx, self.Ly, self.ng, self.Np = info[1], info[2], info[3], info[5]
+        self.total_steps = info[7]
+        self.dt = self._lib.habp_dt()
+        self.dtype = np.dtype(np.float64 if info[6] == 8 else np.float32)
+
+        # psi(1-ng:Lx+ng, 1-ng:Ly+ng) of Fortran is [j, i] in numpy
+        ng = self.ng
+        self._psi = _view(self._lib.habp_field(), self.dtype,
+                          (self.Ly + 2 * ng, self.Lx + 2 * ng))
+        self._particles = {}
+        for name in REAL_ARRAYS + INT_ARRAYS:
+            address = self._lib.habp_particles(name.encode())
+            dtype = self.dtype if name in REAL_ARRAYS else np.dtype(np.int32)
+            self._particles[name] = _view(address, dtype, (self.Np,)) if address else \
+                np.zeros(0, dtype)
+
+    def _info(self):
+        info = (ctypes.c_int * 8)()
+        self._lib.habp_info(info)
+        return list(info)
+
+    def _check(self):
+        if Simulation._running is not self:
+            raise RuntimeError("the simulation has been closed")
+
+    @property
+    def t(self):
+        """Next step to take (the state is that after step t - 1)."""
+        self._check()
+        return self._info()[0]
+
+    @property
+    def time(self):
+        """Simulated time of the state."""
+        return (self.t - 1) * self.dt
+
+    @property
+    def psi(self):
+        """The field as a (Ly, Lx) view, psi[j, i]."""
+        self._check()
+        ng = self.ng
+        return self._psi[ng:ng + self.Ly, ng:ng + self.Lx]
+
+    @property
+    def particles(self):
+        """Views of the particle arrays (x, y, phi, fx, fy, fx_pp, fy_pp,
+        ix, iy and id) over the particles in use."""
+        self._check()
+        n = self._info()[4]
+        return {name: a[:n] for name, a in self._particles.items()}
+
+    def unwrapped(self):
+        """Positions with the periodic images crossed, (n, 2), in the order
+        of the global index (a copy)."""
+        p = self.particles
+        xy = np.stack([p["x"] + p["ix"] * self.Lx, p["y"] + p["iy"] * self.Ly], axis=1)
+        out = np.empty_like(xy, dtype=np.float64)
+        out[p["id"] - 1] = xy
+        return out
+
+    def step(self, n=1):
+        """Advance n steps (beyond total_steps if asked to), writing the
+        output files that fall due. RuntimeError if a step fails (an
+        instability): the simulation then takes no further steps, and
+        close() writes no final output."""
+        self._check()
+        if self._lib.habp_step(int(n)) != 0:
+            raise RuntimeError(f"step {self.t} of the simulation in {self.directory} failed")
+
+    def checkpoint(self):
+        """Write checkpoint.bin of the current state (RuntimeError after a
+        failed step)."""
+        self._check()
+        if self._lib.habp_checkpoint() != 0:
+            raise RuntimeError("no checkpoint after a failed step")
+
+    def close(self):
+        """Final output (snapshot, statistics, checkpoint) and release of
+        the arrays: the views must not be used afterwards."""
+        if Simulation._running is self:
+            self._lib.habp_finish()
+            Simulation._running = None
+            self._psi = None
+            self._particles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
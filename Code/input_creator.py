@@ -5,6 +5,14 @@ def write_parameters_file(target_dir, overrides=None):
     """
     Writes parameters.in using a default dictionary updated by 'overrides'.
     """
+    with open(os.path.join(target_dir, "parameters.in"), 'w') as f:
+        f.write(parameters_text(overrides))
+
+
+def parameters_text(overrides=None):
+    """
+    The text of parameters.in for the defaults updated by 'overrides'.
+    """
     # 1. Master Dictionary of Defaults
     p = {
         'Lx': 128, 'Ly': 128,
@@ -18,7 +26,26 @@ def write_parameters_file(target_dir, overrides=None):
         'gamma_T': 1.0,
         'Pe': 10.0,
         'phip': 0.2,
-        'init_custom': "true" 
+        'init_custom': "true",
+        'nthreads': 0,
+        'field_solver': 'fd',   # 'fd' (explicit Euler) or 'spectral' (semi-implicit FFT)
+        'spectral_A': None,     # stabilisation of the spectral step (None: 2*tau)
+        'verlet_skin': 1.5,     # skin of the pp Verlet list (0: cell list every step)
+        'sort_interval': 100,   # steps between spatial sorts of the particles (0: never)
+        'coupling_table': 4096, # bins of the tabulated coupling kernel (0: exact exp)
+        'rng_seed': 0,          # seed of the random numbers (0: from the clock)
+        'adapt_drift': 0.0,     # adaptive dt: max particle drift per step / diam (0: no limit)
+        'adapt_dpsi': 0.0,      # adaptive dt: max change of psi per step (0: no limit)
+        'output_format': 'txt', # snapshots: 'txt' (columns), 'bin' (binary, see snapshot_io.py) or 'packed' (lossy)
+        'io_queue': 0,          # files written in the background at once (0: synchronous output)
+        'checkpoint_keep': 2,   # checkpoint.bin and its earlier versions checkpoint.bin.1, ... kept
+        'packed_bits': 12,      # bits per value of psi in 'packed' snapshots (error <= range/(2^bits-1)/2)
+        'droplet_threshold': 0.0,    # droplets.dat: clusters of psi below this value
+        'droplet_histogram': False,  # droplets.dat: add the number of droplets per size class
+        'transport_interval': 0,     # msd.dat: steps between samples of the particles (0: off)
+        'structure_interval': 0,     # structure_factor.dat: steps between S(k) (0: off; a multiple of the stats interval)
+        'droplet_interval': 0,       # droplets.dat: steps between droplet statistics (0: off; a multiple of the stats interval)
+        'topology_interval': 0       # topology.dat: steps between Euler characteristics (0: off; a multiple of the stats interval)
     }
 
     # 2. Update with whatever the Sweeper wants to change
@@ -46,6 +73,9 @@ def write_parameters_file(target_dir, overrides=None):
     dt = tref * p['dt_reduced']
     total_steps = int(p['t_total'] * tBM / dt)
 
+    # Linear stabilisation of the semi-implicit spectral step
+    spectral_A = 2.0 * p['tau'] if p['spectral_A'] is None else p['spectral_A']
+
     # Noise strengtg 
     noise = np.sqrt( 0.25*p['M'] * p['temperature'] )
 
@@ -66,13 +96,27 @@ def write_parameters_file(target_dir, overrides=None):
         (f"{p['gamma_T']:.6f} {gamma_R:.6f}", "Gammas"),
         (f"{vact}", "vact"),
         (f"{noise}", "noise strength"),
-        (f"{p['init_custom']}", "custom initial condition")
+        (f"{p['init_custom']}", "custom initial condition"),
+        (f"{p['nthreads']}", "OpenMP threads (0 = OMP_NUM_THREADS)"),
+        (f"{p['field_solver']}", "field solver (fd | spectral)"),
+        (f"{spectral_A}", "spectral stabilisation A"),
+        (f"{p['verlet_skin']}", "Verlet skin (0 = cell list every step)"),
+        (f"{p['sort_interval']}", "particle sort interval (0 = never)"),
+        (f"{p['coupling_table']}", "coupling kernel table bins (0 = analytic)"),
+        (f"{p['rng_seed']}", "random seed (0 = from the clock)"),
+        (f"{p['adapt_drift']} {p['adapt_dpsi']}", "adaptive dt: max drift/diam, max dpsi (0 0 = fixed dt)"),
+        (f"{p['output_format']}", "snapshot format (txt | bin | packed)"),
+        (f"{p['io_queue']}", "asynchronous IO queue (0 = synchronous writes)"),
+        (f"{p['checkpoint_keep']}", "checkpoints kept (>= 1)"),
+        (f"{p['packed_bits']}", "bits of psi in packed snapshots (1..24)"),
+        (f"{p['droplet_threshold']} {str(p['droplet_histogram']).lower()}", "droplets: psi threshold, size histogram"),
+        (f"{p['transport_interval']}", "transport statistics sampling interval (0 = off)"),
+        (f"{p['structure_interval']}", "structure factor interval (0 = off)"),
+        (f"{p['droplet_interval']}", "droplet statistics interval (0 = off)"),
+        (f"{p['topology_interval']}", "topology interval (0 = off)")
     ]
 
-    # Write to target folder
-    with open(os.path.join(target_dir, "parameters.in"), 'w') as f:
-        for val, comment in data:
-            f.write(f"{val:<25} ! {comment}\n")
+    return "".join(f"{val:<25} ! {comment}\n" for val, comment in data)
 
 if __name__ == "__main__":
     # This runs ONLY when you type 'python input_creator.py'
@@ -1,171 +1,133 @@
 program main
   use mod_core_types
-  use mod_field      ! Pure field thermodynamics and kinetics
-  use mod_coupling   ! The specific interaction logic you provided
-  use mod_particles  ! Pure particle repulsion and integration
   use mod_io         ! Parameters and output
+  use mod_parallel   ! Domain decomposition (serial or MPI)
+  use mod_timers     ! Wall-clock time per phase
+  use mod_async_io   ! Output files written while stepping goes on
+  use mod_simulation ! The simulations and their time steps
+  !$ use omp_lib
   implicit none
 
-  ! Data structures
-  type(Config_t)                    :: cfg
-  type(Particle_t), allocatable     :: particles(:)
-  real, allocatable, dimension(:,:) :: psi, mu_total
-  ! Pre-allocated noise buffers
-  real, allocatable :: csi1(:,:)
-  real, allocatable :: csi2(:,:)
-  type(Energy_t)                    :: curr_energy
-  integer                           :: t
-  real                              :: psieq
-
-  ! CPU time variables 
+  ! Batches: run as
+  !     ./simulation.exe SIM_0_0 SIM_0_1 ...
+  ! the program advances one simulation per directory given (each with its
+  ! own parameters.in, and writing its output files there) in lockstep,
+  ! the OpenMP threads taking one simulation each per step. Without
+  ! arguments it runs the single simulation of the current directory, the
+  ! threads then sharing the work of each kernel. The simulations of a
+  ! batch share the lattice size and the coupling kernel (and, with the
+  ! spectral solver, the fixed dt and the parameters of the linear step),
+  ! whose tables are built once; everything else may differ.
+
+  integer :: r
+  character(len=256) :: arg
+
+  ! CPU time variables
   real :: t1,t2
-
-  ! restart variables 
-  logical :: restart_found,equilibrated_found
-  integer :: start_t
+  ! Wall-clock time (cpu_time adds up all threads once OpenMP is active)
+  integer(kind=8) :: wc1, wc2, wc_rate
+  integer(kind=8) :: loop1, loop2              ! around the time loop
+  integer :: nthreads_used
 
   ! time code starts
+  call par_init()
   call cpu_time(t1)
+  call system_clock(wc1, wc_rate)
 
   ! 1. SETUP
-  ! load_parameters now populates Reff_2 and R0_2 for efficiency
-  call load_parameters(cfg)
-
-  ! conversions 
-  psieq = sqrt( cfg%tau  / cfg%u )
-  print*, 'Equilibirum psi=',psieq
-
-  print*, 'affinity before scaling = ',cfg%affinity
-  cfg%affinity = cfg%affinity * psieq
-  print*, 'affinity after scaling = ',cfg%affinity
-
-
-  allocate(particles(cfg%Np))
-  allocate(psi(cfg%Lx, cfg%Ly), mu_total(cfg%Lx, cfg%Ly))
-  allocate(csi1(cfg%Lx, cfg%Ly),csi2(cfg%Lx, cfg%Ly))
-  
-  ! Initialize field noise and random particle positions
-  ! CHECK FOR RESTART
-  inquire(file='checkpoint.bin', exist=restart_found)
-
-  ! CHECK FOR START FROM EQUILIBRATION
-  inquire( file = 'equilibrated.bin' , exist=equilibrated_found)
-
-  if (restart_found) then
-      print *, ">>> RESTART FILE DETECTED. Loading state..."
-      call load_checkpoint('checkpoint.bin', t, psi, particles)
-      start_t = t + 1
-  elseif (equilibrated_found) then 
-      print *, ">>> EQUILIBRATED FILE DETECTED. Loading state..."
-      call load_checkpoint('equilibrated.bin', t, psi, particles)
-      start_t = 1
-  else
-      print *, ">>> No restart file. Initializing new system."
-      if (cfg%custom_init) then
-        print*, 'initialising with a custom-defined state'
-        print*, 'by default: sinusoidal spanning whole system'
-        print*, 'to modify initial custom state: ``initialize_custom_system.f90``'
-        print*, '' 
-        call initialize_custom_system(particles, psi, cfg)        
-      else
-        print*, 'initialise completely random state'
-        call initialize_system(particles, psi, cfg)
-      endif 
-      start_t = 1
+  ! one simulation per directory given on the command line, or the one of
+  ! the current directory
+  nrep = max(1, command_argument_count())
+  allocate(rep(nrep))
+  do r = 1, nrep
+    ! load_parameters now populates Reff_2 and R0_2 for efficiency
+    if (command_argument_count() == 0) then
+      call load_parameters(rep(r)%cfg)
+    else
+      call get_command_argument(r, arg)
+      call load_parameters(rep(r)%cfg, trim(arg)//'/')
+    end if
+    ! slab of the lattice owned by this process (the whole lattice if serial)
+    call par_decompose(rep(r)%cfg)
+  end do
+  if (nranks > 1 .and. nrep > 1) then
+    if (rank == 0) print*, 'batches of simulations are not available with MPI'
+    call par_abort(1)
+  end if
+  if (nranks > 1 .and. rep(1)%cfg%field_solver == 'spectral') then
+    if (rank == 0) print*, 'the spectral field solver is not available with MPI, use fd'
+    call par_abort(1)
+  end if
+  call check_batch()
+
+  ! threads for the OpenMP field kernels (or for the simulations of a batch)
+  nthreads_used = 1
+  !$ if (rep(1)%cfg%nthreads > 0) call omp_set_num_threads(rep(1)%cfg%nthreads)
+  !$ nthreads_used = omp_get_max_threads()
+  if (rank == 0) then
+    print*, 'MPI ranks =', nranks
+    print*, 'OpenMP threads =', nthreads_used
+    if (nrep > 1) print*, 'simulations in the batch =', nrep
   end if
 
-  ! Print Header to Screen
-  print *, "----------------------------------------------"
-  print *, "Simulation Started"
-  print "(A, I4, A, I4)", " Grid Size: ", cfg%Lx, " x ", cfg%Ly
-  print "(A, I6)",         " Particles: ", cfg%Np
-  print "(A, I10)",        " Total Steps: ", cfg%total_steps
-  print *, "----------------------------------------------"
-  print *, "Additional parameters" 
-  print*, "particle surface fraction ", &
-            cfg%Np * pi * cfg%R0**2 / ( cfg%Lx* cfg%Ly )
-  print*, "Pe ", cfg%vact / ( cfg%diam * cfg%temperature / cfg%gamm_R )
-
-
-  print *, "----------------------------------------------"  
-  t = start_t
-  print*, 'do a <<dry>> run at t=',t, 'to calculate properties' 
-  call calculate_mu_pure(mu_total, psi, cfg, curr_energy%field)
-  call compute_pp_forces(particles, cfg, curr_energy%pp)
-  call coupling(mu_total, psi, particles, cfg, curr_energy%coupling)
-
-  print*, 'save initial state'
-  call write_stats(t, psi, particles, cfg, curr_energy)
-  call write_data(psi, particles, t)
-  ! Print status to screen
-  print "(A, I10, A, F6.2, A)", " >> Step: ", t, &
-        " (", (real(t)/real(cfg%total_steps))*100.0, "%) - Data Saved."
-
-  ! 2. HYBRID TIME-STEPPING (Explicit Euler-Scheme)
-  do t = start_t, cfg%total_steps
-    
-    ! A. Thermodynamics: Field & Interaction
-    ! 1. Pure Field Chemical Potential (Cahn-Hilliard bulk + surface)
-    call calculate_mu_pure(mu_total, psi, cfg, curr_energy%field)
-    
-    ! 2. Coupling (Your specific logic: psic bump, dpsi, and integrated forces)
-    ! This updates mu_total and fills particles(:)%fx and %fy
-    if ( cfg%sigma>0.0 ) call coupling(mu_total, psi, particles, cfg, curr_energy%coupling)
-
-    ! B. Field Kinetics: Diffusion Step (Model B)
-    ! d_psi/dt = M * Laplacian(mu_total)
-    call evolve_field_model_b(psi, mu_total, cfg)
-
-    if ( cfg%noiseStrength > 0.0) call noise(psi, cfg,csi1,csi2)
-
-    ! C. Particle Kinetics: Repulsion & Motion
-    ! 1. Pure Particle-Particle Repulsion (using hard-core R0)
-    call compute_pp_forces(particles, cfg, curr_energy%pp)
-    
-    ! 2. Integrate Brownian Motion (Langevin / Euler-Maruyama)
-    ! Uses combined forces: F_total = F_coupling + F_repulsion
-    call integrate_particles(particles, cfg)
-
-    ! D. I/O and Standard Output
-    if (mod(t, cfg%save_interval) == 0) then
-        ! Print status to screen
-        print "(A, I10, A, F6.2, A)", " >> Step: ", t, &
-              " (", (real(t)/real(cfg%total_steps))*100.0, "%) - Data Saved."
-        
-        call write_data(psi, particles, t)
-    end if
+  ! asynchronous output (the queue of the first simulation serves the batch)
+  call async_io_init(rep(1)%cfg%io_queue)
 
-    ! Statistical Saving (Summary file)
-    if (mod(t, cfg%stats_interval) == 0) then
-      call write_stats(t, psi, particles, cfg, curr_energy)
-    endif
+  call alloc_fields()
 
-    ! PERIODIC CHECKPOINT (e.g., every save_interval)
-    if (mod(t, cfg%save_interval) == 0) then
-        call save_checkpoint('checkpoint.bin', t, psi, particles)
-    end if
-    
+  do r = 1, nrep
+    call start_replica(r)
   end do
 
-  ! save final state 
-  print*, "saving final state at t=",t
-  print*, 'saving state at *.txt'
-  call write_data(psi, particles, t)
-  print*, 'saving stats at *.dat'
-  call write_stats(t, psi, particles, cfg, curr_energy)
-  print*, 'saving checkpoint.bin in binary file for possible restart'
-  call save_checkpoint('checkpoint.bin', t, psi, particles)
+  ! 2. HYBRID TIME-STEPPING (Explicit Euler-Scheme)
+  call system_clock(loop1)
+  if (nrep == 1) then
+    do while (rep(1)%t <= rep(1)%cfg%total_steps)
+      call step_replica(1)
+    end do
+  else
+    do while (any(rep%t <= rep%cfg%total_steps))
+      !$omp parallel do schedule(dynamic)
+      do r = 1, nrep
+        ! one thread per simulation: the kernels run serially inside
+        !$ call omp_set_num_threads(1)
+        if (rep(r)%t <= rep(r)%cfg%total_steps) call step_replica(r)
+      end do
+      !$omp end parallel do
+    end do
+  end if
+  call system_clock(loop2)
+
+  do r = 1, nrep
+    call finish_replica(r)
+  end do
+  call async_io_flush()
+  do r = 1, nrep
+    ! (in a batch, wall_seconds is the time of the whole batch)
+    call write_timings(trim(rep(r)%cfg%dir)//'timings.json', rep(r)%timers, rep(r)%cfg, &
+                       rep(r)%steps_run, merge(rep(r)%n_substeps, int(rep(r)%steps_run, 8), &
+                       rep(r)%adaptive), real(loop2 - loop1) / real(wc_rate), nthreads_used)
+  end do
 
   ! 3. CLEANUP
-  deallocate(psi, mu_total, particles)
+  call free_fields()
 
-  ! performance information 
+  ! performance information
   call cpu_time(t2)
-  open(unit=10, file='performance.txt', status='replace')
-  write(10,*) 'CPU_Time_Seconds:', t2 - t1
-  close(10)
+  call system_clock(wc2)
+  if (rank == 0) then
+    open(unit=10, file='performance.txt', status='replace')
+    write(10,*) 'CPU_Time_Seconds:', t2 - t1
+    write(10,*) 'Wall_Time_Seconds:', real(wc2 - wc1) / real(wc_rate)
+    write(10,*) 'Threads:', nthreads_used
+    write(10,*) 'Ranks:', nranks
+    if (nrep > 1) write(10,*) 'Simulations:', nrep
+    close(10)
+
+    ! closing message
+    print*, "program finishes normally"
+  end if
 
-  ! closing message
-  print*, "program finishes normally"
+  call par_finalize()
 
 end program main
@@ -0,0 +1,188 @@
+module mod_async_io
+  ! Asynchronous output. Every output file is handed over as blocks of bytes
+  ! at file offsets (as for par_write_blocks); with a queue of depth > 0 the
+  ! blocks are copied into the image of the file in a staging slot, and the
+  ! slot is written by an asynchronous unit (Fortran asynchronous I/O,
+  ! performed by a thread of the runtime library) while the time stepping
+  ! goes on. At most depth files are in flight: the oldest is waited for
+  ! before its slot is reused, which bounds the memory held by the queue.
+  ! A file still in flight is waited for before it is written again (e.g.
+  ! checkpoint.bin), and async_io_flush waits for all of them.
+  ! With MPI, or depth 0, the blocks go straight to par_write_blocks.
+  !
+  ! A file may be written under a temporary name and committed once
+  ! complete (see commit_file): it then replaces its final name by an
+  ! atomic rename, keeping earlier versions as name.1, name.2, ...
+  use, intrinsic :: iso_c_binding, only: c_int, c_char, c_null_char
+  use mod_parallel
+  implicit none
+  private
+  public :: async_io_init, async_write_blocks, async_io_flush, async_io_depth, rotated_name
+
+  type :: Slot_t
+    integer :: unit = -1                       ! -1 = free
+    character(len=320) :: filename = ''
+    character(len=1), allocatable :: bytes(:)  ! image of the whole file
+    character(len=320) :: commit_to = ''       ! final name ('' = none)
+    integer :: keep = 1
+  end type Slot_t
+
+  ! rename(2) of the C library, atomic within a filesystem
+  interface
+    integer(c_int) function c_rename(old, new) bind(C, name='rename')
+      import :: c_int, c_char
+      character(kind=c_char), intent(in) :: old(*), new(*)
+    end function c_rename
+  end interface
+
+  type(Slot_t), allocatable, save, asynchronous :: slots(:)
+  integer, save :: depth = 0
+  integer, save :: oldest = 1, pending = 0      ! ring of pending slots
+
+contains
+
+  ! Queue of depth files in flight (0 = synchronous writes)
+  subroutine async_io_init(queue_depth)
+    integer, intent(in) :: queue_depth
+
+    depth = 0
+    if (queue_depth <= 0) return
+    if (nranks > 1) then
+      if (rank == 0) print *, "asynchronous IO is not available with MPI, writing synchronously"
+      return
+    end if
+    depth = queue_depth
+    allocate(slots(depth))
+    oldest = 1
+    pending = 0
+  end subroutine async_io_init
+
+  integer function async_io_depth()
+    async_io_depth = depth
+  end function async_io_depth
+
+  ! Write blocks of bytes at the given 0-based offsets of filename,
+  ! replacing it (see par_write_blocks); returns before the data reach the
+  ! file when the queue is active. With commit_to, the complete file is
+  ! then renamed to commit_to, keeping keep versions of it (see commit_file).
+  subroutine async_write_blocks(filename, bytes, offsets, lengths, commit_to, keep)
+    character(len=*), intent(in) :: filename
+    character(len=1), intent(in) :: bytes(:)
+    integer(kind=8),  intent(in) :: offsets(:)
+    integer,          intent(in) :: lengths(:)
+    character(len=*), intent(in), optional :: commit_to
+    integer,          intent(in), optional :: keep
+    integer(kind=8) :: fsize, pos
+    integer :: b, k, s
+
+    if (depth == 0) then
+      call par_write_blocks(filename, bytes, offsets, lengths)
+      if (present(commit_to)) call commit_file(filename, commit_to, keep)
+      return
+    end if
+
+    ! (the simulations of a batch share the queue)
+    !$omp critical (async_io)
+    ! the file may not be open twice: wait for an earlier write of it
+    do k = 0, pending - 1
+      if (slots(1 + mod(oldest - 1 + k, depth))%filename == filename) then
+        do b = 0, k
+          call retire_oldest()
+        end do
+        exit
+      end if
+    end do
+    if (pending == depth) call retire_oldest()
+    s = 1 + mod(oldest - 1 + pending, depth)
+    pending = pending + 1
+
+    associate (slot => slots(s))
+      ! image of the file: the blocks at their offsets
+      fsize = 0
+      do b = 1, size(offsets)
+        if (lengths(b) > 0) fsize = max(fsize, offsets(b) + lengths(b))
+      end do
+      if (allocated(slot%bytes)) then
+        if (size(slot%bytes, kind=8) /= fsize) deallocate(slot%bytes)
+      end if
+      if (.not. allocated(slot%bytes)) allocate(slot%bytes(fsize))
+      pos = 1
+      do b = 1, size(offsets)
+        slot%bytes(offsets(b)+1:offsets(b)+lengths(b)) = bytes(pos:pos+lengths(b)-1)
+        pos = pos + lengths(b)
+      end do
+
+      slot%filename = filename
+      slot%commit_to = ''
+      if (present(commit_to)) then
+        slot%commit_to = commit_to
+        slot%keep = keep
+      end if
+      open(newunit=slot%unit, file=filename, access='stream', form='unformatted', &
+           status='replace', asynchronous='yes')
+      write(slot%unit, asynchronous='yes') slot%bytes
+    end associate
+    !$omp end critical (async_io)
+  end subroutine async_write_blocks
+
+  ! Wait for all files in flight
+  subroutine async_io_flush()
+
+    !$omp critical (async_io)
+    do while (pending > 0)
+      call retire_oldest()
+    end do
+    !$omp end critical (async_io)
+  end subroutine async_io_flush
+
+  ! Wait for the oldest file in flight and free its slot
+  subroutine retire_oldest()
+
+    associate (slot => slots(oldest))
+      wait(slot%unit)
+      close(slot%unit)
+      if (slot%commit_to /= '') call commit_file(trim(slot%filename), trim(slot%commit_to), slot%keep)
+      slot%unit = -1
+      slot%filename = ''
+    end associate
+    oldest = 1 + mod(oldest, depth)
+    pending = pending - 1
+  end subroutine retire_oldest
+
+  ! Version k of a rotated file: name itself for k = 0, else name.k
+  function rotated_name(name, k) result(s)
+    character(len=*), intent(in) :: name
+    integer,          intent(in) :: k
+    character(len=:), allocatable :: s
+    character(len=12) :: suffix
+
+    s = name
+    if (k > 0) then
+      write(suffix, '(I0)') k
+      s = name // '.' // trim(suffix)
+    end if
+  end function rotated_name
+
+  ! Make the complete file tmpname the current version of name: the
+  ! versions name.k move to name.k+1 (the oldest of keep being dropped),
+  ! name to name.1, then tmpname is renamed to name. Every step is a
+  ! rename, so name is never a partly written file; if the process dies
+  ! halfway through, the newest complete version is still among name,
+  ! name.1, ... (by the first process only)
+  subroutine commit_file(tmpname, name, keep)
+    character(len=*), intent(in) :: tmpname, name
+    integer,          intent(in) :: keep
+    integer :: k, ierr
+
+    if (rank /= 0) return
+    do k = keep - 1, 1, -1
+      ! (a version that does not exist yet is simply not moved)
+      ierr = c_rename(rotated_name(name, k - 1) // c_null_char, &
+                      rotated_name(name, k) // c_null_char)
+    end do
+    if (c_rename(tmpname // c_null_char, name // c_null_char) /= 0) then
+      print *, "could not rename ", trim(tmpname), " to ", trim(name)
+    end if
+  end subroutine commit_file
+
+end module mod_async_io
@@ -0,0 +1,231 @@
+module mod_capi
+  ! C interface to one simulation, for the Python bindings (habp.py, which
+  ! loads the shared library built by `make lib`). The simulation is that
+  ! of mod_simulation, set up from the text of a parameters.in (or the file
+  ! in its directory) and writing its output files there, as simulation.exe
+  ! would; the caller advances it by any number of steps at a time, and
+  ! reads or changes the field and the particle arrays in place between the
+  ! calls.
+  !
+  !   habp_init(dir, text)  parameters (text: the lines of a parameters.in,
+  !                         '' = dir/parameters.in), initial (or restart)
+  !                         state; 0 = ok, 1 = not started (invalid
+  !                         parameters, no usable checkpoint, ...: the
+  !                         reason is printed)
+  !   habp_step(n)          n steps, with the output they are due; 0 = ok,
+  !                         1 = failed (an instability: the reason is
+  !                         printed, and the simulation takes no further
+  !                         steps and writes no further output)
+  !   habp_checkpoint()     checkpoint.bin of the current state; 0 = ok,
+  !                         1 = not written (after a failed step)
+  !   habp_finish()         final output (snapshot, stats, checkpoint;
+  !                         none after a failed step)
+  !   habp_info(info)       next step, Lx, Ly, ghost layers, particles in
+  !                         use, Np, bytes per real, total_steps
+  !   habp_dt()             time step
+  !   habp_field()          address of psi(1-ng:Lx+ng, 1-ng:Ly+ng)
+  !   habp_particles(name)  address of the particle array name: x, y, phi,
+  !                         fx, fy, fx_pp, fy_pp (reals), ix, iy, id
+  !                         (integers); entries 1..n are in use
+  !
+  ! The arrays stay at the same address until habp_finish. Only one
+  ! simulation runs at a time, serially (no MPI) but with the OpenMP
+  ! threads of parameters.in; later ones must be on the same lattice, as the
+  ! FFT plans and kernel tables are kept.
+  use, intrinsic :: iso_c_binding
+  use mod_core_types
+  use mod_parallel
+  use mod_io
+  use mod_timers
+  use mod_async_io
+  use mod_checkpoint
+  use mod_simulation
+  !$ use omp_lib
+  implicit none
+  private
+  public :: habp_init, habp_step, habp_checkpoint, habp_finish, habp_info, habp_dt, &
+            habp_field, habp_particles
+
+  integer, save :: lattice(2) = 0              ! of the first simulation
+  integer(kind=8), save :: wall_ticks = 0      ! spent in habp_step
+  logical, save :: step_failed = .false.       ! a step of the simulation failed
+
+contains
+
+  integer(c_int) function habp_init(dir, text) bind(C, name='habp_init')
+    character(kind=c_char), intent(in) :: dir(*), text(*)
+    character(len=:), allocatable :: d, t
+    logical :: ok
+
+    habp_init = 1
+    if (allocated(rep)) then
+      print *, "a simulation is already running: finish it first"
+      return
+    end if
+    d = f_string(dir)
+    if (d /= '' .and. d(len(d):) /= '/') d = d // '/'
+    t = f_string(text)
+
+    call par_init()
+    nrep = 1
+    allocate(rep(1))
+    if (t == '') then
+      call load_parameters(rep(1)%cfg, d, ok)
+    else
+      call load_parameters_text(rep(1)%cfg, t, d, ok)
+    end if
+    if (.not. ok) then
+      deallocate(rep)
+      return
+    end if
+    call par_decompose(rep(1)%cfg)
+    if (lattice(1) > 0 .and. any(lattice /= [rep(1)%cfg%Lx, rep(1)%cfg%Ly])) then
+      print "(A, I0, A, I0)", " the simulations of a process must share the lattice ", &
+            lattice(1), " x ", lattice(2)
+      deallocate(rep)
+      return
+    end if
+    lattice = [rep(1)%cfg%Lx, rep(1)%cfg%Ly]
+    !$ if (rep(1)%cfg%nthreads > 0) call omp_set_num_threads(rep(1)%cfg%nthreads)
+    call async_io_init(rep(1)%cfg%io_queue)
+    call alloc_fields()
+    call start_replica(1, ok)
+    if (.not. ok) then
+      call free_fields()
+      deallocate(rep)
+      return
+    end if
+    wall_ticks = 0
+    step_failed = .false.
+    habp_init = 0
+  end function habp_init
+
+  ! n steps, whatever total_steps is (psi may have been changed in place:
+  ! its ghost layers are refreshed first)
+  integer(c_int) function habp_step(n) bind(C, name='habp_step')
+    integer(c_int), value :: n
+    integer(kind=8) :: c0, c1
+    integer :: k
+    logical :: ok
+
+    habp_step = 1
+    if (.not. allocated(rep) .or. step_failed) return
+    call system_clock(c0)
+    call halo_exchange(psi(:,:,1), rep(1)%cfg)
+    ok = .true.
+    do k = 1, n
+      call step_replica(1, ok)
+      if (.not. ok) exit
+    end do
+    call system_clock(c1)
+    wall_ticks = wall_ticks + (c1 - c0)
+    step_failed = .not. ok
+    if (ok) habp_step = 0
+  end function habp_step
+
+  ! checkpoint.bin of the state after the last step, written before this
+  ! returns
+  integer(c_int) function habp_checkpoint() bind(C, name='habp_checkpoint')
+
+    habp_checkpoint = 1
+    if (.not. allocated(rep) .or. step_failed) return
+    associate (cfg => rep(1)%cfg)
+    call save_checkpoint(trim(cfg%dir)//'checkpoint.bin', rep(1)%t - 1, psi(:,:,1), &
+                         rep(1)%particles, cfg, rep(1)%transport)
+    end associate
+    call async_io_flush()
+    habp_checkpoint = 0
+  end function habp_checkpoint
+
+  ! Final output, as at the end of the program, and release of the arrays
+  ! (after a failed step only the release: the state is half a step)
+  subroutine habp_finish() bind(C, name='habp_finish')
+    integer(kind=8) :: rate
+    integer :: nthreads_used
+
+    if (.not. allocated(rep)) return
+    if (.not. step_failed) call finish_replica(1)
+    call async_io_flush()
+    nthreads_used = 1
+    !$ nthreads_used = omp_get_max_threads()
+    call system_clock(count_rate=rate)
+    associate (r => rep(1))
+    call write_timings(trim(r%cfg%dir)//'timings.json', r%timers, r%cfg, r%steps_run, &
+                       merge(r%n_substeps, int(r%steps_run, 8), r%adaptive), &
+                       real(wall_ticks) / real(rate), nthreads_used)
+    end associate
+    call free_fields()
+    deallocate(rep)
+  end subroutine habp_finish
+
+  subroutine habp_info(info) bind(C, name='habp_info')
+    integer(c_int), intent(out) :: info(8)
+
+    info = 0
+    if (.not. allocated(rep)) return
+    associate (cfg => rep(1)%cfg)
+    info = [rep(1)%t, cfg%Lx, cfg%Ly, cfg%ng, rep(1)%particles%n, cfg%Np, WP_BYTES, &
+            cfg%total_steps]
+    end associate
+  end subroutine habp_info
+
+  real(c_double) function habp_dt() bind(C, name='habp_dt')
+
+    habp_dt = 0.0_c_double
+    if (allocated(rep)) habp_dt = real(rep(1)%cfg%dt, c_double)
+  end function habp_dt
+
+  type(c_ptr) function habp_field() bind(C, name='habp_field')
+
+    habp_field = c_null_ptr
+    if (allocated(rep)) habp_field = c_loc(psi(lbound(psi, 1), lbound(psi, 2), 1))
+  end function habp_field
+
+  ! (c_null_ptr for an unknown name)
+  type(c_ptr) function habp_particles(name) bind(C, name='habp_particles')
+    character(kind=c_char), intent(in) :: name(*)
+    character(len=8) :: s
+    integer :: k
+
+    habp_particles = c_null_ptr
+    if (.not. allocated(rep)) return
+    if (size(rep(1)%particles%x) == 0) return
+    s = ''
+    k = 1
+    do while (name(k) /= c_null_char .and. k <= len(s))
+      s(k:k) = name(k)
+      k = k + 1
+    end do
+    associate (p => rep(1)%particles)
+    select case (s)
+    case ('x');     habp_particles = c_loc(p%x(1))
+    case ('y');     habp_particles = c_loc(p%y(1))
+    case ('phi');   habp_particles = c_loc(p%phi(1))
+    case ('fx');    habp_particles = c_loc(p%fx(1))
+    case ('fy');    habp_particles = c_loc(p%fy(1))
+    case ('fx_pp'); habp_particles = c_loc(p%fx_pp(1))
+    case ('fy_pp'); habp_particles = c_loc(p%fy_pp(1))
+    case ('ix');    habp_particles = c_loc(p%ix(1))
+    case ('iy');    habp_particles = c_loc(p%iy(1))
+    case ('id');    habp_particles = c_loc(p%id(1))
+    end select
+    end associate
+  end function habp_particles
+
+  ! Fortran copy of the C string s
+  function f_string(s) result(f)
+    character(kind=c_char), intent(in) :: s(*)
+    character(len=:), allocatable :: f
+    integer :: n, k
+
+    n = 0
+    do while (s(n+1) /= c_null_char)
+      n = n + 1
+    end do
+    allocate(character(len=n) :: f)
+    do k = 1, n
+      f(k:k) = s(k)
+    end do
+  end function f_string
+
+end module mod_capi
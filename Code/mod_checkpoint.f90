@@ -0,0 +1,487 @@
+module mod_checkpoint
+  ! Checkpoints: the whole state of a simulation, for restarts.
+  !
+  ! Layout (version 4): unformatted sequential records, each with 4-byte
+  ! record markers around it, as written by gfortran:
+  !   header     'HABPCKPT', 32-bit integers version, bytes per real, step,
+  !              Lx, Ly, Np, random seed and dt level, 64-bit reals dt, M,
+  !              kappa, tau, u, psimean, Reff and R0, and a 64-bit checksum
+  !              of the records below
+  !   psi(Lx,Ly)
+  !   particles(Np) as Particle_t records ordered by global index
+  !   transport statistics but for the levels (see transport_words in
+  !              mod_transport), empty if they are not collected
+  !   one record per level of the transport statistics, if collected:
+  !              origin(:,:,l) (64-bit reals) and hist(:,:,:,l) (32-bit
+  !              reals), TRANSPORT_LEVEL_BYTES per particle
+  ! With several MPI ranks the same file is written collectively, each rank
+  ! placing its rows and particles directly.
+  !
+  ! A checkpoint is written as name.tmp, which is then renamed to name,
+  ! the previous ones rotating to name.1, ..., name.(keep-1) (see
+  ! commit_file in mod_async_io): a run killed during the write never leaves
+  ! a damaged checkpoint behind. load_checkpoint rejects files that are
+  ! truncated, fail the checksum, or belong to another lattice or number of
+  ! particles, and a restart falls back to the previous version (see main).
+  ! Checkpoints of version 1 (t, psi and particles, followed by the seed,
+  ! the dt level and the bytes per real, without checksum) are still read;
+  ! their particles start at the image (0, 0).
+  use mod_core_types
+  use mod_parallel
+  use mod_async_io
+  use mod_transport
+  implicit none
+  private
+  public :: save_checkpoint, load_checkpoint
+
+  character(len=8), parameter :: CKPT_MAGIC = 'HABPCKPT'
+  integer, parameter :: CKPT_VERSION = 4
+  integer, parameter :: CKPT_HEADER = 112         ! bytes of the header record
+  integer, parameter :: NKEY = 8                  ! parameters in the header
+  character(len=8), parameter :: KEY_NAME(NKEY) = [character(len=8) :: &
+    'dt', 'M', 'kappa', 'tau', 'u', 'psimean', 'Reff', 'R0']
+  integer(kind=8), parameter :: MASK32 = 4294967295_8
+  integer(kind=8), parameter :: CK_MOD = 2147483647_8   ! 2**31 - 1
+
+contains
+
+  ! With transport, its statistics are saved as well
+  subroutine save_checkpoint(filename, t, psi, particles, cfg, transport)
+    character(len=*), intent(in) :: filename
+    integer, intent(in)          :: t
+    type(Config_t), intent(in)   :: cfg
+    real, intent(in)             :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(in) :: particles
+    type(Transport_t), intent(in), optional :: transport
+    character(len=1), allocatable :: bytes(:)
+    integer(kind=8),  allocatable :: offsets(:)
+    integer,          allocatable :: lengths(:)
+    type(Particle_t), allocatable :: ordered(:)
+    character(len=1) :: mold(1)
+    integer(kind=4)  :: wmold(1)
+    integer(kind=4), allocatable :: trw(:)
+    type(Particle_t) :: prec
+    integer(kind=8) :: rec2, rec3, rec4, field_bytes, part_bytes, tr_bytes, lev_bytes, a, b, k0
+    integer(kind=8) :: pos, off
+    integer :: p, n, nb, pbytes, nlev, nslot, l, s
+
+    pbytes = storage_size(prec) / 8
+    field_bytes = int(cfg%Lx, 8) * cfg%Ly * WP_BYTES
+    part_bytes  = int(cfg%Np, 8) * pbytes
+    ! (the transport statistics are held by the first process)
+    allocate(trw(0))
+    if (present(transport)) trw = transport_words(transport)
+    tr_bytes = 4 * size(trw, kind=8)
+    nlev = 0
+    nslot = 0
+    if (tr_bytes > 0) then
+      nlev = transport%nlev
+      nslot = size(transport%hist, 3)
+    end if
+    lev_bytes = int(cfg%Np, 8) * TRANSPORT_LEVEL_BYTES
+    if (max(field_bytes, part_bytes, tr_bytes, lev_bytes) > huge(1)) then
+      if (rank == 0) print *, "Checkpoint records above 2 GiB are not supported"
+      call par_abort(1)
+    end if
+    rec2 = CKPT_HEADER + 8          ! [4|header|4]
+    rec3 = rec2 + 8 + field_bytes   ! [4|psi|4]
+    rec4 = rec3 + 8 + part_bytes    ! [4|particles|4]
+    n = particles%n
+
+    ! the particles in index order, one block (serial), or one block per
+    ! particle placed by its global index (MPI)
+    allocate(ordered(merge(n, 0, nranks == 1)))
+    if (nranks == 1) then
+      do p = 1, n
+        ordered(particles%id(p)) = get_particle(particles, p)
+      end do
+    end if
+
+    ! checksum of psi and the particles, words counted from the start of psi
+    a = 0; b = 0
+    k0 = int(cfg%y0, 8) * cfg%Lx * WP_BYTES / 4
+    call checksum_add(transfer(psi(1:cfg%Lx, 1:cfg%ny), wmold), k0, a, b)
+    if (nranks == 1) then
+      call checksum_add(transfer(ordered, wmold), field_bytes / 4, a, b)
+    else
+      do p = 1, n
+        k0 = (field_bytes + int(particles%id(p) - 1, 8) * pbytes) / 4
+        call checksum_add(transfer(get_particle(particles, p), wmold), k0, a, b)
+      end do
+    end if
+    call checksum_add(trw, (field_bytes + part_bytes) / 4, a, b)
+    ! (the levels one sample at a time)
+    k0 = (field_bytes + part_bytes + tr_bytes) / 4
+    do l = 0, nlev - 1
+      call checksum_add(transfer(transport%origin(:,:,l), wmold), k0, a, b)
+      k0 = k0 + 6_8 * cfg%Np
+      do s = 0, nslot - 1
+        call checksum_add(transfer(transport%hist(:,:,s,l), wmold), k0, a, b)
+        k0 = k0 + 3_8 * cfg%Np
+      end do
+    end do
+    a = mod(par_sum(a), CK_MOD)
+    b = mod(par_sum(b), CK_MOD)
+
+    ! header blocks and transport statistics (rank 0 only), the owned
+    ! rows, the particles
+    allocate(offsets(n + 12 + nlev * (3 + nslot)))
+    allocate(lengths(size(offsets)))
+    allocate(bytes(CKPT_HEADER + 40 + int(cfg%Lx, 8) * cfg%ny * WP_BYTES + int(n, 8) * pbytes + &
+                   tr_bytes + nlev * (8 + lev_bytes)))
+    nb = 0
+    pos = 1
+    if (rank == 0) then
+      call add_block(0_8, transfer(CKPT_HEADER, mold))
+      call add_block(4_8, header_bytes(t, cfg, ior(ishft(b, 32), a)))
+      call add_block(4_8 + CKPT_HEADER, transfer(CKPT_HEADER, mold))
+      call add_block(rec2, transfer(int(field_bytes), mold))
+      call add_block(rec2 + 4 + field_bytes, transfer(int(field_bytes), mold))
+      call add_block(rec3, transfer(int(part_bytes), mold))
+      call add_block(rec3 + 4 + part_bytes, transfer(int(part_bytes), mold))
+      call add_block(rec4, transfer(int(tr_bytes), mold))
+      if (tr_bytes > 0) call add_block(rec4 + 4, transfer(trw, mold))
+      call add_block(rec4 + 4 + tr_bytes, transfer(int(tr_bytes), mold))
+      off = rec4 + 8 + tr_bytes
+      do l = 0, nlev - 1
+        call add_block(off, transfer(int(lev_bytes), mold))
+        call add_block(off + 4, transfer(transport%origin(:,:,l), mold))
+        do s = 0, nslot - 1
+          call add_block(off + 4 + cfg%Np * (24_8 + 12_8 * s), &
+                         transfer(transport%hist(:,:,s,l), mold))
+        end do
+        call add_block(off + 4 + lev_bytes, transfer(int(lev_bytes), mold))
+        off = off + 8 + lev_bytes
+      end do
+    end if
+    call add_block(rec2 + 4 + int(cfg%y0, 8) * cfg%Lx * WP_BYTES, &
+                   transfer(psi(1:cfg%Lx, 1:cfg%ny), mold))
+    if (nranks == 1) then
+      call add_block(rec3 + 4, transfer(ordered, mold))
+    else
+      do p = 1, n
+        prec = get_particle(particles, p)
+        call add_block(rec3 + 4 + int(particles%id(p) - 1, 8) * pbytes, transfer(prec, mold))
+      end do
+    end if
+
+    call async_write_blocks(trim(filename) // '.tmp', bytes(1:pos-1), offsets(1:nb), &
+                            lengths(1:nb), commit_to=filename, keep=cfg%checkpoint_keep)
+
+  contains
+
+    subroutine add_block(offset, data)
+      integer(kind=8),  intent(in) :: offset
+      character(len=1), intent(in) :: data(:)
+
+      nb = nb + 1
+      offsets(nb) = offset
+      lengths(nb) = size(data)
+      bytes(pos:pos+size(data)-1) = data
+      pos = pos + size(data)
+    end subroutine add_block
+
+  end subroutine save_checkpoint
+
+  ! Reads the whole state into psi (Lx x Ly) and particles (with room for
+  ! cfg%Np). ok is false, and the reason printed, if the file is damaged or
+  ! was written for another system. rng_seed and dt_level, if present,
+  ! receive those of the run. A checkpoint in the other precision is
+  ! converted to the working precision. transport, if present, receives the
+  ! transport statistics stored in the file (none if there are none).
+  subroutine load_checkpoint(filename, cfg, t, psi, particles, ok, rng_seed, dt_level, transport)
+    character(len=*), intent(in) :: filename
+    type(Config_t), intent(in)   :: cfg
+    integer, intent(out)         :: t
+    real, intent(out)            :: psi(:,:)
+    type(Particles_t), intent(inout) :: particles
+    logical, intent(out)         :: ok
+    integer, intent(inout), optional :: rng_seed, dt_level   ! kept if not in the file
+    type(Transport_t), intent(inout), optional :: transport
+    character(len=8) :: magic
+    character(len=120) :: why
+    integer(kind=4), allocatable :: words(:)
+    real(kind=8)    :: key(NKEY), key_now(NKEY)
+    integer(kind=8) :: fsize, field_bytes, part_bytes, tr_bytes, lev_bytes, checksum, a, b, rec3, rec4
+    integer :: iunit, ios, marker, hdr(8), fb, seed, level, k, nf, nint, nlev
+    logical :: tr_ok
+    type(Transport_t) :: tr_file
+
+    ok = .false.
+    why = ''
+    fb = WP_BYTES
+    nint = 0
+    tr_bytes = 0
+    nlev = 0
+    seed = 0
+    level = 0
+    if (present(rng_seed)) seed = rng_seed
+    if (present(dt_level)) level = dt_level
+    open(newunit=iunit, file=filename, access='stream', form='unformatted', &
+         status='old', action='read', iostat=ios)
+    if (ios /= 0) then
+      print *, "cannot open ", trim(filename)
+      return
+    end if
+    inquire(unit=iunit, size=fsize)
+
+    read(iunit, iostat=ios) marker
+    if (ios == 0 .and. marker == CKPT_HEADER) then
+      ! header, psi, particles, transport statistics and their levels
+      read(iunit, iostat=ios) magic, hdr, key, checksum
+      if (ios /= 0 .or. magic /= CKPT_MAGIC) then
+        why = 'not a checkpoint'
+      else if (hdr(1) > CKPT_VERSION) then
+        why = 'written by a newer version of the code'
+      else if (hdr(1) /= CKPT_VERSION) then
+        why = 'unknown version'
+      else
+        fb = hdr(2)
+        nint = 2
+        t = hdr(3)
+        seed = hdr(7)
+        level = hdr(8)
+        call check_system(hdr(4), hdr(5), hdr(6), fb)
+      end if
+      if (why == '') then
+        field_bytes = int(cfg%Lx, 8) * cfg%Ly * fb
+        part_bytes  = int(cfg%Np, 8) * (7 * fb + 4 * nint)
+        rec3 = 2 * 8 + CKPT_HEADER + field_bytes
+        rec4 = rec3 + 8 + part_bytes
+        lev_bytes = int(cfg%Np, 8) * TRANSPORT_LEVEL_BYTES
+        read(iunit, pos=rec4+1, iostat=ios) marker
+        if (ios == 0) tr_bytes = marker
+        if (ios /= 0 .or. marker < 0) tr_bytes = fsize      ! (reported below)
+        if (tr_bytes >= 8 .and. tr_bytes < fsize) then
+          ! the number of level records
+          read(iunit, pos=rec4+9, iostat=ios) nlev
+          if (ios /= 0 .or. nlev < 0) then
+            nlev = 0
+            tr_bytes = fsize                                 ! (reported below)
+          end if
+        end if
+        if (fsize /= rec4 + 8 + tr_bytes + nlev * (8 + lev_bytes)) then
+          why = 'truncated'
+        else
+          call read_payload(CKPT_HEADER + 8_8, rec3)
+        end if
+      end if
+      if (why == '') then
+        a = 0; b = 0
+        call checksum_add(words, 0_8, a, b)
+        if (tr_bytes > 0) then
+          if (present(transport)) then
+            call read_levels(transport)
+          else
+            call read_levels(tr_file)
+          end if
+        end if
+        if (why == '' .and. ior(ishft(b, 32), a) /= checksum) why = 'checksum mismatch'
+      end if
+      if (why == '') then
+        ! parameters of the run that changed since the checkpoint
+        key_now = key_params(cfg)
+        do k = 1, NKEY
+          if (abs(key(k) - key_now(k)) > 1.0e-6_8 * abs(key_now(k))) then
+            print "(3A, ES14.6, A, ES14.6)", " note: ", trim(KEY_NAME(k)), &
+                  " was ", key(k), " in the checkpoint, now ", key_now(k)
+          end if
+        end do
+      end if
+    else if (ios == 0 .and. marker == 4) then
+      ! version 1: [4|t|4], psi, particles, then (if present) seed, dt
+      ! level and bytes per real in records of one integer
+      read(iunit, iostat=ios) t, marker, marker
+      if (ios /= 0) then
+        why = 'truncated'
+      else
+        if (mod(int(marker, 8), int(cfg%Lx, 8) * cfg%Ly) /= 0) then
+          why = 'written for another lattice'
+        else
+          fb = int(marker / (int(cfg%Lx, 8) * cfg%Ly))
+          call check_system(cfg%Lx, cfg%Ly, cfg%Np, fb)
+        end if
+      end if
+      if (why == '') then
+        field_bytes = int(cfg%Lx, 8) * cfg%Ly * fb
+        part_bytes  = int(cfg%Np, 8) * 7 * fb
+        rec3 = 12 + 8 + field_bytes
+        if (fsize < rec3 + 8 + part_bytes) then
+          why = 'truncated'
+        else
+          read(iunit, pos=rec3+1, iostat=ios) marker
+          if (ios /= 0 .or. marker /= part_bytes) then
+            why = 'written for another number of particles'
+          else
+            call read_payload(12_8, rec3)
+          end if
+        end if
+      end if
+      if (why == '') then
+        ! (the trailing records of older checkpoints may be missing)
+        read(iunit, pos=rec3+8+part_bytes+1, iostat=ios) marker, k
+        if (ios == 0) seed = k
+        if (ios == 0) read(iunit, iostat=ios) marker, marker, k
+        if (ios == 0) level = k
+      end if
+    else
+      why = 'not a checkpoint'
+    end if
+    close(iunit)
+
+    if (why /= '') then
+      if (present(transport)) transport = Transport_t()
+      print *, trim(filename), ": ", trim(why)
+      return
+    end if
+
+    nf = nf + int(part_bytes / 4)
+    if (present(transport) .and. tr_bytes == 0) transport = Transport_t()
+
+    if (fb /= WP_BYTES) print *, "checkpoint in ", merge('double', 'single', fb == 8), &
+                                 " precision, converted to ", WP_NAME
+    call unpack_state(words(1:nf), fb, nint, psi, particles)
+    if (present(rng_seed)) rng_seed = seed
+    if (present(dt_level)) dt_level = level
+    ok = .true.
+
+  contains
+
+    ! the file must be for the lattice and particles of parameters.in
+    subroutine check_system(lx, ly, np, nbytes)
+      integer, intent(in) :: lx, ly, np, nbytes
+
+      if (nbytes /= 4 .and. nbytes /= 8) then
+        why = 'unknown precision'
+      else if (lx /= cfg%Lx .or. ly /= cfg%Ly .or. np /= cfg%Np) then
+        write(why, '(A, 2(I0, A), I0, A, 2(I0, A), I0, A)') 'written for ', lx, ' x ', ly, &
+              ' with ', np, ' particles, parameters.in has ', cfg%Lx, ' x ', cfg%Ly, &
+              ' with ', cfg%Np
+      end if
+    end subroutine check_system
+
+    ! psi and particle payloads, behind the markers at 0-based pos2, pos3,
+    ! followed by the transport statistics (at rec4)
+    subroutine read_payload(pos2, pos3)
+      integer(kind=8), intent(in) :: pos2, pos3
+      integer(kind=8) :: np4
+
+      nf = int(field_bytes / 4)
+      np4 = nf + part_bytes / 4
+      allocate(words(np4 + tr_bytes / 4))
+      read(iunit, pos=pos2+5, iostat=ios) words(1:nf)
+      if (ios == 0) read(iunit, pos=pos3+5, iostat=ios) words(nf+1:np4)
+      if (ios == 0 .and. tr_bytes > 0) read(iunit, pos=rec4+5, iostat=ios) words(np4+1:)
+      if (ios /= 0) why = 'truncated'
+    end subroutine read_payload
+
+    ! The transport statistics into tr, the levels straight
+    ! from their records, adding them to the checksum
+    subroutine read_levels(tr)
+      type(Transport_t), intent(inout) :: tr
+      integer(kind=8) :: off, k0
+      integer :: l, s
+      integer(kind=4) :: wmold(1)
+
+      call transport_restore(tr, words(size(words)-tr_bytes/4+1:), cfg%Np, tr_ok)
+      if (.not. tr_ok .or. tr%nlev /= nlev) then
+        why = 'damaged transport statistics'
+        return
+      end if
+      off = rec4 + 8 + tr_bytes
+      k0 = size(words, kind=8)
+      do l = 0, nlev - 1
+        read(iunit, pos=off+5, iostat=ios) tr%origin(:,:,l), tr%hist(:,:,:,l)
+        if (ios /= 0) then
+          why = 'truncated'
+          return
+        end if
+        call checksum_add(transfer(tr%origin(:,:,l), wmold), k0, a, b)
+        k0 = k0 + 6_8 * cfg%Np
+        do s = 0, size(tr%hist, 3) - 1
+          call checksum_add(transfer(tr%hist(:,:,s,l), wmold), k0, a, b)
+          k0 = k0 + 3_8 * cfg%Np
+        end do
+        off = off + 8 + lev_bytes
+      end do
+    end subroutine read_levels
+
+  end subroutine load_checkpoint
+
+  ! psi and the particle records from the words of a checkpoint with
+  ! reals of fb bytes, and nint 32-bit integers (the image counters) after
+  ! the reals of each particle
+  subroutine unpack_state(words, fb, nint, psi, particles)
+    integer(kind=4),   intent(in)    :: words(:)
+    integer,           intent(in)    :: fb, nint
+    real,              intent(out)   :: psi(:,:)
+    type(Particles_t), intent(inout) :: particles
+    real, allocatable :: rec(:,:)
+    integer, allocatable :: w(:,:)
+    integer :: nf, nw, np, p
+    type(Particle_t) :: prec
+
+    nf = size(psi) * fb / 4
+    nw = 7 * fb / 4 + nint              ! words per particle
+    np = (size(words) - nf) / nw
+    w = reshape(words(nf+1:), [nw, np])
+    allocate(rec(7, np))
+    if (fb == 4) then
+      psi = reshape(real(transfer(words(1:nf), 1.0_4, size(psi))), shape(psi))
+      rec = reshape(real(transfer(w(1:7,:), 1.0_4, 7 * np)), [7, np])
+    else
+      psi = reshape(real(transfer(words(1:nf), 1.0_8, size(psi))), shape(psi))
+      rec = reshape(real(transfer(w(1:14,:), 1.0_8, 7 * np)), [7, np])
+    end if
+    do p = 1, np
+      prec = Particle_t(rec(1,p), rec(2,p), rec(3,p), rec(4,p), rec(5,p), rec(6,p), rec(7,p))
+      if (nint == 2) then
+        prec%ix = w(nw-1,p)
+        prec%iy = w(nw,p)
+      end if
+      call put_particle(particles, p, prec)
+      particles%id(p) = p
+    end do
+    particles%n = np
+  end subroutine unpack_state
+
+  function header_bytes(t, cfg, checksum) result(h)
+    integer,         intent(in) :: t
+    type(Config_t),  intent(in) :: cfg
+    integer(kind=8), intent(in) :: checksum
+    character(len=1) :: h(CKPT_HEADER)
+
+    h(1:8) = transfer(CKPT_MAGIC, 'a', 8)
+    h(9:40) = transfer([integer(kind=4) :: CKPT_VERSION, WP_BYTES, t, cfg%Lx, cfg%Ly, &
+                        cfg%Np, cfg%rng_seed, cfg%dt_level], 'a', 32)
+    h(41:104) = transfer(key_params(cfg), 'a', 8 * NKEY)
+    h(105:112) = transfer(checksum, 'a', 8)
+  end function header_bytes
+
+  ! Parameters recorded in the header, compared on restart
+  function key_params(cfg) result(key)
+    type(Config_t), intent(in) :: cfg
+    real(kind=8) :: key(NKEY)
+
+    key = real([cfg%dt, cfg%M, cfg%kappa, cfg%tau, cfg%u, cfg%psimean, cfg%Reff, cfg%R0], 8)
+  end function key_params
+
+  ! Fletcher-like checksum of 32-bit words at 0-based word positions
+  ! k0, k0+1, ...: a and b accumulate the sums of the words and of
+  ! (position+1)*word modulo 2**31-1. Being sums, the parts of a file
+  ! written by different ranks add up (see save_checkpoint).
+  subroutine checksum_add(words, k0, a, b)
+    integer(kind=4), intent(in)    :: words(:)
+    integer(kind=8), intent(in)    :: k0
+    integer(kind=8), intent(inout) :: a, b
+    integer(kind=8) :: w
+    integer :: k
+
+    do k = 1, size(words)
+      w = mod(iand(int(words(k), 8), MASK32), CK_MOD)
+      a = mod(a + w, CK_MOD)
+      b = mod(b + mod(k0 + k, CK_MOD) * w, CK_MOD)
+    end do
+  end subroutine checksum_add
+
+end module mod_checkpoint
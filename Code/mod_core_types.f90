@@ -2,9 +2,17 @@ module mod_core_types
   implicit none
   public
 
+  ! Working precision: the kind of the default real, which is fixed when
+  ! building (single by default, double with `make PREC=double`, see the
+  ! Makefile). WP_BYTES tags the checkpoint files.
+  integer, parameter :: wp = kind(1.0)
+  integer, parameter :: WP_BYTES = storage_size(1.0) / 8
+  character(len=*), parameter :: WP_NAME = merge('double', 'single', WP_BYTES == 8)
+
   ! Global Constants
   real, parameter :: PI = 3.14159265358979323846
   real, parameter :: TWO_PI = 6.28318530717958647692
+  real(kind=8), parameter :: PI_DP = 3.14159265358979323846d0   ! for double precision sums
 
   ! Structure for simulation constants and parameters
   type :: Config_t
@@ -38,18 +46,208 @@ module mod_core_types
     ! initialisation flag 
     logical :: custom_init
 
+    ! Parallel execution (optional entries at the end of parameters.in)
+    integer :: nthreads            ! OpenMP threads (0 = OMP_NUM_THREADS default)
+
+    ! Domain decomposition (set by par_decompose, see mod_parallel)
+    integer :: ng                  ! ghost layers around the field arrays
+    integer :: y0, ny              ! this process owns global rows y0+1..y0+ny
+
+    ! Field integrator: 'fd' (explicit Euler) or 'spectral' (semi-implicit)
+    character(len=16) :: field_solver
+    real :: spectral_A             ! linear stabilisation of the spectral step
+
+    ! Particle-particle neighbour search: Verlet list with this skin,
+    ! 0 = rebuild the cell list every step
+    real :: verlet_skin
+
+    ! Reorder the particles along a space-filling curve every sort_interval
+    ! steps, for memory locality (0 = never)
+    integer :: sort_interval
+
+    ! Coupling kernel tabulated on this many bins in r^2 (0 = evaluate exp)
+    integer :: coupling_table
+
+    ! Seed of the counter-based random numbers (see mod_random); 0 in
+    ! parameters.in means a seed from the clock, which is then stored here
+    integer :: rng_seed
+
+    ! Adaptive time stepping (see main): a step of dt is split into 2**dt_level
+    ! substeps, refined when the drift of a particle would exceed
+    ! adapt_drift*diam or psi would change by more than adapt_dpsi in one
+    ! substep (0 = no such limit; both 0 = fixed dt)
+    real :: adapt_drift, adapt_dpsi
+    integer :: dt_level
+
+    ! Snapshot format of write_data: 'txt' (formatted columns), 'bin'
+    ! (binary with a header, see write_data_bin in mod_io) or 'packed'
+    ! (as 'bin', psi quantised to packed_bits bits and packed, see
+    ! write_field_packed)
+    character(len=8) :: output_format
+
+    ! Asynchronous output: files in flight while stepping goes on
+    ! (0 = write synchronously; see mod_async_io)
+    integer :: io_queue
+
+    ! Checkpoints kept: checkpoint.bin and checkpoint.bin.1 .. .(keep-1)
+    ! (see mod_checkpoint)
+    integer :: checkpoint_keep
+
+    ! Bits per value of psi in packed snapshots (1..24)
+    integer :: packed_bits
+
+    ! Droplets of droplets.dat: the clusters of psi < droplet_threshold;
+    ! droplet_histogram adds their number per size class (see write_stats)
+    real :: droplet_threshold
+    logical :: droplet_histogram
+
+    ! Steps between the samples of the particle transport statistics
+    ! (0 = none; see mod_transport)
+    integer :: transport_interval
+
+    ! Steps between the structure factors of structure_factor.dat (0 = none;
+    ! a multiple of stats_interval, see write_stats)
+    integer :: structure_interval
+
+    ! Steps between the droplet statistics of droplets.dat (0 = none; a
+    ! multiple of stats_interval)
+    integer :: droplet_interval
+
+    ! Steps between the topologies of topology.dat (0 = none; a multiple of
+    ! stats_interval)
+    integer :: topology_interval
+
+    ! Directory of the input and output files of this simulation, with a
+    ! trailing '/' ('' = the current directory; see main for batches)
+    character(len=256) :: dir
+
   end type Config_t
 
-  ! Structure for individual particle data
+  ! Verlet list of a set of particles (see mod_particles): pairs
+  ! (pair_i(k), pair_j(k)), k = 1..npairs, closer than r_cut + skin when the
+  ! list was built at positions x_ref, y_ref. The pairs found from cell row
+  ! r are row_first(r)..row_first(r+1)-1.
+  type :: Verlet_t
+    integer :: npairs = 0
+    integer, allocatable :: pair_i(:), pair_j(:)
+    integer, allocatable :: row_first(:)
+    real,    allocatable :: x_ref(:), y_ref(:)
+    real :: skin = 0.0
+  end type Verlet_t
+
+  ! Structure for individual particle data. This is the record layout of
+  ! the checkpoint files and of the particles exchanged between MPI ranks;
+  ! the simulation itself stores particles in a Particles_t.
   type :: Particle_t
     real :: x, y                   ! Continuous coordinates
     real :: phi                    ! orientation 
     real :: fx, fy                 ! Forces from field-particle coupling
     real :: fx_pp, fy_pp           ! Forces from particle-particle repulsion
+    integer :: ix = 0, iy = 0      ! Periodic images crossed (see Particles_t)
   end type Particle_t
 
+  ! Particle storage as a structure of arrays, so that the particle kernels
+  ! run over contiguous arrays. Entries 1..n are the particles owned by this
+  ! process, n+1..n+nghost ghost copies of particles owned by neighbouring
+  ! ranks (see mod_parallel). id is the global index of a particle (0 for
+  ! ghosts), which fixes the order of the particles in the output files.
+  ! ix, iy count the times a particle crossed the periodic boundaries (+1
+  ! leaving through x = Lx, -1 through x = 0): its unwrapped position is
+  ! (x + ix*Lx, y + iy*Ly).
+  ! Each set carries its own Verlet list, so that several simulations can
+  ! run side by side in one process (see main).
+  type :: Particles_t
+    integer :: n = 0, nghost = 0
+    integer, allocatable :: id(:)
+    real,    allocatable :: x(:), y(:)          ! Continuous coordinates
+    real,    allocatable :: phi(:)              ! orientation
+    real,    allocatable :: fx(:), fy(:)        ! Forces from field-particle coupling
+    real,    allocatable :: fx_pp(:), fy_pp(:)  ! Forces from particle-particle repulsion
+    integer, allocatable :: ix(:), iy(:)        ! Periodic images crossed
+    type(Verlet_t) :: verlet
+  end type Particles_t
+
   type :: Energy_t
     real :: field, pp, coupling
   end type Energy_t
 
+contains
+
+  ! Allocate room for ncap particles (none in use yet)
+  subroutine particles_alloc(p, ncap)
+    type(Particles_t), intent(inout) :: p
+    integer,           intent(in)    :: ncap
+
+    if (allocated(p%x)) deallocate(p%id, p%x, p%y, p%phi, p%fx, p%fy, p%fx_pp, p%fy_pp, &
+                                   p%ix, p%iy)
+    allocate(p%id(ncap), p%x(ncap), p%y(ncap), p%phi(ncap), p%fx(ncap), p%fy(ncap), &
+             p%fx_pp(ncap), p%fy_pp(ncap), p%ix(ncap), p%iy(ncap))
+    p%n = 0
+    p%nghost = 0
+  end subroutine particles_alloc
+
+  ! Make room for at least ncap particles, keeping the current content
+  subroutine particles_reserve(p, ncap)
+    type(Particles_t), intent(inout) :: p
+    integer,           intent(in)    :: ncap
+    type(Particles_t) :: tmp
+    integer :: k
+
+    if (size(p%x) >= ncap) return
+    call particles_alloc(tmp, max(ncap, 2 * size(p%x)))
+    k = p%n + p%nghost
+    tmp%id(1:k) = p%id(1:k)
+    tmp%x(1:k) = p%x(1:k);         tmp%y(1:k) = p%y(1:k)
+    tmp%phi(1:k) = p%phi(1:k)
+    tmp%fx(1:k) = p%fx(1:k);       tmp%fy(1:k) = p%fy(1:k)
+    tmp%fx_pp(1:k) = p%fx_pp(1:k); tmp%fy_pp(1:k) = p%fy_pp(1:k)
+    tmp%ix(1:k) = p%ix(1:k);       tmp%iy(1:k) = p%iy(1:k)
+    tmp%n = p%n
+    tmp%nghost = p%nghost
+    call move_alloc(tmp%id, p%id)
+    call move_alloc(tmp%x, p%x);         call move_alloc(tmp%y, p%y)
+    call move_alloc(tmp%phi, p%phi)
+    call move_alloc(tmp%fx, p%fx);       call move_alloc(tmp%fy, p%fy)
+    call move_alloc(tmp%fx_pp, p%fx_pp); call move_alloc(tmp%fy_pp, p%fy_pp)
+    call move_alloc(tmp%ix, p%ix);       call move_alloc(tmp%iy, p%iy)
+  end subroutine particles_reserve
+
+  ! Reorder the particles in use: new entry k is old entry perm(k)
+  subroutine particles_permute(p, perm)
+    type(Particles_t), intent(inout) :: p
+    integer,           intent(in)    :: perm(:)
+    integer :: k
+
+    k = size(perm)
+    p%id(1:k) = p%id(perm)
+    p%x(1:k) = p%x(perm);         p%y(1:k) = p%y(perm)
+    p%phi(1:k) = p%phi(perm)
+    p%fx(1:k) = p%fx(perm);       p%fy(1:k) = p%fy(perm)
+    p%fx_pp(1:k) = p%fx_pp(perm); p%fy_pp(1:k) = p%fy_pp(perm)
+    p%ix(1:k) = p%ix(perm);       p%iy(1:k) = p%iy(perm)
+  end subroutine particles_permute
+
+  ! Particle i as a single record
+  function get_particle(p, i) result(rec)
+    type(Particles_t), intent(in) :: p
+    integer,           intent(in) :: i
+    type(Particle_t) :: rec
+
+    rec = Particle_t(p%x(i), p%y(i), p%phi(i), p%fx(i), p%fy(i), p%fx_pp(i), p%fy_pp(i), &
+                     p%ix(i), p%iy(i))
+  end function get_particle
+
+  ! Store a single record as particle i
+  subroutine put_particle(p, i, rec)
+    type(Particles_t), intent(inout) :: p
+    integer,           intent(in)    :: i
+    type(Particle_t),  intent(in)    :: rec
+
+    p%x(i) = rec%x;         p%y(i) = rec%y
+    p%phi(i) = rec%phi
+    p%fx(i) = rec%fx;       p%fy(i) = rec%fy
+    p%fx_pp(i) = rec%fx_pp; p%fy_pp(i) = rec%fy_pp
+    p%ix(i) = rec%ix;       p%iy(i) = rec%iy
+  end subroutine put_particle
+
 end module mod_core_types
\ No newline at end of file
@@ -1,67 +1,239 @@
 module mod_coupling
   use mod_core_types
+  use mod_parallel
+  !$ use omp_lib
   implicit none
-  public :: coupling
+  public :: coupling, coupling_table_error
+
+  ! Tabulated kernel (cfg%coupling_table bins, 0 = evaluate exp directly):
+  ! psic and dpsic as functions of s = r^2/Reff^2 in [0, 1), linearly
+  ! interpolated between the nodes s_k = k/nbins, k = 0..nbins
+  real, allocatable, save :: tab_psic(:), tab_dpsic(:)
+  real, allocatable, save :: slope_psic(:), slope_dpsic(:)
+  integer, save :: tab_bins = 0
+  real,    save :: tab_Reff = -1.0          ! Reff the table was built for
 
 contains
 
-  subroutine coupling(mu, psi, particles, cfg,E_cpl)
-    real, intent(inout)           :: mu(:,:)
-    real, intent(in)              :: psi(:,:)
-    type(Particle_t), intent(inout) :: particles(:)
+  ! The footprint of a particle is addressed through the ghost layers of mu
+  ! and psi (see mod_parallel), so no periodic wrapping is needed here:
+  ! contributions landing in ghost cells are folded back onto the cells they
+  ! are images of at the end.
+  !
+  ! With several OpenMP threads the particles are binned into strips of rows
+  ! at least as high as the footprint diameter. Footprints of particles two
+  ! strips apart never overlap, so the even strips and then the odd strips
+  ! can each be processed in parallel without two threads adding to the
+  ! same cell of mu. Strips are handed out dynamically, since clustered
+  ! states leave some strips much fuller than others.
+  subroutine coupling(mu, psi, particles, cfg,E_cpl, energy)
     type(Config_t), intent(in)    :: cfg
+    real, intent(inout)           :: mu(1-cfg%ng:, 1-cfg%ng:)   ! ghost-padded
+    real, intent(in)              :: psi(1-cfg%ng:, 1-cfg%ng:)  ! valid ghost layers
+    type(Particles_t), intent(inout) :: particles   ! owned ones: 1..n
     real, intent(out) :: E_cpl
-    integer :: p, i, j, xg, yg, N2
-    real    :: dx, dy, r2, r2_Reff2, psic, dpsic, dpsi, K1, r_inv_sq
+    logical, intent(in), optional :: energy   ! evaluate E_cpl (default), else 0
+    integer :: p, q, s, colour, N2, width, nstrip, nthreads
+    integer, allocatable :: strip(:), first(:), order(:)
+    real    :: r_inv_sq
+    logical :: tabulated, with_energy
 
     E_cpl = 0.0
-
-
+    with_energy = .true.
+    if (present(energy)) with_energy = energy
 
     N2 = int(cfg%Reff) + 1
     r_inv_sq = 1.0 / cfg%Reff_2
 
-    do p = 1, cfg%Np
-      particles(p)%fx = 0.0
-      particles(p)%fy = 0.0
-
-      do j = -N2, N2
-        do i = -N2, N2
-          ! 1. Identify grid cell with PBC
-          xg = modulo(nint(particles(p)%x) + i - 1, cfg%Lx) + 1
-          yg = modulo(nint(particles(p)%y) + j - 1, cfg%Ly) + 1
-
-          ! 2. Calculate distance (Minimum Image Convention)
-          dx = particles(p)%x - real(xg)
-          if (abs(dx) > cfg%Lx*0.5) dx = dx - sign(real(cfg%Lx), dx)
-          dy = particles(p)%y - real(yg)
-          if (abs(dy) > cfg%Ly*0.5) dy = dy - sign(real(cfg%Ly), dy)
-          r2 = dx**2 + dy**2
-
-          ! 3. Interaction check
-          if (r2 < cfg%Reff_2) then
-            ! Smooth potential calculation
-            r2_Reff2 = r2 * r_inv_sq
+    tabulated = (cfg%coupling_table > 0)
+    if (tabulated) call build_table(cfg)
+
+    call halo_clear(mu, cfg)
+
+    nthreads = 1
+    !$ nthreads = omp_get_max_threads()
+    width = 2 * N2
+    nstrip = cfg%ny / width
+
+    if (nthreads == 1 .or. nstrip < 2) then
+      do p = 1, particles%n
+        call couple_particle(p, mu, psi, particles, cfg, N2, r_inv_sq, tabulated, &
+                             with_energy, E_cpl)
+      enddo
+    else
+      ! Counting sort of the particles by strip (stable, so a spatially
+      ! sorted particle order is kept within each strip)
+      allocate(strip(particles%n), first(0:nstrip), order(particles%n))
+      first = 0
+      do p = 1, particles%n
+        s = (min(max(nint(particles%y(p)) - cfg%y0, 1), cfg%ny) - 1) / width
+        strip(p) = min(s, nstrip - 1)
+        first(strip(p) + 1) = first(strip(p) + 1) + 1
+      enddo
+      first(0) = 1
+      do s = 1, nstrip
+        first(s) = first(s) + first(s - 1)
+      enddo
+      do p = 1, particles%n
+        order(first(strip(p))) = p
+        first(strip(p)) = first(strip(p)) + 1
+      enddo
+      ! first(s) now points past strip s: shift back to the strip starts
+      first(1:nstrip) = first(0:nstrip-1)
+      first(0) = 1
+
+      do colour = 0, 1
+        !$omp parallel do private(q) reduction(+:E_cpl) schedule(dynamic)
+        do s = colour, nstrip - 1, 2
+          do q = first(s), first(s + 1) - 1
+            call couple_particle(order(q), mu, psi, particles, cfg, N2, r_inv_sq, &
+                                 tabulated, with_energy, E_cpl)
+          enddo
+        enddo
+        !$omp end parallel do
+      enddo
+    end if
+
+    ! Ghost contributions to mu go back to the cells (or ranks) owning them
+    call halo_fold(mu, cfg)
+  end subroutine coupling
+
+  ! Coupling of particle p with the cells of its footprint: adds to mu (and
+  ! to E_cpl if energy) and sets the coupling force of the particle
+  subroutine couple_particle(p, mu, psi, particles, cfg, N2, r_inv_sq, tabulated, &
+                             energy, E_cpl)
+    integer,        intent(in)    :: p, N2
+    type(Config_t), intent(in)    :: cfg
+    real, intent(inout)           :: mu(1-cfg%ng:, 1-cfg%ng:)
+    real, intent(in)              :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(inout) :: particles
+    real,    intent(in)           :: r_inv_sq
+    logical, intent(in)           :: tabulated, energy
+    real,    intent(inout)        :: E_cpl
+    integer :: i, j, xg, yg, ix, iy, k
+    real    :: dx, dy, r2, r2_Reff2, psic, dpsic, dpsi, K1, fx, fy, u, w
+
+    fx = 0.0
+    fy = 0.0
+
+    ! Nearest grid cell in local indices (may lie in the ghost layers)
+    ix = nint(particles%x(p))
+    iy = nint(particles%y(p)) - cfg%y0
+
+    do j = -N2, N2
+      yg = iy + j
+      dy = particles%y(p) - real(yg + cfg%y0)
+      do i = -N2, N2
+        xg = ix + i
+        ! Distance to the cell (unwrapped, so no minimum image needed)
+        dx = particles%x(p) - real(xg)
+        r2 = dx**2 + dy**2
+
+        ! 3. Interaction check
+        if (r2 < cfg%Reff_2) then
+          ! Smooth potential calculation
+          r2_Reff2 = r2 * r_inv_sq
+          if (tabulated) then
+            u = r2_Reff2 * tab_bins
+            k = int(u)
+            w = u - real(k)
+            psic  = tab_psic(k)  + w * slope_psic(k)
+            dpsic = tab_dpsic(k) + w * slope_dpsic(k)
+          else
             psic = exp(1.0 - 1.0 / (1.0 - r2_Reff2))
             dpsic = (psic * 2.0 * r_inv_sq) / (1.0 - r2_Reff2)**2
+          end if
 
-            dpsi = psi(xg, yg) - cfg%affinity
-            
-            ! Field interaction (MuCPL)
-            mu(xg, yg) = mu(xg, yg) + 2.0 * cfg%sigma * psic * dpsi
+          dpsi = psi(xg, yg) - cfg%affinity
+          
+          ! Field interaction (MuCPL)
+          mu(xg, yg) = mu(xg, yg) + 2.0 * cfg%sigma * psic * dpsi
 
-            ! Force contribution
-            K1 = cfg%sigma * dpsic * (dpsi**2)
-            particles(p)%fx = particles(p)%fx + K1 * dx
-            particles(p)%fy = particles(p)%fy + K1 * dy
+          ! Force contribution
+          K1 = cfg%sigma * dpsic * (dpsi**2)
+          fx = fx + K1 * dx
+          fy = fy + K1 * dy
 
-            ! energy contribution 
-            E_cpl = E_cpl + cfg%sigma * psic * dpsi**2
+          ! energy contribution 
+          if (energy) E_cpl = E_cpl + cfg%sigma * psic * dpsi**2
 
-          endif
-        enddo
+        endif
       enddo
     enddo
-  end subroutine coupling
+    particles%fx(p) = fx
+    particles%fy(p) = fy
+  end subroutine couple_particle
+
+  ! Analytic kernel at s = r^2/Reff^2: psic = exp(1 - 1/(1-s)) and
+  ! dpsic = 2 psic / (Reff^2 (1-s)^2), zero outside the support
+  pure subroutine kernel_exact(s, Reff_2, psic, dpsic)
+    double precision, intent(in)  :: s, Reff_2
+    double precision, intent(out) :: psic, dpsic
+
+    if (s >= 1.0d0) then
+      psic = 0.0d0
+      dpsic = 0.0d0
+    else
+      psic = exp(1.0d0 - 1.0d0 / (1.0d0 - s))
+      dpsic = 2.0d0 * psic / (Reff_2 * (1.0d0 - s)**2)
+    end if
+  end subroutine kernel_exact
+
+  ! (Re)build the kernel table when the resolution or Reff changed
+  subroutine build_table(cfg)
+    type(Config_t), intent(in) :: cfg
+    double precision :: psic, dpsic
+    integer :: k, n
+
+    n = cfg%coupling_table
+    if (n == tab_bins .and. cfg%Reff == tab_Reff) return
+
+    if (allocated(tab_psic)) deallocate(tab_psic, tab_dpsic, slope_psic, slope_dpsic)
+    allocate(tab_psic(0:n), tab_dpsic(0:n), slope_psic(0:n), slope_dpsic(0:n))
+    do k = 0, n
+      call kernel_exact(real(k, 8) / n, real(cfg%Reff, 8)**2, psic, dpsic)
+      tab_psic(k) = real(psic)
+      tab_dpsic(k) = real(dpsic)
+    end do
+    slope_psic(0:n-1) = tab_psic(1:n) - tab_psic(0:n-1)
+    slope_dpsic(0:n-1) = tab_dpsic(1:n) - tab_dpsic(0:n-1)
+    slope_psic(n) = 0.0
+    slope_dpsic(n) = 0.0
+
+    tab_bins = n
+    tab_Reff = cfg%Reff
+  end subroutine build_table
+
+  ! Accuracy check of the table: largest deviation from the analytic kernel,
+  ! relative to the largest value of psic and dpsic, sampled at 16 points per
+  ! bin over [0, 1)
+  subroutine coupling_table_error(cfg, err_psic, err_dpsic)
+    type(Config_t), intent(in)  :: cfg
+    real,           intent(out) :: err_psic, err_dpsic
+    double precision :: s, psic, dpsic, max_psic, max_dpsic, e1, e2
+    real    :: u, w
+    integer :: m, k
+
+    err_psic = 0.0
+    err_dpsic = 0.0
+    if (cfg%coupling_table <= 0) return
+    call build_table(cfg)
+
+    max_psic = 0.0d0; max_dpsic = 0.0d0
+    e1 = 0.0d0; e2 = 0.0d0
+    do m = 0, 16 * tab_bins - 1
+      s = (m + 0.5d0) / (16 * tab_bins)
+      call kernel_exact(s, real(cfg%Reff, 8)**2, psic, dpsic)
+      u = real(s) * tab_bins
+      k = int(u)
+      w = u - real(k)
+      e1 = max(e1, abs(tab_psic(k) + w * slope_psic(k) - psic))
+      e2 = max(e2, abs(tab_dpsic(k) + w * slope_dpsic(k) - dpsic))
+      max_psic = max(max_psic, psic)
+      max_dpsic = max(max_dpsic, dpsic)
+    end do
+    err_psic = real(e1 / max_psic)
+    err_dpsic = real(e2 / max_dpsic)
+  end subroutine coupling_table_error
 
 end module mod_coupling
\ No newline at end of file
@@ -0,0 +1,180 @@
+module mod_fft
+  ! Bundled complex FFT (no external library needed).
+  ! Lengths that are a power of two use an iterative radix-2 Cooley-Tukey
+  ! transform; any other length is handled with Bluestein's chirp-z
+  ! algorithm on top of a radix-2 transform of length >= 2n-1.
+  ! Transforms are unnormalised: forward (isign=-1) followed by inverse
+  ! (isign=+1) multiplies the data by n.
+  use mod_core_types, only: PI_DP
+  implicit none
+  private
+  public :: Fft1d_t, fft_plan, fft_1d, fft_2d
+
+  type :: Fft1d_t
+    integer :: n = 0                   ! transform length
+    integer :: m = 0                   ! radix-2 working length (m = n if n is a power of two)
+    logical :: pow2 = .true.
+    complex, allocatable :: w(:)       ! twiddles exp(-2 pi i j/m), j = 0..m/2-1
+    integer, allocatable :: rev(:)     ! bit-reversal permutation of 0..m-1
+    complex, allocatable :: chirp(:)   ! Bluestein: exp(-i pi j^2/n), j = 0..n-1
+    complex, allocatable :: bhat(:)    ! Bluestein: FFT of the conjugate chirp filter
+  end type Fft1d_t
+
+contains
+
+  subroutine fft_plan(plan, n)
+    type(Fft1d_t), intent(inout) :: plan
+    integer,       intent(in)    :: n
+    integer :: j
+    double precision :: ang
+    complex, allocatable :: b(:)
+
+    plan%n = n
+    plan%m = 1
+    do while (plan%m < n)
+      plan%m = 2 * plan%m
+    end do
+    plan%pow2 = (plan%m == n)
+    if (.not. plan%pow2) then
+      plan%m = 1
+      do while (plan%m < 2*n - 1)
+        plan%m = 2 * plan%m
+      end do
+    end if
+
+    call radix2_tables(plan%m, plan%w, plan%rev)
+
+    if (.not. plan%pow2) then
+      if (allocated(plan%chirp)) deallocate(plan%chirp, plan%bhat)
+      allocate(plan%chirp(0:n-1), plan%bhat(0:plan%m-1), b(0:plan%m-1))
+      do j = 0, n - 1
+        ! j**2 reduced modulo 2n keeps the phase accurate for large j
+        ang = PI_DP * real(modulo(int(j, 8)**2, 2_8*n), 8) / real(n, 8)
+        plan%chirp(j) = cmplx(cos(ang), -sin(ang), kind(plan%chirp))
+      end do
+      b = (0.0, 0.0)
+      b(0) = conjg(plan%chirp(0))
+      do j = 1, n - 1
+        b(j)          = conjg(plan%chirp(j))
+        b(plan%m - j) = conjg(plan%chirp(j))
+      end do
+      call fft_radix2(b, plan%m, plan%w, plan%rev, -1)
+      plan%bhat = b
+      deallocate(b)
+    end if
+  end subroutine fft_plan
+
+  subroutine radix2_tables(m, w, rev)
+    integer,              intent(in)    :: m
+    complex, allocatable, intent(inout) :: w(:)
+    integer, allocatable, intent(inout) :: rev(:)
+    integer :: j, k, r, bits
+    double precision :: ang
+
+    if (allocated(w)) deallocate(w)
+    if (allocated(rev)) deallocate(rev)
+    allocate(w(0:max(m/2, 1) - 1), rev(0:m-1))
+
+    do j = 0, m/2 - 1
+      ang = 2.0d0 * PI_DP * real(j, 8) / real(m, 8)
+      w(j) = cmplx(cos(ang), -sin(ang), kind(w))
+    end do
+    if (m == 1) w(0) = (1.0, 0.0)
+
+    bits = 0
+    do while (2**bits < m)
+      bits = bits + 1
+    end do
+    do j = 0, m - 1
+      r = 0
+      do k = 0, bits - 1
+        if (btest(j, k)) r = ibset(r, bits - 1 - k)
+      end do
+      rev(j) = r
+    end do
+  end subroutine radix2_tables
+
+  ! In-place radix-2 transform of a(0:m-1); isign = -1 forward, +1 inverse
+  subroutine fft_radix2(a, m, w, rev, isign)
+    integer, intent(in)    :: m, isign
+    complex, intent(inout) :: a(0:m-1)
+    complex, intent(in)    :: w(0:)
+    integer, intent(in)    :: rev(0:)
+    integer :: j, k, len, half, stride, i0
+    complex :: t, wk
+
+    do j = 0, m - 1
+      if (j < rev(j)) then
+        t = a(j); a(j) = a(rev(j)); a(rev(j)) = t
+      end if
+    end do
+
+    len = 2
+    do while (len <= m)
+      half   = len / 2
+      stride = m / len
+      do i0 = 0, m - 1, len
+        do k = 0, half - 1
+          wk = w(k * stride)
+          if (isign > 0) wk = conjg(wk)
+          t = wk * a(i0 + k + half)
+          a(i0 + k + half) = a(i0 + k) - t
+          a(i0 + k)        = a(i0 + k) + t
+        end do
+      end do
+      len = 2 * len
+    end do
+  end subroutine fft_radix2
+
+  ! In-place transform of a(0:n-1) of any length; isign = -1 forward, +1 inverse
+  subroutine fft_1d(plan, a, isign)
+    type(Fft1d_t), intent(in)    :: plan
+    complex,       intent(inout) :: a(0:)
+    integer,       intent(in)    :: isign
+    complex :: work(0:plan%m - 1)
+    integer :: n
+
+    n = plan%n
+    if (plan%pow2) then
+      call fft_radix2(a, n, plan%w, plan%rev, isign)
+      return
+    end if
+
+    ! Bluestein: the inverse transform is the conjugate of the forward
+    ! transform of the conjugated data
+    if (isign > 0) a(0:n-1) = conjg(a(0:n-1))
+
+    work = (0.0, 0.0)
+    work(0:n-1) = a(0:n-1) * plan%chirp
+    call fft_radix2(work, plan%m, plan%w, plan%rev, -1)
+    work = work * plan%bhat
+    call fft_radix2(work, plan%m, plan%w, plan%rev, +1)
+    a(0:n-1) = plan%chirp * work(0:n-1) / real(plan%m)
+
+    if (isign > 0) a(0:n-1) = conjg(a(0:n-1))
+  end subroutine fft_1d
+
+  ! In-place 2D transform of a(1:nx, 1:ny): first along x, then along y
+  subroutine fft_2d(px, py, a, isign)
+    type(Fft1d_t), intent(in)    :: px, py
+    complex,       intent(inout) :: a(:,:)
+    integer,       intent(in)    :: isign
+    integer :: i, j
+    complex :: line(0:py%n - 1)
+
+    !$omp parallel do schedule(static)
+    do j = 1, size(a, 2)
+      call fft_1d(px, a(:, j), isign)
+    end do
+    !$omp end parallel do
+
+    !$omp parallel do private(line) schedule(static)
+    do i = 1, size(a, 1)
+      line = a(i, :)
+      call fft_1d(py, line, isign)
+      a(i, :) = line
+    end do
+    !$omp end parallel do
+  end subroutine fft_2d
+
+end module mod_fft
@@ -1,93 +1,231 @@
 module mod_field
   use mod_core_types
+  use mod_parallel
+  use mod_fft
+  use mod_random
   implicit none
-  public :: calculate_mu_pure, evolve_field_model_b
+  public :: calculate_mu_pure, evolve_field_model_b, evolve_field_spectral
+
+  ! All fields are stored with ng ghost layers, a(1-ng:Lx+ng, 1-ng:ny+ng), the
+  ! owned cells being a(1:Lx, 1:ny) (see mod_parallel). The ghost cells hold
+  ! periodic copies so that the stencil loops need no modulo on the neighbour
+  ! indices.
+
+  ! Persistent data of the spectral integrator, built on first use and
+  ! rebuilt when the lattice or the parameters of the multiplier change
+  ! (another simulation of the same process, see mod_capi)
+  type(Fft1d_t), save :: fft_x, fft_y
+  real,    allocatable, save :: spec_gain(:,:)   ! Fourier multiplier for mu
+  integer, save :: spec_Lx = 0, spec_Ly = 0       ! lattice of the plans
+  real,    save :: spec_key(4) = -1.0             ! dt, M, kappa and spectral_A of spec_gain
 
 contains
-   subroutine noise(psi, cfg, csi1, csi2)
-    real, intent(inout)        :: psi(:,:)
+
+  ! Conserved noise of step t (and substep, see main). The random numbers
+  ! of a cell are keyed by its global index (see mod_random), so the first
+  ! ghost row and column are drawn directly instead of being exchanged.
+   subroutine noise(psi, cfg, csi1, csi2, t, substep)
     type(Config_t), intent(in) :: cfg
-    real, intent(inout)        :: csi1(:,:), csi2(:,:) ! Pre-allocated buffers
+    real, intent(inout)        :: psi(1-cfg%ng:, 1-cfg%ng:)
+    real, intent(inout)        :: csi1(1-cfg%ng:, 1-cfg%ng:), csi2(1-cfg%ng:, 1-cfg%ng:) ! Pre-allocated buffers
+    integer, intent(in)        :: t
+    integer, intent(in), optional :: substep
     
-    integer :: i, j, ip, jp
+    integer :: i, j, jg, npairs, sub
     real    :: noise_scale
+    real, allocatable :: u(:,:)
 
     noise_scale = cfg%noiseStrength * sqrt(cfg%dt) * sqrt(12.0)
 
-    ! 1. Highly optimized vectorized random generation
-    call random_number(csi1)
-    call random_number(csi2)
+    ! 1. Uniform random numbers of the owned cells plus one ghost layer.
+    ! One draw of four numbers serves the pair of cells 2m+1, 2m+2 of a row
+    ! (for odd Lx the second cell of the last pair is the ghost column,
+    ! which is overwritten with the periodic image afterwards). The draws of
+    ! a row are made together, u(:, m+1) for the pair m.
+    sub = 0
+    if (present(substep)) sub = substep
+    npairs = (cfg%Lx + 1) / 2
+    !$omp parallel private(j, jg, u)
+    allocate(u(4, npairs))
+    !$omp do schedule(static)
+    do j = 1, cfg%ny + 1
+      jg = modulo(cfg%y0 + j - 1, cfg%Ly)
+      call rng_uniform_run(cfg%rng_seed, STREAM_FIELD_NOISE, t, int(jg, 8) * npairs, u, sub)
+      csi1(1:2*npairs-1:2, j) = u(1, :)
+      csi2(1:2*npairs-1:2, j) = u(2, :)
+      csi1(2:2*npairs:2, j) = u(3, :)
+      csi2(2:2*npairs:2, j) = u(4, :)
+      csi1(cfg%Lx + 1, j) = csi1(1, j)
+      csi2(cfg%Lx + 1, j) = csi2(1, j)
+    end do
+    !$omp end do
+    deallocate(u)
+    !$omp end parallel
 
     ! 2. Optimized nested loop (Minimize work inside)
-    do j = 1, cfg%Ly
-        jp = mod(j, cfg%Ly) + 1
+    !$omp parallel do private(i) schedule(static)
+    do j = 1, cfg%ny
         do i = 1, cfg%Lx
-            ip = mod(i, cfg%Lx) + 1
-            
             ! We do the "- 0.5" math here to avoid an extra loop over csi1/csi2
             psi(i,j) = psi(i,j) + noise_scale * ( &
-                       csi1(ip, j) - csi1(i, j) + &
-                       csi2(i, jp) - csi2(i, j) )        
+                       csi1(i+1, j) - csi1(i, j) + &
+                       csi2(i, j+1) - csi2(i, j) )        
         end do
     end do
+    !$omp end parallel do
 end subroutine noise
 
-  subroutine calculate_mu_pure(mu, psi, cfg, e_field)
-    real, intent(out) :: mu(:,:)
-    real, intent(in)  :: psi(:,:)
+  ! psi must have a valid ghost layer; only the interior of mu is written.
+  ! The free energy e_field is only evaluated if energy is true (default),
+  ! otherwise it is returned as 0: it is needed on stats steps only.
+  subroutine calculate_mu_pure(mu, psi, cfg, e_field, energy)
     type(Config_t), intent(in) :: cfg
-    integer :: i, j, ip, im, jp, jm
+    real, intent(inout) :: mu(1-cfg%ng:, 1-cfg%ng:)
+    real, intent(in)    :: psi(1-cfg%ng:, 1-cfg%ng:)
+    integer :: i, j
     real :: lap_psi
     real :: grad_sq
     real, intent(out) :: e_field
+    logical, intent(in), optional :: energy
+    ! Per-thread partial sums are combined in double precision so that the
+    ! energy does not depend on the number of threads beyond round-off
+    double precision :: e_acc
 
     ! Weights for the isotropic 9-point stencil (Oono-Puri / CDS style)
     real, parameter :: w_nn = 1.0/6.0
     real, parameter :: w_dn = 1.0/12.0
     
-    e_field = 0.0
-
-    do j = 1, cfg%Ly
-      jp = modulo(j, cfg%Ly) + 1; jm = modulo(j-2+cfg%Ly, cfg%Ly) + 1
+    !$omp parallel do private(i, lap_psi) schedule(static)
+    do j = 1, cfg%ny
       do i = 1, cfg%Lx
-        ip = modulo(i, cfg%Lx) + 1; im = modulo(i-2+cfg%Lx, cfg%Lx) + 1
-
         ! 9-Point Laplacian of Psi
         ! lap_psi = [1/6 * sum(NN)] + [1/12 * sum(DN)] - [1 * center]
-        lap_psi = w_nn * (psi(ip,j) + psi(im,j) + psi(i,jp) + psi(i,jm)) + &
-                  w_dn * (psi(ip,jp) + psi(im,jp) + psi(ip,jm) + psi(im,jm)) - &
+        lap_psi = w_nn * (psi(i+1,j) + psi(i-1,j) + psi(i,j+1) + psi(i,j-1)) + &
+                  w_dn * (psi(i+1,j+1) + psi(i-1,j+1) + psi(i+1,j-1) + psi(i-1,j-1)) - &
                   psi(i,j)
 
         mu(i,j) = -cfg%tau*psi(i,j) + cfg%u*(psi(i,j)**3) - cfg%kappa*lap_psi
+      enddo
+    enddo
+    !$omp end parallel do
 
-        grad_sq = (psi(ip,j) - psi(i,j))**2 + (psi(i,jp) - psi(i,j))**2
-        e_field = e_field -0.5*cfg%tau*psi(i,j)**2 + 0.25*cfg%u*psi(i,j)**4 + 0.5*cfg%kappa*grad_sq
+    e_field = 0.0
+    if (present(energy)) then
+      if (.not. energy) return
+    end if
 
+    e_acc = 0.0d0
+    !$omp parallel do private(i, grad_sq) reduction(+:e_acc) schedule(static)
+    do j = 1, cfg%ny
+      do i = 1, cfg%Lx
+        grad_sq = (psi(i+1,j) - psi(i,j))**2 + (psi(i,j+1) - psi(i,j))**2
+        e_acc = e_acc -0.5*cfg%tau*psi(i,j)**2 + 0.25*cfg%u*psi(i,j)**4 + 0.5*cfg%kappa*grad_sq
       enddo
     enddo
+    !$omp end parallel do
+
+    e_field = real(e_acc)
   end subroutine calculate_mu_pure
 
+  ! mu must have a valid ghost layer; only the interior of psi is updated
   subroutine evolve_field_model_b(psi, mu, cfg)
-    real, intent(inout) :: psi(:,:)
-    real, intent(in)    :: mu(:,:)
     type(Config_t), intent(in) :: cfg
-    integer :: i, j, ip, im, jp, jm
+    real, intent(inout) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    real, intent(in)    :: mu(1-cfg%ng:, 1-cfg%ng:)
+    integer :: i, j
     real :: lap_mu
     ! Same weights for consistency
     real, parameter :: w_nn = 1.0/6.0
     real, parameter :: w_dn = 1.0/12.0
 
-    do j = 1, cfg%Ly
-      jp = modulo(j, cfg%Ly) + 1; jm = modulo(j-2+cfg%Ly, cfg%Ly) + 1
+    !$omp parallel do private(i, lap_mu) schedule(static)
+    do j = 1, cfg%ny
       do i = 1, cfg%Lx
-        ip = modulo(i, cfg%Lx) + 1; im = modulo(i-2+cfg%Lx, cfg%Lx) + 1
         ! 9-Point Laplacian of Mu
-        lap_mu = w_nn * (mu(ip,j) + mu(im,j) + mu(i,jp) + mu(i,jm)) + &
-                 w_dn * (mu(ip,jp) + mu(im,jp) + mu(ip,jm) + mu(im,jm)) - &
+        lap_mu = w_nn * (mu(i+1,j) + mu(i-1,j) + mu(i,j+1) + mu(i,j-1)) + &
+                 w_dn * (mu(i+1,j+1) + mu(i-1,j+1) + mu(i+1,j-1) + mu(i-1,j-1)) - &
                  mu(i,j)
                  
         psi(i,j) = psi(i,j) + cfg%dt * cfg%M * lap_mu
       enddo
     enddo
+    !$omp end parallel do
   end subroutine evolve_field_model_b
+
+  ! Semi-implicit Fourier-space step of Model B (alternative to the explicit
+  ! evolve_field_model_b). With lambda(k) >= 0 the symbol of minus the same
+  ! 9-point Laplacian used in real space, the explicit update
+  !     psi_k <- psi_k - dt M lambda mu_k
+  ! is stabilised by treating the stiff surface term kappa*lambda**2 and a
+  ! linear stabiliser A implicitly:
+  !     psi_k <- psi_k - dt M lambda mu_k / (1 + dt M lambda (kappa lambda + A))
+  ! mu is the full chemical potential (bulk + surface + coupling) evaluated
+  ! at the current step, so the cubic and coupling terms stay explicit. For
+  ! dt -> 0 this reduces to the finite-difference stepper, and the k=0 mode
+  ! (the mean of psi) is conserved exactly.
+  ! Serial only: the transform needs the whole lattice on one process.
+  subroutine evolve_field_spectral(psi, mu, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    real, intent(in)    :: mu(1-cfg%ng:, 1-cfg%ng:)
+    complex, allocatable :: spec_work(:,:)
+    integer :: i, j
+    real    :: norm
+
+    ! (guarded, for simulations advanced side by side on several threads)
+    !$omp critical (spectral_setup)
+    if (spec_Lx /= cfg%Lx .or. spec_Ly /= cfg%Ly) then
+      call fft_plan(fft_x, cfg%Lx)
+      call fft_plan(fft_y, cfg%Ly)
+      if (allocated(spec_gain)) deallocate(spec_gain)
+      allocate(spec_gain(cfg%Lx, cfg%Ly))
+      spec_Lx = cfg%Lx
+      spec_Ly = cfg%Ly
+      spec_key = -1.0
+    end if
+    if (any(spec_key /= [cfg%dt, cfg%M, cfg%kappa, cfg%spectral_A])) call build_spectral_gain(cfg)
+    !$omp end critical (spectral_setup)
+    allocate(spec_work(cfg%Lx, cfg%Ly))
+
+    !$omp parallel do private(i) schedule(static)
+    do j = 1, cfg%Ly
+      do i = 1, cfg%Lx
+        spec_work(i,j) = cmplx(mu(i,j), 0.0)
+      enddo
+    enddo
+    !$omp end parallel do
+
+    call fft_2d(fft_x, fft_y, spec_work, -1)
+    spec_work = spec_work * spec_gain
+    call fft_2d(fft_x, fft_y, spec_work, +1)
+
+    norm = 1.0 / real(cfg%Lx * cfg%Ly)
+    !$omp parallel do private(i) schedule(static)
+    do j = 1, cfg%Ly
+      do i = 1, cfg%Lx
+        psi(i,j) = psi(i,j) - norm * real(spec_work(i,j))
+      enddo
+    enddo
+    !$omp end parallel do
+  end subroutine evolve_field_spectral
+
+  subroutine build_spectral_gain(cfg)
+    type(Config_t), intent(in) :: cfg
+    integer :: i, j
+    real    :: ckx, cky, lambda, dtm
+
+    dtm = cfg%dt * cfg%M
+    do j = 1, cfg%Ly
+      cky = cos(TWO_PI * real(j-1) / real(cfg%Ly))
+      do i = 1, cfg%Lx
+        ckx = cos(TWO_PI * real(i-1) / real(cfg%Lx))
+        ! -lap symbol of the stencil 1/6*NN + 1/12*DN - center
+        lambda = 1.0 - (ckx + cky) / 3.0 - ckx * cky / 3.0
+        spec_gain(i,j) = dtm * lambda / &
+                         (1.0 + dtm * lambda * (cfg%kappa * lambda + cfg%spectral_A))
+      enddo
+    enddo
+    spec_key = [cfg%dt, cfg%M, cfg%kappa, cfg%spectral_A]
+  end subroutine build_spectral_gain
+
 end module mod_field
\ No newline at end of file
@@ -1,38 +1,281 @@
 module mod_io
   use mod_core_types
+  use mod_parallel
+  use mod_async_io
+  use mod_random
   implicit none
-  public :: load_parameters, initialize_system, write_data, write_stats
+  public :: load_parameters, load_parameters_text, initialize_system, distribute_state, write_data, write_stats
+
+  ! Binary snapshots (see write_data_bin)
+  ! (version 2: particle records x, y, phi, ix, iy; version 1 had x, y, phi)
+  integer, parameter :: SNAP_HEADER = 64, SNAP_VERSION = 2
+  ! Values per block of packed field snapshots (see write_field_packed)
+  integer, parameter :: PACK_BLOCK = 32
+  ! Lines of the text particle snapshots: x, y, phi and the periodic images
+  ! crossed along x and y (x + ix*Lx, y + iy*Ly are the unwrapped positions)
+  character(len=*), parameter :: PARTICLE_FMT = '(3F12.4, 2I8)'
+  ! Lines of parameters.in read, and their length
+  integer, parameter :: PARAM_LINES = 64, PARAM_LEN = 256
 
 contains
 
-  subroutine load_parameters(cfg)
+  ! Read dir/parameters.in (dir = '' or a directory name ending in '/').
+  ! Invalid parameters stop the program, or, with ok present, set it to
+  ! .false. (the reason is printed).
+  subroutine load_parameters(cfg, dir, ok)
     type(Config_t), intent(out) :: cfg
-    
-    open(unit=10, file='parameters.in', status='old', action='read')
-    
+    character(len=*), intent(in), optional :: dir
+    logical, intent(out), optional :: ok
+    character(len=PARAM_LEN) :: lines(PARAM_LINES), line
+    character(len=:), allocatable :: fname
+    integer :: n, ios
+
+    fname = 'parameters.in'
+    if (present(dir)) fname = dir // fname
+    lines = ''
+    n = 0
+    open(unit=10, file=fname, status='old', action='read', iostat=ios)
+    if (ios /= 0) then
+      print *, "Cannot open ", fname
+      cfg%dir = ''
+      call check_result(.false., ok)
+      return
+    end if
+    do
+      read(10, '(A)', iostat=ios) line
+      if (ios /= 0) exit
+      call add_line(lines, n, line)
+    end do
+    close(10)
+    call parse_parameters(cfg, lines, dir, ok)
+  end subroutine load_parameters
+
+  ! The same from the text of a parameters.in (lines separated by
+  ! newlines), for callers that do not go through a file
+  subroutine load_parameters_text(cfg, text, dir, ok)
+    type(Config_t), intent(out) :: cfg
+    character(len=*), intent(in) :: text
+    character(len=*), intent(in), optional :: dir
+    logical, intent(out), optional :: ok
+    character(len=PARAM_LEN) :: lines(PARAM_LINES)
+    integer :: n, i0, i1
+
+    lines = ''
+    n = 0
+    i0 = 1
+    do while (i0 <= len(text))
+      i1 = index(text(i0:), achar(10))
+      if (i1 == 0) i1 = len(text) - i0 + 2
+      call add_line(lines, n, text(i0:i0+i1-2))
+      i0 = i0 + i1
+    end do
+    call parse_parameters(cfg, lines, dir, ok)
+  end subroutine load_parameters_text
+
+  ! Blank lines are skipped, as list-directed reads of the file skip them,
+  ! and lines beyond PARAM_LINES are never read
+  subroutine add_line(lines, n, line)
+    character(len=*), intent(inout) :: lines(:)
+    integer, intent(inout) :: n
+    character(len=*), intent(in) :: line
+
+    if (len_trim(line) == 0 .or. n >= size(lines)) return
+    n = n + 1
+    lines(n) = line
+  end subroutine add_line
+
+  ! Invalid parameters end the program unless the caller asked for ok
+  subroutine check_result(valid, ok)
+    logical, intent(in) :: valid
+    logical, intent(out), optional :: ok
+
+    if (present(ok)) then
+      ok = valid
+    else if (.not. valid) then
+      stop 1
+    end if
+  end subroutine check_result
+
+  ! Interval of an analysis of write_stats: 0 (off) or a positive multiple
+  ! of the stats interval, so that it falls on stats steps
+  logical function interval_valid(interval, cfg)
+    integer, intent(in) :: interval
+    type(Config_t), intent(in) :: cfg
+
+    interval_valid = interval == 0 .or. &
+                     (interval > 0 .and. mod(interval, max(cfg%stats_interval, 1)) == 0)
+  end function interval_valid
+
+  ! Whether an analysis of the given interval is due at stats step t
+  logical function analysis_due(interval, t)
+    integer, intent(in) :: interval, t
+
+    analysis_due = interval > 0
+    if (analysis_due) analysis_due = mod(t, interval) == 0
+  end function analysis_due
+
+  ! cfg from the lines of parameters.in, one entry per line
+  subroutine parse_parameters(cfg, lines, dir, ok)
+    type(Config_t), intent(out) :: cfg
+    character(len=*), intent(in) :: lines(PARAM_LINES)
+    character(len=*), intent(in), optional :: dir
+    logical, intent(out), optional :: ok
+    logical :: valid
+    integer :: ios
+
+    cfg%dir = ''
+    if (present(dir)) cfg%dir = dir
+
     ! Grid and Simulation timing
-    read(10, *) cfg%Lx, cfg%Ly
-    read(10, *) cfg%Np
-    read(10, *) cfg%total_steps
-    read(10, *) cfg%save_interval
-    read(10, *) cfg%stats_interval
-    read(10, *) cfg%dt
-    
+    read(lines(1), *, iostat=ios) cfg%Lx, cfg%Ly
+    if (ios == 0) read(lines(2), *, iostat=ios) cfg%Np
+    if (ios == 0) read(lines(3), *, iostat=ios) cfg%total_steps
+    if (ios == 0) read(lines(4), *, iostat=ios) cfg%save_interval
+    if (ios == 0) read(lines(5), *, iostat=ios) cfg%stats_interval
+    if (ios == 0) read(lines(6), *, iostat=ios) cfg%dt
+
     ! Model B Parameters
-    read(10, *) cfg%M, cfg%kappa, cfg%tau, cfg%u
-    read(10, *) cfg%psimean 
-    
+    if (ios == 0) read(lines(7), *, iostat=ios) cfg%M, cfg%kappa, cfg%tau, cfg%u
+    if (ios == 0) read(lines(8), *, iostat=ios) cfg%psimean
+
     ! Coupling and Particle Parameters
-    read(10, *) cfg%sigma, cfg%affinity
-    read(10, *) cfg%Reff
-    read(10, *) cfg%epsilon, cfg%R0
-    read(10, *) cfg%temperature 
-    read(10, *) cfg%gamm_T,cfg%gamm_R
-    read(10, *) cfg%vact
-    read(10,* ) cfg%noiseStrength
-    read(10, *) cfg%custom_init
+    if (ios == 0) read(lines(9), *, iostat=ios) cfg%sigma, cfg%affinity
+    if (ios == 0) read(lines(10), *, iostat=ios) cfg%Reff
+    if (ios == 0) read(lines(11), *, iostat=ios) cfg%epsilon, cfg%R0
+    if (ios == 0) read(lines(12), *, iostat=ios) cfg%temperature
+    if (ios == 0) read(lines(13), *, iostat=ios) cfg%gamm_T, cfg%gamm_R
+    if (ios == 0) read(lines(14), *, iostat=ios) cfg%vact
+    if (ios == 0) read(lines(15), *, iostat=ios) cfg%noiseStrength
+    if (ios == 0) read(lines(16), *, iostat=ios) cfg%custom_init
+    if (ios /= 0) then
+      print *, "The first 16 lines of parameters.in are missing or unreadable"
+      call check_result(.false., ok)
+      return
+    end if
 
-    close(10)
+    ! Optional entries: older parameter files simply stop above, in which
+    ! case the defaults below are kept
+    cfg%nthreads = 0
+    cfg%field_solver = 'fd'
+    cfg%spectral_A = 2.0 * cfg%tau     ! = f''(psi_eq) of the bulk free energy
+    cfg%verlet_skin = 1.5
+    cfg%sort_interval = 100
+    cfg%coupling_table = 4096
+    cfg%rng_seed = 0
+    cfg%adapt_drift = 0.0
+    cfg%adapt_dpsi = 0.0
+    cfg%dt_level = 0
+    cfg%output_format = 'txt'
+    cfg%io_queue = 0
+    cfg%checkpoint_keep = 2
+    cfg%packed_bits = 12
+    cfg%droplet_threshold = 0.0
+    cfg%droplet_histogram = .false.
+    cfg%transport_interval = 0
+    cfg%structure_interval = 0
+    cfg%droplet_interval = 0
+    cfg%topology_interval = 0
+    read(lines(17), *, iostat=ios) cfg%nthreads
+    if (ios /= 0) cfg%nthreads = 0
+    if (ios == 0) read(lines(18), *, iostat=ios) cfg%field_solver
+    if (ios /= 0) cfg%field_solver = 'fd'
+    if (ios == 0) read(lines(19), *, iostat=ios) cfg%spectral_A
+    if (ios /= 0) cfg%spectral_A = 2.0 * cfg%tau
+    if (ios == 0) read(lines(20), *, iostat=ios) cfg%verlet_skin
+    if (ios /= 0) cfg%verlet_skin = 1.5
+    if (ios == 0) read(lines(21), *, iostat=ios) cfg%sort_interval
+    if (ios /= 0) cfg%sort_interval = 100
+    if (ios == 0) read(lines(22), *, iostat=ios) cfg%coupling_table
+    if (ios /= 0) cfg%coupling_table = 4096
+    if (ios == 0) read(lines(23), *, iostat=ios) cfg%rng_seed
+    if (ios /= 0) cfg%rng_seed = 0
+    if (ios == 0) read(lines(24), *, iostat=ios) cfg%adapt_drift, cfg%adapt_dpsi
+    if (ios /= 0) then
+      cfg%adapt_drift = 0.0
+      cfg%adapt_dpsi = 0.0
+    end if
+    if (ios == 0) read(lines(25), *, iostat=ios) cfg%output_format
+    if (ios /= 0) cfg%output_format = 'txt'
+    if (ios == 0) read(lines(26), *, iostat=ios) cfg%io_queue
+    if (ios /= 0) cfg%io_queue = 0
+    if (ios == 0) read(lines(27), *, iostat=ios) cfg%checkpoint_keep
+    if (ios /= 0) cfg%checkpoint_keep = 2
+    if (ios == 0) read(lines(28), *, iostat=ios) cfg%packed_bits
+    if (ios /= 0) cfg%packed_bits = 12
+    if (ios == 0) read(lines(29), *, iostat=ios) cfg%droplet_threshold, cfg%droplet_histogram
+    if (ios /= 0) then
+      cfg%droplet_threshold = 0.0
+      cfg%droplet_histogram = .false.
+    end if
+    if (ios == 0) read(lines(30), *, iostat=ios) cfg%transport_interval
+    if (ios /= 0) cfg%transport_interval = 0
+    if (ios == 0) read(lines(31), *, iostat=ios) cfg%structure_interval
+    if (ios /= 0) cfg%structure_interval = 0
+    if (ios == 0) read(lines(32), *, iostat=ios) cfg%droplet_interval
+    if (ios /= 0) cfg%droplet_interval = 0
+    if (ios == 0) read(lines(33), *, iostat=ios) cfg%topology_interval
+    if (ios /= 0) cfg%topology_interval = 0
+
+    valid = .true.
+    if (cfg%Lx < max(1, int(cfg%Reff) + 2) .or. cfg%Ly < max(1, int(cfg%Reff) + 2)) then
+      print *, "System too small for the coupling footprint: L >=", max(1, int(cfg%Reff) + 2)
+      valid = .false.
+    end if
+    if (cfg%field_solver /= 'fd' .and. cfg%field_solver /= 'spectral') then
+      print *, "Unknown field solver '", trim(cfg%field_solver), "' (use fd or spectral)"
+      valid = .false.
+    end if
+    if (cfg%verlet_skin < 0.0) then
+      print *, "Verlet skin must be >= 0 (0 = cell list every step)"
+      valid = .false.
+    end if
+    if (cfg%coupling_table < 0) then
+      print *, "Coupling table size must be >= 0 (0 = analytic kernel)"
+      valid = .false.
+    end if
+    if (cfg%rng_seed < 0) then
+      print *, "Random seed must be >= 0 (0 = from the clock)"
+      valid = .false.
+    end if
+    if (cfg%adapt_drift < 0.0 .or. cfg%adapt_dpsi < 0.0) then
+      print *, "Adaptive dt limits must be >= 0 (0 0 = fixed dt)"
+      valid = .false.
+    end if
+    if (cfg%output_format /= 'txt' .and. cfg%output_format /= 'bin' .and. &
+        cfg%output_format /= 'packed') then
+      print *, "Unknown output format '", trim(cfg%output_format), "' (use txt, bin or packed)"
+      valid = .false.
+    end if
+    if (cfg%io_queue < 0) then
+      print *, "Asynchronous IO queue must be >= 0 (0 = synchronous writes)"
+      valid = .false.
+    end if
+    if (cfg%checkpoint_keep < 1) then
+      print *, "Checkpoints kept must be >= 1"
+      valid = .false.
+    end if
+    if (cfg%packed_bits < 1 .or. cfg%packed_bits > 24) then
+      print *, "Bits of packed snapshots must be between 1 and 24"
+      valid = .false.
+    end if
+    if (cfg%transport_interval < 0) then
+      print *, "Transport sampling interval must be >= 0 (0 = no transport statistics)"
+      valid = .false.
+    end if
+    if (.not. interval_valid(cfg%structure_interval, cfg)) then
+      print *, "Structure factor interval must be 0 (off) or a multiple of the stats interval"
+      valid = .false.
+    end if
+    if (.not. interval_valid(cfg%droplet_interval, cfg)) then
+      print *, "Droplet interval must be 0 (off) or a multiple of the stats interval"
+      valid = .false.
+    end if
+    if (.not. interval_valid(cfg%topology_interval, cfg)) then
+      print *, "Topology interval must be 0 (off) or a multiple of the stats interval"
+      valid = .false.
+    end if
+    call check_result(valid, ok)
+    if (.not. valid) return
 
     ! Pre-calculate squared radii for performance
     cfg%Reff_2 = cfg%Reff**2
@@ -45,18 +288,24 @@ contains
     ! Yukawa cutoff
     cfg%r_cut_sq = cfg%diam**2
 
-  end subroutine load_parameters
+  end subroutine parse_parameters
 
   subroutine initialize_system(particles, psi, cfg)
-    type(Particle_t), intent(inout) :: particles(:)
+    type(Particles_t), intent(inout) :: particles   ! room for cfg%Np
     real,             intent(inout) :: psi(:,:)
     type(Config_t),   intent(in)    :: cfg
     integer :: i, j, attempts, max_attempts
-    real    :: tx, ty, dx, dy, r2, safe_dist_sq
+    real    :: tx, ty, dx, dy, r2, safe_dist_sq, u(4)
     logical :: overlapping
 
     ! 1. Initialize the Field
-    call random_number(psi)
+    do j = 1, cfg%Ly
+      do i = 1, cfg%Lx
+        call rng_uniform4(cfg%rng_seed, STREAM_INIT_FIELD, 0, &
+                          int(j - 1, 8) * cfg%Lx + (i - 1), u)
+        psi(i,j) = u(1)
+      end do
+    end do
     psi = (psi - 0.5) * 0.1 + cfg%psimean
     
     ! 2. Initialize Particles with Overlap Check
@@ -71,13 +320,14 @@ contains
         overlapping = .false.
         
         ! Generate trial position
-        call random_number(tx); tx = tx * real(cfg%Lx)
-        call random_number(ty); ty = ty * real(cfg%Ly)
+        call rng_uniform4(cfg%rng_seed, STREAM_INIT_POSITION, attempts, int(i, 8), u)
+        tx = u(1) * real(cfg%Lx)
+        ty = u(2) * real(cfg%Ly)
         
         ! Check against all already placed particles
         do j = 1, i - 1
-          dx = tx - particles(j)%x
-          dy = ty - particles(j)%y
+          dx = tx - particles%x(j)
+          dy = ty - particles%y(j)
           
           ! Minimum Image Convention (very important even at t=0)
           if (abs(dx) > cfg%Lx * 0.5) dx = dx - sign(real(cfg%Lx), dx)
@@ -93,27 +343,30 @@ contains
         ! If safe or we ran out of patience, accept the position
         if (.not. overlapping .or. attempts > max_attempts) then
           if (attempts > max_attempts) print*, "Warning: Could not find non-overlapping spot for particle", i
-          particles(i)%x = tx
-          particles(i)%y = ty
+          particles%x(i) = tx
+          particles%y(i) = ty
           exit ! Exit the attempt-loop
         end if
       end do
 
       ! Initialize other properties
-      particles(i)%fx = 0.0; particles(i)%fy = 0.0
-      particles(i)%fx_pp = 0.0; particles(i)%fy_pp = 0.0
-      call random_number(particles(i)%phi)
-      particles(i)%phi = TWO_PI * particles(i)%phi
+      particles%fx(i) = 0.0; particles%fy(i) = 0.0
+      particles%fx_pp(i) = 0.0; particles%fy_pp(i) = 0.0
+      particles%ix(i) = 0; particles%iy(i) = 0
+      call rng_uniform4(cfg%rng_seed, STREAM_INIT_ANGLE, 0, int(i, 8), u)
+      particles%phi(i) = TWO_PI * u(1)
+      particles%id(i) = i
     end do
+    particles%n = cfg%Np
   end subroutine initialize_system
 
   ! initialise custom psi
   subroutine initialize_custom_system(particles, psi, cfg)
-    type(Particle_t), intent(inout) :: particles(:)
+    type(Particles_t), intent(inout) :: particles   ! room for cfg%Np
     real,             intent(inout) :: psi(:,:)
     type(Config_t),   intent(in)    :: cfg
     integer :: i, j, attempts, max_attempts
-    real    :: tx, ty, dx, dy, r2, safe_dist_sq
+    real    :: tx, ty, dx, dy, r2, safe_dist_sq, u(4)
     logical :: overlapping
 
     ! 1. Initialize the Field custom
@@ -136,16 +389,17 @@ contains
         overlapping = .false.
         
         ! Generate trial position
-        call random_number(tx); tx = tx * real(cfg%Lx)
-        call random_number(ty); ty = ty * real(cfg%Ly)
+        call rng_uniform4(cfg%rng_seed, STREAM_INIT_POSITION, attempts, int(i, 8), u)
+        tx = u(1) * real(cfg%Lx)
+        ty = u(2) * real(cfg%Ly)
 
         ! put all particles in one half
         tx = 0.5 * tx
         
         ! Check against all already placed particles
         do j = 1, i - 1
-          dx = tx - particles(j)%x
-          dy = ty - particles(j)%y
+          dx = tx - particles%x(j)
+          dy = ty - particles%y(j)
           
           ! Minimum Image Convention (very important even at t=0)
           if (abs(dx) > cfg%Lx * 0.5) dx = dx - sign(real(cfg%Lx), dx)
@@ -161,162 +415,488 @@ contains
         ! If safe or we ran out of patience, accept the position
         if (.not. overlapping .or. attempts > max_attempts) then
           if (attempts > max_attempts) print*, "Warning: Could not find non-overlapping spot for particle", i
-          particles(i)%x = tx
-          particles(i)%y = ty
+          particles%x(i) = tx
+          particles%y(i) = ty
           exit ! Exit the attempt-loop
         end if
       end do
 
       ! Initialize other properties
-      particles(i)%fx = 0.0; particles(i)%fy = 0.0
-      particles(i)%fx_pp = 0.0; particles(i)%fy_pp = 0.0
-      call random_number(particles(i)%phi)
-      particles(i)%phi = TWO_PI * particles(i)%phi
+      particles%fx(i) = 0.0; particles%fy(i) = 0.0
+      particles%fx_pp(i) = 0.0; particles%fy_pp(i) = 0.0
+      particles%ix(i) = 0; particles%iy(i) = 0
+      call rng_uniform4(cfg%rng_seed, STREAM_INIT_ANGLE, 0, int(i, 8), u)
+      particles%phi(i) = TWO_PI * u(1)
+      particles%id(i) = i
     end do
+    particles%n = cfg%Np
   end subroutine initialize_custom_system
 
 
 
-  subroutine write_data(psi, particles, t)
-    real,             intent(in) :: psi(:,:)
-    type(Particle_t), intent(in) :: particles(:)
-    integer,          intent(in) :: t
-    integer :: p, i, j
-    character(len=64) :: pfname, ffname
+  ! Distribute the global initial state (identical on every process) over
+  ! the decomposition: the owned rows of psi and the particles lying in the
+  ! own slab, which keep their global index
+  subroutine distribute_state(psi_g, particles_g, psi, particles, cfg)
+    type(Config_t),    intent(in)    :: cfg
+    real,              intent(in)    :: psi_g(:,:)
+    type(Particles_t), intent(in)    :: particles_g
+    real,              intent(inout) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(inout) :: particles
+    integer :: p, nloc, ncap
+    logical, allocatable :: mine(:)
+
+    psi(1:cfg%Lx, 1:cfg%ny) = psi_g(:, cfg%y0+1:cfg%y0+cfg%ny)
+
+    allocate(mine(particles_g%n))
+    mine = particles_g%y(1:particles_g%n) >= real(cfg%y0) .and. &
+           particles_g%y(1:particles_g%n) <  real(cfg%y0 + cfg%ny)
+    ! room for particles drifting in and for ghost copies (see mod_parallel)
+    ncap = count(mine)
+    if (nranks > 1) ncap = 2 * ncap + 64
+    call particles_alloc(particles, ncap)
+
+    nloc = 0
+    do p = 1, particles_g%n
+      if (mine(p)) then
+        nloc = nloc + 1
+        call put_particle(particles, nloc, get_particle(particles_g, p))
+        particles%id(nloc) = particles_g%id(p)
+      end if
+    end do
+    particles%n = nloc
+  end subroutine distribute_state
+
+  ! Particles are listed by their global index. With several MPI ranks
+  ! every rank formats its own lines and writes them at their final place in
+  ! the shared file (all lines have a fixed width).
+  subroutine write_data(psi, particles, t, cfg)
+    type(Config_t),    intent(in) :: cfg
+    real,              intent(in) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(in) :: particles
+    integer,           intent(in) :: t
+    integer :: p, i, j, k, iunit
+    character(len=320) :: pfname, ffname
+    character(len=3) :: ext
+    integer, allocatable :: order(:)
     
     ! I0 will adjust the width automatically (e.g., 'particles_10.dat', 'particles_1000000.dat')
-    write(pfname, '(A,I0,A)') 'particles_', t, '.txt'
-    open(unit=20, file=trim(pfname), status='replace')
-    do p = 1, size(particles)
-      write(20, '(3F12.4)') particles(p)%x, particles(p)%y, particles(p)%phi
+    ! (packed snapshots are binary snapshots too)
+    ext = merge('txt', 'bin', cfg%output_format == 'txt')
+    write(pfname, '(A,A,I0,A)') trim(cfg%dir), 'particles_', t, '.'//ext
+    write(ffname, '(A,A,I0,A)') trim(cfg%dir), 'field_psi_', t, '.'//ext
+
+    if (cfg%output_format /= 'txt') then
+      call write_data_bin(pfname, ffname, psi, particles, t, cfg)
+      return
+    end if
+
+    ! (the queue of asynchronous IO takes the images built for MPI-IO)
+    if (nranks > 1 .or. async_io_depth() > 0) then
+      call write_data_parallel(pfname, ffname, psi, particles, cfg)
+      return
+    end if
+
+    allocate(order(particles%n))
+    order(particles%id(1:particles%n)) = [(p, p = 1, particles%n)]
+
+    open(newunit=iunit, file=trim(pfname), status='replace')
+    do p = 1, particles%n
+      k = order(p)
+      write(iunit, PARTICLE_FMT) particles%x(k), particles%y(k), particles%phi(k), &
+                                particles%ix(k), particles%iy(k)
     end do
-    close(20)
+    close(iunit)
 
-    write(ffname, '(A,I0,A)') 'field_psi_', t, '.txt'
-    open(unit=30, file=trim(ffname), status='replace')
-    do j = 1, size(psi, 2)
-      do i = 1, size(psi, 1)
-        write(30, '(2I6, F12.6)') i, j, psi(i,j)
+    open(newunit=iunit, file=trim(ffname), status='replace')
+    do j = 1, cfg%Ly
+      do i = 1, cfg%Lx
+        write(iunit, '(2I6, F12.6)') i, j, psi(i,j)
       end do
-      write(30, *) 
+      write(iunit, '(A)') ''     ! empty line, as write_data_parallel writes it
     end do
-    close(30)
+    close(iunit)
   end subroutine write_data
 
+  subroutine write_data_parallel(pfname, ffname, psi, particles, cfg)
+    character(len=*),  intent(in) :: pfname, ffname
+    type(Config_t),    intent(in) :: cfg
+    real,              intent(in) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(in) :: particles
+    integer, parameter :: plen = 53, flen = 25   ! line widths incl. newline
+    character(len=plen-1) :: pline
+    character(len=flen-1) :: fline
+    character(len=1), allocatable :: bytes(:)
+    integer(kind=8),  allocatable :: offsets(:)
+    integer,          allocatable :: lengths(:)
+    integer :: p, i, j, pos, rowlen
+
+    ! (the lines have fixed widths, so the threads format them in place)
+    ! Particles: one fixed-width line each, placed by global index
+    allocate(bytes(particles%n * plen), offsets(particles%n), lengths(particles%n))
+    !$omp parallel do private(pline, pos) schedule(static)
+    do p = 1, particles%n
+      write(pline, PARTICLE_FMT) particles%x(p), particles%y(p), particles%phi(p), &
+                                 particles%ix(p), particles%iy(p)
+      offsets(p) = int(particles%id(p) - 1, 8) * plen
+      lengths(p) = plen
+      pos = (p - 1) * plen + 1
+      call put_line(bytes, pos, pline)
+    end do
+    !$omp end parallel do
+    call async_write_blocks(trim(pfname), bytes, offsets, lengths)
+    deallocate(bytes, offsets, lengths)
+
+    ! Field: the owned rows form one contiguous block of the file
+    rowlen = cfg%Lx * flen + 1
+    allocate(bytes(cfg%ny * rowlen), offsets(1), lengths(1))
+    !$omp parallel do private(i, fline, pos) schedule(static)
+    do j = 1, cfg%ny
+      pos = (j - 1) * rowlen + 1
+      do i = 1, cfg%Lx
+        write(fline, '(2I6, F12.6)') i, cfg%y0 + j, psi(i,j)
+        call put_line(bytes, pos, fline)
+      end do
+      bytes(pos) = achar(10)
+    end do
+    !$omp end parallel do
+    offsets(1) = int(cfg%y0, 8) * rowlen
+    lengths(1) = size(bytes)
+    call async_write_blocks(trim(ffname), bytes, offsets, lengths)
+  end subroutine write_data_parallel
+
+  ! Binary snapshots (output format 'bin'): a header of SNAP_HEADER bytes,
+  !   'HABPSNAP', then 32-bit integers version, kind (1 = field,
+  !   2 = particles, 3 = packed field), step, Lx, Ly, Np, bytes per real, values per record,
+  !   zero padding,
+  ! followed by the reals in native byte order: psi(i,j) with i running
+  ! fastest (the order of the text files), or x, y, phi, ix, iy of each
+  ! particle in the order of their global index (the image counters as
+  ! reals, exact below 2**24). Tools/python/snapshot_io.py reads them.
+  subroutine write_data_bin(pfname, ffname, psi, particles, t, cfg)
+    character(len=*),  intent(in) :: pfname, ffname
+    type(Config_t),    intent(in) :: cfg
+    real,              intent(in) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    type(Particles_t), intent(in) :: particles
+    integer,           intent(in) :: t
+    character(len=1), allocatable :: bytes(:)
+    integer(kind=8),  allocatable :: offsets(:)
+    integer,          allocatable :: lengths(:)
+    integer, allocatable :: order(:)
+    real,    allocatable :: rec(:,:)
+    integer :: p, n, hlen, nb
+
+    ! (the header is written by the first process only)
+    hlen = merge(SNAP_HEADER, 0, rank == 0)
+    n = particles%n
+    nb = 5 * WP_BYTES
+
+    ! Particles: serially one block in index order, otherwise one block
+    ! per particle placed by its global index
+    allocate(rec(5, n))
+    if (nranks == 1) then
+      allocate(order(n), offsets(2), lengths(2))
+      order(particles%id(1:n)) = [(p, p = 1, n)]
+      rec(1,:) = particles%x(order)
+      rec(2,:) = particles%y(order)
+      rec(3,:) = particles%phi(order)
+      rec(4,:) = real(particles%ix(order))
+      rec(5,:) = real(particles%iy(order))
+      offsets(2) = SNAP_HEADER
+      lengths(2) = n * nb
+    else
+      allocate(offsets(n+1), lengths(n+1))
+      rec(1,:) = particles%x(1:n)
+      rec(2,:) = particles%y(1:n)
+      rec(3,:) = particles%phi(1:n)
+      rec(4,:) = real(particles%ix(1:n))
+      rec(5,:) = real(particles%iy(1:n))
+      offsets(2:) = SNAP_HEADER + int(particles%id(1:n) - 1, 8) * nb
+      lengths(2:) = nb
+    end if
+    offsets(1) = 0
+    lengths(1) = hlen
+    bytes = [snapshot_header(2, t, 5, cfg), transfer(rec, 'a', n * nb)]
+    call async_write_blocks(trim(pfname), bytes(SNAP_HEADER-hlen+1:), offsets, lengths)
+
+    if (cfg%output_format == 'packed') then
+      call write_field_packed(ffname, psi, t, cfg)
+      return
+    end if
+
+    ! Field: the owned rows form one contiguous block of the file
+    bytes = [snapshot_header(1, t, 1, cfg), &
+             transfer(psi(1:cfg%Lx, 1:cfg%ny), 'a', cfg%Lx * cfg%ny * WP_BYTES)]
+    deallocate(offsets, lengths)
+    allocate(offsets(2), lengths(2))
+    offsets(1) = 0
+    lengths(1) = hlen
+    offsets(2) = SNAP_HEADER + int(cfg%y0, 8) * cfg%Lx * WP_BYTES
+    lengths(2) = cfg%Lx * cfg%ny * WP_BYTES
+    call async_write_blocks(trim(ffname), bytes(SNAP_HEADER-hlen+1:), offsets, lengths)
+  end subroutine write_data_bin
+
+  ! Packed field snapshots (output format 'packed'): psi is quantised on
+  ! the range [psimin, psimax] of the snapshot to packed_bits bits,
+  !   psi = psimin + k*dq,  k = 0 .. 2**bits-1,  dq = (psimax-psimin)/(2**bits-1),
+  ! so that every value is restored to within dq/2. Along each row the
+  ! differences of k (the first one from 0) are mapped to z >= 0 (2d for
+  ! d >= 0, -2d-1 for d < 0) and stored in blocks of PACK_BLOCK values of
+  ! w bits each, w being the width of the largest z of the block: the
+  ! smooth domains of a coarsening run take few bits, the interfaces more.
+  ! The file holds the header (kind 3; bits, PACK_BLOCK, psimin and dq in
+  ! its padding), the widths of all blocks (one byte each, row by row, the
+  ! last block of a row padded with z = 0), then the blocks, 4w bytes each,
+  ! value m of a block in bits m*w .. m*w+w-1 (least significant first).
+  subroutine write_field_packed(ffname, psi, t, cfg)
+    character(len=*), intent(in) :: ffname
+    type(Config_t),   intent(in) :: cfg
+    real,             intent(in) :: psi(1-cfg%ng:, 1-cfg%ng:)
+    integer,          intent(in) :: t
+    character(len=1), allocatable :: bytes(:), widths(:)
+    character(len=1) :: h(SNAP_HEADER)
+    integer(kind=8) :: z(PACK_BLOCK), k, kprev, kmax, acc, npack, offsets(3)
+    integer :: lengths(3), nbx, i, j, b, m, w, nacc, hlen, ib
+    real(kind=8) :: psimin, psimax, dq
+
+    nbx = (cfg%Lx + PACK_BLOCK - 1) / PACK_BLOCK
+    psimin = -par_max(-minval(psi(1:cfg%Lx, 1:cfg%ny)))
+    psimax = par_max(maxval(psi(1:cfg%Lx, 1:cfg%ny)))
+    kmax = 2_8**cfg%packed_bits - 1
+    dq = max((psimax - psimin) / kmax, tiny(dq))
+
+    ! (a block takes at most packed_bits+1 bits per value)
+    allocate(widths(nbx * cfg%ny), bytes(nbx * cfg%ny * PACK_BLOCK / 8 * (cfg%packed_bits + 1)))
+    npack = 0
+    ib = 0
+    do j = 1, cfg%ny
+      kprev = 0
+      do b = 1, nbx
+        z = 0
+        do m = 1, min(PACK_BLOCK, cfg%Lx - (b - 1) * PACK_BLOCK)
+          i = (b - 1) * PACK_BLOCK + m
+          k = min(max(nint((psi(i,j) - psimin) / dq, kind=8), 0_8), kmax)
+          z(m) = merge(2 * (k - kprev), -2 * (k - kprev) - 1, k >= kprev)
+          kprev = k
+        end do
+        w = 64 - leadz(maxval(z))
+        ib = ib + 1
+        widths(ib) = achar(w)
+        ! pack the w low bits of every value, emitting whole bytes
+        acc = 0
+        nacc = 0
+        do m = 1, PACK_BLOCK
+          acc = ior(acc, shiftl(z(m), nacc))
+          nacc = nacc + w
+          do while (nacc >= 8)
+            npack = npack + 1
+            bytes(npack) = achar(iand(acc, 255_8))
+            acc = shiftr(acc, 8)
+            nacc = nacc - 8
+          end do
+        end do
+      end do
+    end do
+
+    ! header, widths of the owned rows, then the blocks after those of the
+    ! processes of lower rank
+    h = snapshot_header(3, t, 1, cfg)
+    h(41:48) = transfer([integer(kind=4) :: cfg%packed_bits, PACK_BLOCK], 'a', 8)
+    h(49:64) = transfer([psimin, dq], 'a', 16)
+    hlen = merge(SNAP_HEADER, 0, rank == 0)
+    offsets(1) = 0
+    lengths(1) = hlen
+    offsets(2) = SNAP_HEADER + int(cfg%y0, 8) * nbx
+    lengths(2) = nbx * cfg%ny
+    offsets(3) = SNAP_HEADER + int(cfg%Ly, 8) * nbx + par_exscan(npack)
+    lengths(3) = int(npack)
+    bytes = [h(SNAP_HEADER-hlen+1:), widths, bytes(1:npack)]
+    call async_write_blocks(trim(ffname), bytes, offsets, lengths)
+  end subroutine write_field_packed
+
+  function snapshot_header(kind, t, ncols, cfg) result(h)
+    integer,        intent(in) :: kind, t, ncols
+    type(Config_t), intent(in) :: cfg
+    character(len=1) :: h(SNAP_HEADER)
+
+    h = achar(0)
+    h(1:8) = transfer('HABPSNAP', 'a', 8)
+    h(9:40) = transfer([integer(kind=4) :: SNAP_VERSION, kind, t, cfg%Lx, cfg%Ly, cfg%Np, &
+                        WP_BYTES, ncols], 'a', 32)
+  end function snapshot_header
+
+  ! Copy a line followed by a newline into a byte buffer
+  subroutine put_line(bytes, pos, line)
+    character(len=1), intent(inout) :: bytes(:)
+    integer,          intent(inout) :: pos
+    character(len=*), intent(in)    :: line
+    integer :: k
+
+    do k = 1, len(line)
+      bytes(pos) = line(k:k)
+      pos = pos + 1
+    end do
+    bytes(pos) = achar(10)
+    pos = pos + 1
+  end subroutine put_line
+
 subroutine write_stats(t, psi, particles, cfg, energy)
     use mod_stats  ! To access calculate_domain_size
     integer,        intent(in) :: t
-    real,           intent(in) :: psi(:,:)
-    type(Particle_t), intent(in) :: particles(:)
     type(Config_t),   intent(in) :: cfg
+    real,           intent(in) :: psi(1-cfg%ng:, 1-cfg%ng:)   ! ghost-padded
+    type(Particles_t), intent(in) :: particles
     type(Energy_t),   intent(in) :: energy
     
+    type(Energy_t) :: etot
+    type(Topology_t) :: topo
     real    :: domain_size, e_total
-    real :: psiavg, psiabsavg
-    logical :: op_energy, op_stats
-    logical :: file_exists
-
-    ! 1. Calculate the physics-based statistics
-    call calculate_domain_size(psi, cfg, domain_size)
+    real :: psiavg, psiabsavg, k1, dk
+    real, allocatable :: sk(:)
+    integer, allocatable :: sizes(:), hist(:)
+    real(kind=8) :: a1, a2
+    integer :: iunit, ew, ed, n, nk, ndrop, nbins, b
+    character(len=32) :: fmt
+    logical :: file_exists, sk_due, drop_due, topo_due
+
+    ! 1. Calculate the physics-based statistics (the topology of the
+    ! psi < psimean phase comes with the domain size, every
+    ! topology_interval steps)
+    topo_due = analysis_due(cfg%topology_interval, t)
+    if (topo_due) then
+      call calculate_domain_size(psi, cfg, domain_size, topo)
+    else
+      call calculate_domain_size(psi, cfg, domain_size)
+    end if
 
     ! calculate mean value of psi and mean abolute value of psi with respect to average value 
     call psi_averages( psi, cfg, psiavg, psiabsavg )
 
-    e_total = energy%field + energy%pp + energy%coupling
+    ! circularly averaged structure factor and its first moment, every
+    ! structure_interval steps (the whole field is gathered and transformed)
+    sk_due = analysis_due(cfg%structure_interval, t)
+    nk = min(cfg%Lx, cfg%Ly) / 2
+    if (sk_due) then
+      allocate(sk(nk))
+      call structure_factor(psi, cfg, sk, k1)
+    end if
 
-    ! 2. Handle Free Energy File (Unit 40)
-    inquire(unit=40, opened=op_energy)
-    if (.not. op_energy) then
-        inquire(file='free_energy.dat', exist=file_exists)
-        ! Use 'append' to add to the end of the file instead of replacing
-        open(40, file='free_energy.dat', status='unknown', position='append')
-        
-        ! Only write header if the file didn't exist before
-        if (.not. file_exists) then
-            write(40, '(A10, 4A15)') "# Step", "E_Field", "E_PP", "E_Coupling", "E_Total"
-        end if
+    ! droplets of the psi < threshold phase, every droplet_interval steps
+    ! (labelled on the first process, see label_droplets)
+    drop_due = analysis_due(cfg%droplet_interval, t)
+    if (drop_due) call label_droplets(psi, cfg, cfg%droplet_threshold, sizes, ndrop)
+
+    ! energies are accumulated per process
+    etot%field    = par_sum(energy%field)
+    etot%pp       = par_sum(energy%pp)
+    etot%coupling = par_sum(energy%coupling)
+    e_total = etot%field + etot%pp + etot%coupling
+
+    ! only the first process writes
+    if (rank /= 0) return
+
+    ! 2. Handle Free Energy File (appended to, and closed again so that
+    ! several simulations of a batch can write side by side). The header
+    ! names the working precision, and double precision builds write all
+    ! the digits they have.
+    if (WP_BYTES == 8) then
+      ew = 24; ed = 15
+    else
+      ew = 15; ed = 6
     end if
-    write(40, '(I10, 4ES15.6)') t, energy%field, energy%pp, energy%coupling, e_total
-    flush(40)
-
-    ! 3. Handle Statistics File (Unit 41)
-    inquire(unit=41, opened=op_stats)
-    if (.not. op_stats) then
-        inquire(file='stats.dat', exist=file_exists)
-        open(41, file='stats.dat', status='unknown', position='append')
-        
-        if (.not. file_exists) then
-            write(41, '(A10, 3A20)') "# Step", "Domain_Size", "Avg_psi", "Avg_abs_psi"
-        end if
+    inquire(file=trim(cfg%dir)//'free_energy.dat', exist=file_exists)
+    open(newunit=iunit, file=trim(cfg%dir)//'free_energy.dat', status='unknown', &
+         position='append')
+    ! Only write header if the file didn't exist before
+    if (.not. file_exists) then
+        write(fmt, '(A, I0, A)') '(A10, 4A', ew, ', 3X, 3A)'
+        write(iunit, fmt) "# Step", "E_Field", "E_PP", "E_Coupling", "E_Total", &
+                          "(", WP_NAME, ")"
     end if
-    write(41, '(I10, 3ES20.8E2)') t, domain_size, psiavg, psiabsavg
-    flush(41)
+    write(fmt, '(A, I0, A, I0, A)') '(I10, 4ES', ew, '.', ed, ')'
+    write(iunit, fmt) t, etot%field, etot%pp, etot%coupling, e_total
+    close(iunit)
 
-  end subroutine write_stats
+    ! 3. Handle Statistics File
+    inquire(file=trim(cfg%dir)//'stats.dat', exist=file_exists)
+    open(newunit=iunit, file=trim(cfg%dir)//'stats.dat', status='unknown', position='append')
+    if (.not. file_exists) then
+        write(fmt, '(A, I0, A)') '(A10, 3A', ew + 5, ', 3X, 3A)'
+        write(iunit, fmt) "# Step", "Domain_Size", "Avg_psi", "Avg_abs_psi", &
+                          "(", WP_NAME, ")"
+    end if
+    write(fmt, '(A, I0, A, I0, A)') '(I10, 3ES', ew + 5, '.', ed + 2, 'E2)'
+    write(iunit, fmt) t, domain_size, psiavg, psiabsavg
+    close(iunit)
 
-  subroutine calculate_domain_size(psi, cfg, avg_size)
-        real,    intent(in)  :: psi(:,:)
-        type(Config_t), intent(in) :: cfg
-        real,    intent(out) :: avg_size
-        integer :: i, j, crossings
-        
-        crossings = 0
-
-        ! Count sign changes relative to the mean field value
-        ! Horizontal crossings
-        do j = 1, cfg%Ly
-            do i = 1, cfg%Lx
-                if ((psi(i,j) - cfg%psimean) * &
-                    (psi(modulo(i, cfg%Lx)+1, j) - cfg%psimean) < 0.0) then
-                    crossings = crossings + 1
-                end if
-            end do
-        end do
+    ! 4. Structure factor: one line per step, k1, 2 pi / k1, then S(k) at
+    ! the wave numbers k = n * 2 pi / min(Lx, Ly) of the second header line
+    if (sk_due) then
+      inquire(file=trim(cfg%dir)//'structure_factor.dat', exist=file_exists)
+      open(newunit=iunit, file=trim(cfg%dir)//'structure_factor.dat', status='unknown', &
+           position='append')
+      if (.not. file_exists) then
+          dk = TWO_PI / min(cfg%Lx, cfg%Ly)
+          write(fmt, '(A, I0, A)') '(A10, 2A', ew, ', A, 3A)'
+          write(iunit, fmt) "# Step", "k1", "2pi/k1", "   S(k) ...", " (", WP_NAME, ")"
+          write(fmt, '(A, I0, A, I0, A, I0, A, I0, A)') '(A10, ', 2 * ew, 'X, ', nk, 'ES', ew, '.', ed, ')'
+          write(iunit, fmt) "# k", (n * dk, n = 1, nk)
+      end if
+      write(fmt, '(A, I0, A, I0, A, I0, A)') '(I10, ', nk + 2, 'ES', ew, '.', ed, ')'
+      write(iunit, fmt) t, k1, TWO_PI / max(k1, tiny(k1)), sk
+      close(iunit)
+    end if
 
-        ! Vertical crossings
-        do i = 1, cfg%Lx
-            do j = 1, cfg%Ly
-                if ((psi(i,j) - cfg%psimean) * &
-                    (psi(i, modulo(j, cfg%Ly)+1) - cfg%psimean) < 0.0) then
-                    crossings = crossings + 1
-                end if
-            end do
-        end do
+    ! 5. Droplets: number, mean size <A>, weighted mean size <A^2>/<A>,
+    ! largest size (in sites) and area fraction; with the histogram, the
+    ! number of droplets with 2^b <= A < 2^(b+1) for b = 0, 1, ...
+    if (drop_due) then
+      a1 = sum(real(sizes, 8))
+      a2 = sum(real(sizes, 8)**2)
+      inquire(file=trim(cfg%dir)//'droplets.dat', exist=file_exists)
+      open(newunit=iunit, file=trim(cfg%dir)//'droplets.dat', status='unknown', &
+           position='append')
+      if (.not. file_exists) then
+          write(iunit, '(A10, A10, 4A15)', advance='no') "# Step", "Number", "Mean_size", &
+                                                        "Weighted_size", "Max_size", "Fraction"
+          if (cfg%droplet_histogram) write(iunit, '(A)', advance='no') "   N(2^b <= A < 2^(b+1)), b = 0 ..."
+          write(iunit, '(A)') ''
+      end if
+      write(iunit, '(I10, I10, 2ES15.6, I15, ES15.6)', advance='no') t, ndrop, &
+          a1 / max(ndrop, 1), a2 / max(a1, 1.0d0), max(maxval(sizes), 0), &
+          a1 / (real(cfg%Lx, 8) * cfg%Ly)
+      if (cfg%droplet_histogram) then
+          nbins = bit_size(nbins) - leadz(cfg%Lx * cfg%Ly)
+          allocate(hist(nbins))
+          hist = 0
+          do n = 1, ndrop
+              b = bit_size(nbins) - leadz(sizes(n))
+              hist(b) = hist(b) + 1
+          end do
+          write(fmt, '(A, I0, A)') '(', nbins, 'I8)'
+          write(iunit, fmt, advance='no') hist
+      end if
+      write(iunit, '(A)') ''
+      close(iunit)
+    end if
 
-        ! L ~ 2 * Area / Total Interface Length
-        if (crossings > 0) then
-            avg_size = (2.0 * real(cfg%Lx * cfg%Ly)) / real(crossings)
-        else
-            avg_size = real(cfg%Lx) 
-        end if
-    end subroutine calculate_domain_size
-
-  subroutine save_checkpoint(filename, t, psi, particles)
-    character(len=*), intent(in) :: filename
-    integer, intent(in)          :: t
-    real, intent(in)             :: psi(:,:)
-    type(Particle_t), intent(in) :: particles(:)
-    integer :: iunit
-
-    open(newunit=iunit, file=filename, form='unformatted', status='replace')
-    write(iunit) t
-    write(iunit) psi
-    write(iunit) particles
-    close(iunit)
-  end subroutine
-
-  subroutine load_checkpoint(filename, t, psi, particles)
-    character(len=*), intent(in) :: filename
-    integer, intent(out)         :: t
-    real, intent(out)            :: psi(:,:)
-    type(Particle_t), intent(out):: particles(:)
-    integer :: iunit
-
-    open(newunit=iunit, file=filename, form='unformatted', status='old')
-    read(iunit) t
-    read(iunit) psi
-    read(iunit) particles
-    close(iunit)
-  end subroutine
+    ! 6. Topology of the psi < psimean phase: vertices, edges and faces,
+    ! Euler characteristic, interface length (in lattice spacings) and the
+    ! area fractions of the psi < psimean and psi >= psimean phases
+    if (topo_due) then
+      inquire(file=trim(cfg%dir)//'topology.dat', exist=file_exists)
+      open(newunit=iunit, file=trim(cfg%dir)//'topology.dat', status='unknown', &
+           position='append')
+      if (.not. file_exists) then
+          write(iunit, '(A10, 5A12, 2A15)') "# Step", "V", "E", "F", "Euler", "Length", &
+                                            "Fraction_low", "Fraction_high"
+      end if
+      a1 = topo%nv / (real(cfg%Lx, 8) * cfg%Ly)
+      write(iunit, '(I10, 5I12, 2ES15.6)') t, topo%nv, topo%ne, topo%nf, topo%euler, &
+                                           topo%length, a1, 1.0d0 - a1
+      close(iunit)
+    end if
+
+  end subroutine write_stats
 
 end module mod_io
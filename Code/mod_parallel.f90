@@ -0,0 +1,198 @@
+module mod_parallel
+  ! Domain decomposition layer, single-process version.
+  ! The MPI build (`make MPI=1`) replaces this file by mod_parallel_mpi.f90,
+  ! which provides the same module with slabs along y distributed over ranks.
+  !
+  ! Fields are stored with ng ghost layers, a(1-ng:Lx+ng, 1-ng:ny+ng), where
+  ! rows 1..ny are the global rows y0+1..y0+ny owned by this process (here
+  ! y0 = 0, ny = Ly). ng is large enough to hold the coupling footprint of a
+  ! particle, so neither the stencils nor the coupling need modulo indices.
+  use mod_core_types
+  implicit none
+  public
+
+  integer, save :: rank = 0, nranks = 1
+
+  interface par_sum
+    module procedure par_sum_real, par_sum_int, par_sum_int8
+  end interface par_sum
+
+  interface par_bcast
+    module procedure par_bcast_int, par_bcast_field, par_bcast_particles
+  end interface par_bcast
+
+contains
+
+  subroutine par_init()
+  end subroutine par_init
+
+  subroutine par_finalize()
+  end subroutine par_finalize
+
+  subroutine par_abort(code)
+    integer, intent(in) :: code
+    stop code
+  end subroutine par_abort
+
+  ! Ghost width and the slab owned by this process
+  subroutine par_decompose(cfg)
+    type(Config_t), intent(inout) :: cfg
+
+    cfg%ng = max(1, int(cfg%Reff) + 2)
+    cfg%y0 = 0
+    cfg%ny = cfg%Ly
+    if (cfg%Lx < cfg%ng .or. cfg%Ly < cfg%ng) then
+      print *, "System too small for the coupling footprint: L >=", cfg%ng
+      stop 1
+    end if
+  end subroutine par_decompose
+
+  ! Fill the ghost layers of a(1-ng:Lx+ng, 1-ng:ny+ng) with periodic images
+  subroutine halo_exchange(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    ! Left/right columns first, then whole rows (this also fills the corners)
+    a(1-ng:0,     1:ny) = a(nx-ng+1:nx, 1:ny)
+    a(nx+1:nx+ng, 1:ny) = a(1:ng,       1:ny)
+    a(:, 1-ng:0)     = a(:, ny-ng+1:ny)
+    a(:, ny+1:ny+ng) = a(:, 1:ng)
+  end subroutine halo_exchange
+
+  ! Reset the ghost layers before contributions are accumulated into them
+  subroutine halo_clear(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    a(:, 1-ng:0)     = 0.0
+    a(:, ny+1:ny+ng) = 0.0
+    a(1-ng:0,     1:ny) = 0.0
+    a(nx+1:nx+ng, 1:ny) = 0.0
+  end subroutine halo_clear
+
+  ! Add what was accumulated in the ghost layers to the cells they are
+  ! images of (reverse of halo_exchange) and clear the ghost layers
+  subroutine halo_fold(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    ! Whole rows first (they carry the corners), then the columns
+    a(:, ny-ng+1:ny) = a(:, ny-ng+1:ny) + a(:, 1-ng:0)
+    a(:, 1:ng)       = a(:, 1:ng)       + a(:, ny+1:ny+ng)
+    a(nx-ng+1:nx, 1:ny) = a(nx-ng+1:nx, 1:ny) + a(1-ng:0,     1:ny)
+    a(1:ng,       1:ny) = a(1:ng,       1:ny) + a(nx+1:nx+ng, 1:ny)
+    call halo_clear(a, cfg)
+  end subroutine halo_fold
+
+  function par_sum_real(x) result(s)
+    real, intent(in) :: x
+    real :: s
+    s = x
+  end function par_sum_real
+
+  function par_sum_int(x) result(s)
+    integer, intent(in) :: x
+    integer :: s
+    s = x
+  end function par_sum_int
+
+  function par_sum_int8(x) result(s)
+    integer(kind=8), intent(in) :: x
+    integer(kind=8) :: s
+    s = x
+  end function par_sum_int8
+
+  function par_max(x) result(s)
+    real, intent(in) :: x
+    real :: s
+    s = x
+  end function par_max
+
+  ! Sum of x over the processes of lower rank (0 on the first one)
+  function par_exscan(x) result(s)
+    integer(kind=8), intent(in) :: x
+    integer(kind=8) :: s
+    s = 0 * x
+  end function par_exscan
+
+  ! The owned rows of a of all processes as g(Lx, Ly) on the first one
+  subroutine par_gather_field(a, g, cfg)
+    type(Config_t), intent(in)    :: cfg
+    real,           intent(in)    :: a(1-cfg%ng:, 1-cfg%ng:)
+    real,           intent(inout) :: g(:,:)
+    g = a(1:cfg%Lx, 1:cfg%Ly)
+  end subroutine par_gather_field
+
+  ! Values vals(:,p) of the owned particles p = 1..n as g(:, id(p)) on the
+  ! first process, that is in the order of their global index
+  subroutine par_gather_particles(vals, id, n, g)
+    real(kind=8), intent(in)    :: vals(:,:)
+    integer,      intent(in)    :: id(:), n
+    real(kind=8), intent(inout) :: g(:,:)
+    integer :: p
+
+    do p = 1, n
+      g(:, id(p)) = vals(:, p)
+    end do
+  end subroutine par_gather_particles
+
+  ! The broadcasts and the particle exchanges have nothing to do with one
+  ! process (the arguments are only referenced in dead branches, to keep
+  ! the -Wall build quiet)
+  subroutine par_bcast_int(x)
+    integer, intent(inout) :: x
+    if (.false.) x = 0
+  end subroutine par_bcast_int
+
+  subroutine par_bcast_field(a)
+    real, intent(inout) :: a(:,:)
+    if (.false.) a = 0.0
+  end subroutine par_bcast_field
+
+  subroutine par_bcast_particles(particles)
+    type(Particles_t), intent(inout) :: particles
+    if (.false.) particles%n = 0
+  end subroutine par_bcast_particles
+
+  ! Particles are never handed over between processes here
+  subroutine migrate_particles(particles, cfg)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    if (.false.) particles%n = cfg%Np
+  end subroutine migrate_particles
+
+  ! No ghost particles: periodicity is handled by the cell list itself
+  subroutine exchange_ghosts(particles, cfg)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    particles%nghost = 0
+    if (.false.) particles%nghost = cfg%Np
+  end subroutine exchange_ghosts
+
+  ! Write blocks of bytes at the given 0-based file offsets. Collective in the
+  ! MPI build, where every rank contributes its own blocks to one file.
+  subroutine par_write_blocks(filename, bytes, offsets, lengths)
+    character(len=*), intent(in) :: filename
+    character(len=1), intent(in) :: bytes(:)
+    integer(kind=8),  intent(in) :: offsets(:)
+    integer,          intent(in) :: lengths(:)
+    integer(kind=8) :: pos
+    integer :: iunit, b
+
+    open(newunit=iunit, file=filename, access='stream', form='unformatted', &
+         status='replace')
+    pos = 1
+    do b = 1, size(offsets)
+      if (lengths(b) > 0) write(iunit, pos=offsets(b)+1) bytes(pos:pos+lengths(b)-1)
+      pos = pos + lengths(b)
+    end do
+    close(iunit)
+  end subroutine par_write_blocks
+
+end module mod_parallel
@@ -0,0 +1,444 @@
+module mod_parallel
+  ! Domain decomposition layer, MPI version (`make MPI=1`).
+  ! The lattice is cut into slabs along y, one per rank. Rank r owns the
+  ! global rows y0+1..y0+ny and the particles with y0 <= y < y0+ny.
+  !
+  ! Fields are stored with ng ghost layers, a(1-ng:Lx+ng, 1-ng:ny+ng). Ghost
+  ! rows are exchanged with the ranks below/above, ghost columns are local
+  ! periodic images. ng is large enough to hold the coupling footprint of a
+  ! particle, which may therefore overlap the neighbouring slabs.
+  use mpi
+  use mod_core_types
+  implicit none
+  public
+
+  integer, save :: rank = 0, nranks = 1
+  ! MPI datatype of the default real (see wp)
+  integer, parameter, private :: MPI_WP = merge(MPI_DOUBLE_PRECISION, MPI_REAL, WP_BYTES == 8)
+  integer, save, private :: down = 0, up = 0     ! neighbouring ranks along y
+  real,    save, private :: ghost_band = 0.0     ! depth of the ghost particle layer
+
+  interface par_sum
+    module procedure par_sum_real, par_sum_int, par_sum_int8
+  end interface par_sum
+
+  interface par_bcast
+    module procedure par_bcast_int, par_bcast_field, par_bcast_particles
+  end interface par_bcast
+
+contains
+
+  subroutine par_init()
+    integer :: ierr
+    call MPI_Init(ierr)
+    call MPI_Comm_rank(MPI_COMM_WORLD, rank, ierr)
+    call MPI_Comm_size(MPI_COMM_WORLD, nranks, ierr)
+    down = modulo(rank - 1, nranks)
+    up   = modulo(rank + 1, nranks)
+  end subroutine par_init
+
+  subroutine par_finalize()
+    integer :: ierr
+    call MPI_Finalize(ierr)
+  end subroutine par_finalize
+
+  subroutine par_abort(code)
+    integer, intent(in) :: code
+    integer :: ierr
+    call MPI_Abort(MPI_COMM_WORLD, code, ierr)
+  end subroutine par_abort
+
+  ! Ghost width and the slab owned by this rank
+  subroutine par_decompose(cfg)
+    type(Config_t), intent(inout) :: cfg
+    integer :: ncy
+
+    cfg%ng = max(1, int(cfg%Reff) + 2)
+    cfg%y0 = (rank * cfg%Ly) / nranks
+    cfg%ny = ((rank + 1) * cfg%Ly) / nranks - cfg%y0
+
+    ! Ghost particles: two rows of the particle cell list (see compute_pp_forces)
+    ncy = max(3, int(real(cfg%Ly) / sqrt(cfg%r_cut_sq)))
+    ghost_band = 2.0 * real(cfg%Ly) / real(ncy)
+
+    if (cfg%Lx < cfg%ng .or. cfg%ny < cfg%ng .or. &
+        (nranks > 1 .and. real(cfg%ny) <= 2.0 * ghost_band + 1.0)) then
+      if (rank == 0) print *, "Slabs too thin: Ly/nranks must exceed", &
+                              max(cfg%ng, int(2.0 * ghost_band) + 2)
+      call par_abort(1)
+    end if
+  end subroutine par_decompose
+
+  ! Fill the ghost layers of a(1-ng:Lx+ng, 1-ng:ny+ng): columns are periodic
+  ! images within the slab, rows come from the neighbouring ranks
+  subroutine halo_exchange(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny, n, ierr
+    real, allocatable :: sbuf(:,:), rbuf(:,:)
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    a(1-ng:0,     1:ny) = a(nx-ng+1:nx, 1:ny)
+    a(nx+1:nx+ng, 1:ny) = a(1:ng,       1:ny)
+
+    allocate(sbuf(1-ng:nx+ng, ng), rbuf(1-ng:nx+ng, ng))
+    n = size(sbuf)
+
+    ! top rows go up, the rows from below fill the lower ghost layer
+    sbuf = a(:, ny-ng+1:ny)
+    call MPI_Sendrecv(sbuf, n, MPI_WP, up,   1, rbuf, n, MPI_WP, down, 1, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    a(:, 1-ng:0) = rbuf
+
+    ! bottom rows go down, the rows from above fill the upper ghost layer
+    sbuf = a(:, 1:ng)
+    call MPI_Sendrecv(sbuf, n, MPI_WP, down, 2, rbuf, n, MPI_WP, up,   2, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    a(:, ny+1:ny+ng) = rbuf
+  end subroutine halo_exchange
+
+  ! Reset the ghost layers before contributions are accumulated into them
+  subroutine halo_clear(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    a(:, 1-ng:0)     = 0.0
+    a(:, ny+1:ny+ng) = 0.0
+    a(1-ng:0,     1:ny) = 0.0
+    a(nx+1:nx+ng, 1:ny) = 0.0
+  end subroutine halo_clear
+
+  ! Add what was accumulated in the ghost layers to the cells they are
+  ! images of (reverse of halo_exchange) and clear the ghost layers
+  subroutine halo_fold(a, cfg)
+    type(Config_t), intent(in) :: cfg
+    real, intent(inout)        :: a(1-cfg%ng:, 1-cfg%ng:)
+    integer :: ng, nx, ny, n, ierr
+    real, allocatable :: sbuf(:,:), rbuf(:,:)
+
+    ng = cfg%ng; nx = cfg%Lx; ny = cfg%ny
+    allocate(sbuf(1-ng:nx+ng, ng), rbuf(1-ng:nx+ng, ng))
+    n = size(sbuf)
+
+    ! lower ghost rows belong to the top rows of the rank below
+    sbuf = a(:, 1-ng:0)
+    call MPI_Sendrecv(sbuf, n, MPI_WP, down, 3, rbuf, n, MPI_WP, up,   3, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    a(:, ny-ng+1:ny) = a(:, ny-ng+1:ny) + rbuf
+
+    ! upper ghost rows belong to the bottom rows of the rank above
+    sbuf = a(:, ny+1:ny+ng)
+    call MPI_Sendrecv(sbuf, n, MPI_WP, up,   4, rbuf, n, MPI_WP, down, 4, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    a(:, 1:ng) = a(:, 1:ng) + rbuf
+
+    ! then the columns, which now include the corner contributions
+    a(nx-ng+1:nx, 1:ny) = a(nx-ng+1:nx, 1:ny) + a(1-ng:0,     1:ny)
+    a(1:ng,       1:ny) = a(1:ng,       1:ny) + a(nx+1:nx+ng, 1:ny)
+    call halo_clear(a, cfg)
+  end subroutine halo_fold
+
+  ! Partial sums are combined in double precision
+  function par_sum_real(x) result(s)
+    real, intent(in) :: x
+    real :: s
+    double precision :: xd, sd
+    integer :: ierr
+    xd = x
+    call MPI_Allreduce(xd, sd, 1, MPI_DOUBLE_PRECISION, MPI_SUM, MPI_COMM_WORLD, ierr)
+    s = real(sd)
+  end function par_sum_real
+
+  function par_sum_int(x) result(s)
+    integer, intent(in) :: x
+    integer :: s, ierr
+    call MPI_Allreduce(x, s, 1, MPI_INTEGER, MPI_SUM, MPI_COMM_WORLD, ierr)
+  end function par_sum_int
+
+  function par_sum_int8(x) result(s)
+    integer(kind=8), intent(in) :: x
+    integer(kind=8) :: s
+    integer :: ierr
+    call MPI_Allreduce(x, s, 1, MPI_INTEGER8, MPI_SUM, MPI_COMM_WORLD, ierr)
+  end function par_sum_int8
+
+  function par_max(x) result(s)
+    real, intent(in) :: x
+    real :: s
+    integer :: ierr
+    call MPI_Allreduce(x, s, 1, MPI_WP, MPI_MAX, MPI_COMM_WORLD, ierr)
+  end function par_max
+
+  ! Sum of x over the processes of lower rank (0 on the first one)
+  function par_exscan(x) result(s)
+    integer(kind=8), intent(in) :: x
+    integer(kind=8) :: s
+    integer :: ierr
+    s = 0
+    call MPI_Exscan(x, s, 1, MPI_INTEGER8, MPI_SUM, MPI_COMM_WORLD, ierr)
+    ! (the result is undefined on rank 0)
+    if (rank == 0) s = 0
+  end function par_exscan
+
+  ! The owned rows of a of all ranks as g(Lx, Ly) on rank 0 (g is not
+  ! referenced on the other ranks)
+  subroutine par_gather_field(a, g, cfg)
+    type(Config_t), intent(in)    :: cfg
+    real,           intent(in)    :: a(1-cfg%ng:, 1-cfg%ng:)
+    real,           intent(inout) :: g(:,:)
+    real, allocatable :: buf(:,:)
+    integer :: counts(nranks), displs(nranks), r, ierr
+
+    ! (the slabs of par_decompose)
+    do r = 0, nranks - 1
+      displs(r+1) = cfg%Lx * ((r * cfg%Ly) / nranks)
+      counts(r+1) = cfg%Lx * (((r + 1) * cfg%Ly) / nranks) - displs(r+1)
+    end do
+    allocate(buf(cfg%Lx, cfg%ny))
+    buf = a(1:cfg%Lx, 1:cfg%ny)
+    call MPI_Gatherv(buf, size(buf), MPI_WP, g, counts, displs, MPI_WP, 0, MPI_COMM_WORLD, ierr)
+  end subroutine par_gather_field
+
+  ! Values vals(:,p) of the owned particles p = 1..n of all ranks as
+  ! g(:, id(p)) on rank 0, that is in the order of their global index (g is
+  ! not referenced on the other ranks)
+  subroutine par_gather_particles(vals, id, n, g)
+    real(kind=8), intent(in)    :: vals(:,:)
+    integer,      intent(in)    :: id(:), n
+    real(kind=8), intent(inout) :: g(:,:)
+    integer, allocatable :: ids(:)
+    real(kind=8), allocatable :: buf(:,:)
+    integer :: counts(nranks), displs(nranks), nv, ntot, r, p, ierr
+
+    nv = size(vals, 1)
+    counts = 0
+    displs = 0
+    call MPI_Gather(n, 1, MPI_INTEGER, counts, 1, MPI_INTEGER, 0, MPI_COMM_WORLD, ierr)
+    do r = 2, nranks
+      displs(r) = displs(r-1) + counts(r-1)
+    end do
+    ntot = merge(sum(counts), 0, rank == 0)
+    allocate(ids(ntot), buf(nv, ntot))
+    call MPI_Gatherv(id, n, MPI_INTEGER, ids, counts, displs, MPI_INTEGER, &
+                     0, MPI_COMM_WORLD, ierr)
+    call MPI_Gatherv(vals, nv * n, MPI_DOUBLE_PRECISION, buf, nv * counts, nv * displs, &
+                     MPI_DOUBLE_PRECISION, 0, MPI_COMM_WORLD, ierr)
+    do p = 1, ntot
+      g(:, ids(p)) = buf(:, p)
+    end do
+  end subroutine par_gather_particles
+
+  subroutine par_bcast_int(x)
+    integer, intent(inout) :: x
+    integer :: ierr
+    call MPI_Bcast(x, 1, MPI_INTEGER, 0, MPI_COMM_WORLD, ierr)
+  end subroutine par_bcast_int
+
+  subroutine par_bcast_field(a)
+    real, intent(inout) :: a(:,:)
+    integer :: ierr
+    call MPI_Bcast(a, size(a), MPI_WP, 0, MPI_COMM_WORLD, ierr)
+  end subroutine par_bcast_field
+
+  subroutine par_bcast_particles(particles)
+    type(Particles_t), intent(inout) :: particles
+    integer :: n, ierr
+
+    n = particles%n
+    call MPI_Bcast(particles%id,    n, MPI_INTEGER, 0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%x,     n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%y,     n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%phi,   n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%fx,    n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%fy,    n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%fx_pp, n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%fy_pp, n, MPI_WP,      0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%ix,    n, MPI_INTEGER, 0, MPI_COMM_WORLD, ierr)
+    call MPI_Bcast(particles%iy,    n, MPI_INTEGER, 0, MPI_COMM_WORLD, ierr)
+  end subroutine par_bcast_particles
+
+  ! Send n particle records (and their ids) to rank dest while receiving
+  ! from src; the received ones are stored from position first on
+  subroutine swap_particles(sp, sid, n, dest, src, tag, particles, first, nrecv)
+    type(Particle_t),  intent(in)    :: sp(:)
+    integer,           intent(in)    :: sid(:)
+    integer,           intent(in)    :: n, dest, src, tag, first
+    type(Particles_t), intent(inout) :: particles
+    integer,           intent(out)   :: nrecv
+    type(Particle_t), allocatable :: rp(:)
+    integer :: ierr, pbytes, k
+
+    pbytes = storage_size(sp) / 8
+    call MPI_Sendrecv(n, 1, MPI_INTEGER, dest, tag, nrecv, 1, MPI_INTEGER, src, tag, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    call particles_reserve(particles, first + nrecv - 1)
+    allocate(rp(nrecv))
+    call MPI_Sendrecv(sp, n * pbytes, MPI_BYTE, dest, tag + 1, &
+                      rp, nrecv * pbytes, MPI_BYTE, src, tag + 1, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    call MPI_Sendrecv(sid, n, MPI_INTEGER, dest, tag + 2, &
+                      particles%id(first:), nrecv, MPI_INTEGER, src, tag + 2, &
+                      MPI_COMM_WORLD, MPI_STATUS_IGNORE, ierr)
+    do k = 1, nrecv
+      call put_particle(particles, first + k - 1, rp(k))
+    end do
+  end subroutine swap_particles
+
+  ! Hand the particles that left the slab over to the neighbouring ranks.
+  ! A particle moves far less than a slab width per step, so it always
+  ! lands on the rank just below or above. Ghost copies are dropped.
+  subroutine migrate_particles(particles, cfg)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    type(Particle_t), allocatable :: sdown(:), sup(:)
+    integer,          allocatable :: idown(:), iup(:)
+    integer :: p, nloc, nkeep, ndown, nup, nrecv
+    real    :: ymid, dy
+
+    particles%nghost = 0
+    if (nranks == 1) return
+
+    nloc = particles%n
+    allocate(sdown(nloc), sup(nloc), idown(nloc), iup(nloc))
+    ymid = real(cfg%y0) + 0.5 * real(cfg%ny)
+    nkeep = 0; ndown = 0; nup = 0
+    do p = 1, nloc
+      if (particles%y(p) >= real(cfg%y0) .and. particles%y(p) < real(cfg%y0 + cfg%ny)) then
+        nkeep = nkeep + 1
+        call put_particle(particles, nkeep, get_particle(particles, p))
+        particles%id(nkeep) = particles%id(p)
+      else
+        ! direction from the slab centre, with the minimum image along y
+        dy = particles%y(p) - ymid
+        if (abs(dy) > cfg%Ly * 0.5) dy = dy - sign(real(cfg%Ly), dy)
+        if (dy < 0.0) then
+          ndown = ndown + 1
+          sdown(ndown) = get_particle(particles, p); idown(ndown) = particles%id(p)
+        else
+          nup = nup + 1
+          sup(nup) = get_particle(particles, p);     iup(nup) = particles%id(p)
+        end if
+      end if
+    end do
+    particles%n = nkeep
+
+    call swap_particles(sdown, idown, ndown, down, up, 10, particles, particles%n + 1, nrecv)
+    particles%n = particles%n + nrecv
+    call swap_particles(sup, iup, nup, up, down, 20, particles, particles%n + 1, nrecv)
+    particles%n = particles%n + nrecv
+  end subroutine migrate_particles
+
+  ! Append copies of the neighbours' particles lying within ghost_band of
+  ! this slab after the n owned ones (they keep their global coordinates)
+  subroutine exchange_ghosts(particles, cfg)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    type(Particle_t), allocatable :: sdown(:), sup(:)
+    integer,          allocatable :: idown(:), iup(:)
+    integer :: p, nloc, ndown, nup, nrecv
+
+    particles%nghost = 0
+    if (nranks == 1) return
+
+    nloc = particles%n
+    allocate(sdown(nloc), sup(nloc), idown(nloc), iup(nloc))
+    ndown = 0; nup = 0
+    do p = 1, nloc
+      if (particles%y(p) - real(cfg%y0) <= ghost_band) then
+        ndown = ndown + 1; sdown(ndown) = get_particle(particles, p); idown(ndown) = 0
+      end if
+      if (real(cfg%y0 + cfg%ny) - particles%y(p) <= ghost_band) then
+        nup = nup + 1;     sup(nup) = get_particle(particles, p);     iup(nup) = 0
+      end if
+    end do
+
+    call swap_particles(sdown, idown, ndown, down, up, 30, particles, nloc + 1, nrecv)
+    particles%nghost = nrecv
+    call swap_particles(sup, iup, nup, up, down, 40, particles, &
+                        nloc + particles%nghost + 1, nrecv)
+    particles%nghost = particles%nghost + nrecv
+  end subroutine exchange_ghosts
+
+  ! Write blocks of bytes at the given 0-based file offsets. Collective: every
+  ! rank contributes its own (possibly empty) set of blocks to one file
+  ! through MPI-IO.
+  subroutine par_write_blocks(filename, bytes, offsets, lengths)
+    character(len=*), intent(in) :: filename
+    character(len=1), intent(in) :: bytes(:)
+    integer(kind=8),  intent(in) :: offsets(:)
+    integer,          intent(in) :: lengths(:)
+    integer :: fh, ftype, ierr, b, k, nb
+    integer(kind=8) :: pos
+    integer(kind=8), allocatable :: start(:)
+    integer, allocatable :: order(:), blen(:)
+    integer(kind=MPI_ADDRESS_KIND), allocatable :: disp(:)
+    character(len=1), allocatable :: sorted(:)
+
+    ! MPI file views need non-decreasing displacements
+    nb = size(offsets)
+    allocate(order(nb), start(nb), blen(nb), disp(nb), sorted(size(bytes)))
+    pos = 1
+    do b = 1, nb
+      start(b) = pos
+      pos = pos + lengths(b)
+    end do
+    call sort_index(offsets, order)
+    pos = 1
+    do b = 1, nb
+      k = order(b)
+      disp(b) = offsets(k)
+      blen(b) = lengths(k)
+      sorted(pos:pos+lengths(k)-1) = bytes(start(k):start(k)+lengths(k)-1)
+      pos = pos + lengths(k)
+    end do
+
+    call MPI_Type_create_hindexed(nb, blen, disp, MPI_BYTE, ftype, ierr)
+    call MPI_Type_commit(ftype, ierr)
+    call MPI_File_open(MPI_COMM_WORLD, filename, MPI_MODE_WRONLY + MPI_MODE_CREATE, &
+                       MPI_INFO_NULL, fh, ierr)
+    call MPI_File_set_size(fh, 0_MPI_OFFSET_KIND, ierr)
+    call MPI_File_set_view(fh, 0_MPI_OFFSET_KIND, MPI_BYTE, ftype, 'native', &
+                           MPI_INFO_NULL, ierr)
+    call MPI_File_write_all(fh, sorted, size(sorted), MPI_BYTE, MPI_STATUS_IGNORE, ierr)
+    call MPI_File_close(fh, ierr)
+    call MPI_Type_free(ftype, ierr)
+  end subroutine par_write_blocks
+
+  ! Heapsort returning the permutation that orders keys ascending
+  subroutine sort_index(keys, order)
+    integer(kind=8), intent(in)  :: keys(:)
+    integer,         intent(out) :: order(:)
+    integer :: n, i, last, tmp
+
+    n = size(keys)
+    order = [(i, i = 1, n)]
+    do i = n / 2, 1, -1
+      call sift_down(i, n)
+    end do
+    do last = n, 2, -1
+      tmp = order(1); order(1) = order(last); order(last) = tmp
+      call sift_down(1, last - 1)
+    end do
+
+  contains
+
+    subroutine sift_down(first, last)
+      integer, intent(in) :: first, last
+      integer :: root, child, t
+      root = first
+      do while (2 * root <= last)
+        child = 2 * root
+        if (child < last) then
+          if (keys(order(child + 1)) > keys(order(child))) child = child + 1
+        end if
+        if (keys(order(root)) >= keys(order(child))) return
+        t = order(root); order(root) = order(child); order(child) = t
+        root = child
+      end do
+    end subroutine sift_down
+
+  end subroutine sort_index
+
+end module mod_parallel
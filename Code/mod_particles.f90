@@ -1,100 +1,316 @@
 module mod_particles
   use mod_core_types
+  use mod_parallel
+  use mod_random
+  !$ use omp_lib
   implicit none
-  public :: compute_pp_forces, integrate_particles
+  public :: compute_pp_forces, integrate_particles, sort_particles, max_drift, verlet_builds
 
-  ! Persistent arrays to avoid re-allocation overhead
-  integer, allocatable, save :: head(:), list(:)
+  ! (the Verlet list is kept with the particles, see Verlet_t, and the cell
+  ! list is local to cell_pairs, so that several simulations can be
+  ! advanced side by side on different threads)
+  integer, save :: verlet_builds = 0     ! number of rebuilds, for diagnostics
 
 contains
 
-  subroutine compute_pp_forces(particles, cfg, e_pp)
-    type(Particle_t), intent(inout) :: particles(:)
-    type(Config_t),   intent(in)    :: cfg
-    real,             intent(out)   :: e_pp
+  ! Particles 1..n are owned by this process, n+1..n+nghost are ghost
+  ! copies of particles owned by neighbouring ranks (see exchange_ghosts).
+  ! Only the cell rows covering the own slab are visited, and each
+  ! local-ghost pair, which is also evaluated on the other rank, contributes
+  ! half of its energy.
+  !
+  ! With cfg%verlet_skin > 0 the pairs are taken from a Verlet list, rebuilt
+  ! only once some particle has moved more than half the skin. The particle
+  ! indices must then stay fixed between steps, so the list is only used
+  ! when a single process owns the whole system (ghosts and migrations
+  ! reshuffle particles every step otherwise).
+  !
+  ! With several OpenMP threads the rows of cells are coloured: the pairs
+  ! found from cell row r only involve particles of rows r and r+1, so the
+  ! odd rows, and then the even rows, are processed in parallel without two
+  ! threads updating the same particle (a leftover row, when their number
+  ! is odd, comes last on its own). Rows are handed out dynamically, since
+  ! clustered states leave some rows much fuller than others. The same
+  ! colouring applies to the Verlet pairs, grouped by the row they were
+  ! found from.
+  subroutine compute_pp_forces(particles, cfg, e_pp, energy)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    real,              intent(out)   :: e_pp
+    logical, intent(in), optional    :: energy   ! evaluate e_pp (default), else 0
+    integer :: k, n, n_owned, r, nrows, colour, nthreads
+    logical :: with_energy
+
+    n_owned = particles%n
+    n = particles%n + particles%nghost
+
+    with_energy = .true.
+    if (present(energy)) with_energy = energy
+
+    e_pp = 0.0
+    particles%fx_pp(1:n) = 0.0
+    particles%fy_pp(1:n) = 0.0
+
+    if (cfg%verlet_skin > 0.0 .and. cfg%ny == cfg%Ly) then
+      if (verlet_expired(particles, cfg)) then
+        particles%verlet%npairs = 0
+        !$omp atomic
+        verlet_builds = verlet_builds + 1
+        call cell_pairs(particles, cfg, e_pp, n_owned, .true., with_energy)
+        particles%verlet%x_ref = particles%x(1:n)
+        particles%verlet%y_ref = particles%y(1:n)
+        particles%verlet%skin = cfg%verlet_skin
+      end if
+      nthreads = 1
+      !$ nthreads = omp_get_max_threads()
+      if (nthreads == 1) then
+        do k = 1, particles%verlet%npairs
+          call force_pair(particles%verlet%pair_i(k), particles%verlet%pair_j(k), &
+                          particles, cfg, e_pp, n_owned, with_energy)
+        end do
+      else
+        nrows = size(particles%verlet%row_first) - 1
+        do colour = 1, 2
+          !$omp parallel do private(k) reduction(+:e_pp) schedule(dynamic)
+          do r = colour, 2 * (nrows / 2), 2
+            do k = particles%verlet%row_first(r), particles%verlet%row_first(r + 1) - 1
+              call force_pair(particles%verlet%pair_i(k), particles%verlet%pair_j(k), &
+                              particles, cfg, e_pp, n_owned, with_energy)
+            end do
+          end do
+          !$omp end parallel do
+        end do
+        do k = particles%verlet%row_first(2 * (nrows / 2) + 1), particles%verlet%npairs
+          call force_pair(particles%verlet%pair_i(k), particles%verlet%pair_j(k), &
+                          particles, cfg, e_pp, n_owned, with_energy)
+        end do
+      end if
+    else
+      call cell_pairs(particles, cfg, e_pp, n_owned, .false., with_energy)
+    end if
+  end subroutine compute_pp_forces
+
+  ! True if the Verlet list is missing, was built for a different set of
+  ! particles or skin, or some particle has moved more than half the skin
+  logical function verlet_expired(particles, cfg)
+    type(Particles_t), intent(in) :: particles
+    type(Config_t),    intent(in) :: cfg
+    real    :: dx, dy, half_skin_2, dr2_max
+    integer :: i, n
+
+    n = particles%n + particles%nghost
+    verlet_expired = .true.
+    if (.not. allocated(particles%verlet%x_ref)) return
+    if (size(particles%verlet%x_ref) /= n) return
+    if (particles%verlet%skin /= cfg%verlet_skin) return
+
+    half_skin_2 = (0.5 * cfg%verlet_skin)**2
+    dr2_max = 0.0
+    do i = 1, n
+      dx = abs(particles%x(i) - particles%verlet%x_ref(i))
+      dy = abs(particles%y(i) - particles%verlet%y_ref(i))
+      dx = min(dx, cfg%Lx - dx)
+      dy = min(dy, cfg%Ly - dy)
+      dr2_max = max(dr2_max, dx**2 + dy**2)
+    end do
+    verlet_expired = (dr2_max > half_skin_2)
+  end function verlet_expired
+
+  ! Visit every pair of particles in the same or adjacent cells of a linked
+  ! cell list. The pairs either get their forces (build = .false., cells of
+  ! width r_cut) or are stored in the Verlet list (build = .true., cells of
+  ! width r_cut + skin).
+  subroutine cell_pairs(particles, cfg, e_pp, n_owned, build, energy)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    real,              intent(inout) :: e_pp
+    integer,           intent(in)    :: n_owned
+    logical,           intent(in)    :: build, energy
     
-    integer :: ncx, ncy, ic, jc, c, nc, i, j, icn, jcn
+    integer, allocatable :: head(:), list(:)
+    integer :: ncx, ncy, ic, jc, c, i, jcw, n
+    integer :: jc_lo, jc_hi, r, nrows, colour, nthreads
     real    :: cell_w
     
     cell_w = sqrt(cfg%r_cut_sq)
+    if (build) cell_w = cell_w + cfg%verlet_skin
     ncx = max(3, int(real(cfg%Lx) / cell_w))
     ncy = max(3, int(real(cfg%Ly) / cell_w))
+    n   = particles%n + particles%nghost
     
-    if (.not. allocated(head)) allocate(head(ncx * ncy))
-    if (.not. allocated(list)) allocate(list(cfg%Np))
-    if (size(head) /= ncx*ncy) then
-       deallocate(head); allocate(head(ncx*ncy))
-    end if
+    allocate(head(ncx * ncy), list(n))
 
-    head = 0  
-    e_pp = 0.0
-    particles%fx_pp = 0.0
-    particles%fy_pp = 0.0
+    ! Cell rows to visit: all of them, or those of the own slab plus the
+    ! ghost row below it (the half-shell below reaches the one above)
+    if (cfg%ny == cfg%Ly) then
+      jc_lo = 1
+      jc_hi = ncy
+      head  = 0
+    else
+      jc_lo = (cfg%y0 * ncy) / cfg%Ly
+      jc_hi = ((cfg%y0 + cfg%ny) * ncy + cfg%Ly - 1) / cfg%Ly
+      do jc = jc_lo, jc_hi + 1
+        jcw = modulo(jc - 1, ncy)
+        head(jcw*ncx + 1 : jcw*ncx + ncx) = 0
+      end do
+    end if
 
     ! 1. Binning
-    do i = 1, cfg%Np
-      ic = max(1, min(ncx, int(particles(i)%x * ncx / cfg%Lx) + 1))
-      jc = max(1, min(ncy, int(particles(i)%y * ncy / cfg%Ly) + 1))
+    do i = n_owned + 1, n
+      ic = max(1, min(ncx, int(particles%x(i) * ncx / cfg%Lx) + 1))
+      jc = max(1, min(ncy, int(particles%y(i) * ncy / cfg%Ly) + 1))
+      c = ic + (jc - 1) * ncx
+      head(c) = 0   ! ghost cells outside the visited rows
+    end do
+    do i = 1, n
+      ic = max(1, min(ncx, int(particles%x(i) * ncx / cfg%Lx) + 1))
+      jc = max(1, min(ncy, int(particles%y(i) * ncy / cfg%Ly) + 1))
       c = ic + (jc - 1) * ncx
       list(i) = head(c)
       head(c) = i
     end do
 
-    ! 2. Interaction Loop
-    do jc = 1, ncy
-      do ic = 1, ncx
-        c = ic + (jc - 1) * ncx
-        
-        ! --- A. Self-cell interactions ---
-        i = head(c)
-        do while (i > 0)
-          j = list(i) 
-          do while (j > 0)
-            call force_pair(i, j, particles, cfg, e_pp)
-            j = list(j)
-          end do
-          i = list(i)
+    ! 2. Interaction Loop, one row of cells at a time
+    nrows = jc_hi - jc_lo + 1
+    nthreads = 1
+    !$ nthreads = omp_get_max_threads()
+    if (build) then
+      ! Verlet list (serial): remember where the pairs of each row start
+      if (allocated(particles%verlet%row_first)) deallocate(particles%verlet%row_first)
+      allocate(particles%verlet%row_first(nrows + 1))
+      do r = 1, nrows
+        particles%verlet%row_first(r) = particles%verlet%npairs + 1
+        call row_pairs(jc_lo + r - 1, ncx, ncy, head, list, particles, cfg, e_pp, &
+                       n_owned, build, energy)
+      end do
+      particles%verlet%row_first(nrows + 1) = particles%verlet%npairs + 1
+    else if (nthreads == 1) then
+      do r = 1, nrows
+        call row_pairs(jc_lo + r - 1, ncx, ncy, head, list, particles, cfg, e_pp, &
+                       n_owned, build, energy)
+      end do
+    else
+      do colour = 1, 2
+        !$omp parallel do reduction(+:e_pp) schedule(dynamic)
+        do r = colour, 2 * (nrows / 2), 2
+          call row_pairs(jc_lo + r - 1, ncx, ncy, head, list, particles, cfg, e_pp, &
+                         n_owned, build, energy)
+        end do
+        !$omp end parallel do
+      end do
+      if (mod(nrows, 2) == 1) &
+        call row_pairs(jc_hi, ncx, ncy, head, list, particles, cfg, e_pp, &
+                       n_owned, build, energy)
+    end if
+  end subroutine cell_pairs
+
+  ! Pairs within the cells of row jcw (wrapped periodically) and between
+  ! them and the half-shell of neighbouring cells in the rows jcw, jcw + 1
+  subroutine row_pairs(jcw, ncx, ncy, head, list, particles, cfg, e_pp, n_owned, build, energy)
+    integer,           intent(in)    :: jcw, ncx, ncy, n_owned
+    integer,           intent(in)    :: head(:), list(:)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    real,              intent(inout) :: e_pp
+    logical,           intent(in)    :: build, energy
+    integer :: ic, jc, c, nc, i, j, icn, jcn
+
+    jc = modulo(jcw - 1, ncy) + 1
+    do ic = 1, ncx
+      c = ic + (jc - 1) * ncx
+      
+      ! --- A. Self-cell interactions ---
+      i = head(c)
+      do while (i > 0)
+        j = list(i) 
+        do while (j > 0)
+          if (build) then
+            call add_pair(i, j, particles, cfg, n_owned)
+          else
+            call force_pair(i, j, particles, cfg, e_pp, n_owned, energy)
+          end if
+          j = list(j)
         end do
+        i = list(i)
+      end do
 
-        ! --- B. Neighbor-cell interactions ---
-        do jcn = jc, jc + 1
-          do icn = ic - 1, ic + 1
-            if (jcn == jc .and. icn <= ic) cycle 
-            
-            nc = modulo(icn - 1 + ncx, ncx) + 1 + &
-                 modulo(jcn - 1 + ncy, ncy) * ncx
-            
-            i = head(c)
-            do while (i > 0)
-              j = head(nc)
-              do while (j > 0)
-                call force_pair(i, j, particles, cfg, e_pp)
-                j = list(j)
-              end do
-              i = list(i)
+      ! --- B. Neighbor-cell interactions ---
+      do jcn = jc, jc + 1
+        do icn = ic - 1, ic + 1
+          if (jcn == jc .and. icn <= ic) cycle 
+          
+          nc = modulo(icn - 1 + ncx, ncx) + 1 + &
+               modulo(jcn - 1 + ncy, ncy) * ncx
+          
+          i = head(c)
+          do while (i > 0)
+            j = head(nc)
+            do while (j > 0)
+              if (build) then
+                call add_pair(i, j, particles, cfg, n_owned)
+              else
+                call force_pair(i, j, particles, cfg, e_pp, n_owned, energy)
+              end if
+              j = list(j)
             end do
+            i = list(i)
           end do
         end do
       end do
     end do
-  end subroutine compute_pp_forces
+  end subroutine row_pairs
+
+  ! Store the pair (i, j) in the Verlet list if it is within r_cut + skin
+  subroutine add_pair(i, j, particles, cfg, n_owned)
+    integer,           intent(in)    :: i, j, n_owned
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    integer, allocatable :: tmp(:)
+    real :: dx, dy
+
+    if (i > n_owned .and. j > n_owned) return
+
+    dx = particles%x(i) - particles%x(j)
+    dy = particles%y(i) - particles%y(j)
+    if (abs(dx) > cfg%Lx * 0.5) dx = dx - sign(real(cfg%Lx), dx)
+    if (abs(dy) > cfg%Ly * 0.5) dy = dy - sign(real(cfg%Ly), dy)
+    if (dx**2 + dy**2 >= (sqrt(cfg%r_cut_sq) + cfg%verlet_skin)**2) return
+
+    associate (v => particles%verlet)
+      if (.not. allocated(v%pair_i)) allocate(v%pair_i(4 * particles%n + 16), &
+                                              v%pair_j(4 * particles%n + 16))
+      if (v%npairs == size(v%pair_i)) then
+        allocate(tmp(2 * v%npairs))
+        tmp(1:v%npairs) = v%pair_i(1:v%npairs); call move_alloc(tmp, v%pair_i)
+        allocate(tmp(2 * v%npairs))
+        tmp(1:v%npairs) = v%pair_j(1:v%npairs); call move_alloc(tmp, v%pair_j)
+      end if
+      v%npairs = v%npairs + 1
+      v%pair_i(v%npairs) = i
+      v%pair_j(v%npairs) = j
+    end associate
+  end subroutine add_pair
 
   ! -------------------------------------------------------------------
   ! CENTRALIZED FORCE CALCULATION
   ! -------------------------------------------------------------------
-pure subroutine force_pair(i, j, particles, cfg, e_pp)
-    integer, intent(in) :: i, j
-    type(Particle_t), intent(inout) :: particles(:)
+pure subroutine force_pair(i, j, particles, cfg, e_pp, n_owned, energy)
+    integer, intent(in) :: i, j, n_owned
+    type(Particles_t), intent(inout) :: particles
     type(Config_t), intent(in) :: cfg
     real, intent(inout) :: e_pp
+    logical, intent(in) :: energy      ! accumulate the energy into e_pp
     
-    real :: dx, dy, r2, r, f_mag, overlap
+    real :: dx, dy, r2, r, f_mag, overlap, w
     ! k_stiff: The "Spring Constant". 
     ! For dt=0.1, gamma=1, k=10 is very stable.
     !real, parameter :: k_stiff = 10.0 
 
-    dx = particles(i)%x - particles(j)%x
-    dy = particles(i)%y - particles(j)%y
+    ! Pairs of ghosts belong to other ranks
+    if (i > n_owned .and. j > n_owned) return
+
+    dx = particles%x(i) - particles%x(j)
+    dy = particles%y(i) - particles%y(j)
     
     ! Minimum Image Convention
     if (abs(dx) > cfg%Lx * 0.5) dx = dx - sign(real(cfg%Lx), dx)
@@ -111,69 +327,198 @@ pure subroutine force_pair(i, j, particles, cfg, e_pp)
       ! Divided by r to project onto the dx, dy components.
       f_mag = cfg%epsilon * overlap / r
       
-      particles(i)%fx_pp = particles(i)%fx_pp + f_mag * dx
-      particles(i)%fy_pp = particles(i)%fy_pp + f_mag * dy
-      particles(j)%fx_pp = particles(j)%fx_pp - f_mag * dx
-      particles(j)%fy_pp = particles(j)%fy_pp - f_mag * dy
+      particles%fx_pp(i) = particles%fx_pp(i) + f_mag * dx
+      particles%fy_pp(i) = particles%fy_pp(i) + f_mag * dy
+      particles%fx_pp(j) = particles%fx_pp(j) - f_mag * dx
+      particles%fy_pp(j) = particles%fy_pp(j) - f_mag * dy
       
-      ! Energy = 1/2 * k * overlap^2
-      e_pp = e_pp + 0.5 * cfg%epsilon * (overlap**2)
+      ! Energy = 1/2 * k * overlap^2 (shared with the other rank for ghosts)
+      if (energy) then
+        w = 1.0
+        if (i > n_owned .or. j > n_owned) w = 0.5
+        e_pp = e_pp + w * 0.5 * cfg%epsilon * (overlap**2)
+      end if
     end if
   end subroutine force_pair
 
-  ! Overdamped Langevin integration (Euler-Maruyama)
-  subroutine integrate_particles(particles, cfg)
-    type(Particle_t), intent(inout) :: particles(:)
-    type(Config_t),   intent(in)    :: cfg
-    real    :: amp_pos,amp_rot, rx, ry, rphi
+  ! Reorder the owned particles along a Z-order (Morton) curve through the
+  ! cells of the pair search, so that particles close in space are also
+  ! close in memory. Cell list, Verlet list and coupling scatter then touch
+  ! far fewer cache lines. The output order is unaffected (see Particles_t%id).
+  subroutine sort_particles(particles, cfg)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    integer, allocatable :: key(:), perm(:), tmp(:), count(:)
+    integer :: ncx, ncy, ic, jc, i, n, pass, shift, d
+    real    :: cell_w
+
+    n = particles%n
+    if (n < 2) return
+
+    cell_w = sqrt(cfg%r_cut_sq)
+    ncx = max(3, int(real(cfg%Lx) / cell_w))
+    ncy = max(3, int(real(cfg%Ly) / cell_w))
+
+    allocate(key(n), perm(n), tmp(n), count(0:65536))
+    do i = 1, n
+      ic = max(0, min(ncx - 1, int(particles%x(i) * ncx / cfg%Lx)))
+      jc = max(0, min(ncy - 1, int(particles%y(i) * ncy / cfg%Ly)))
+      key(i) = morton(ic, jc)
+      perm(i) = i
+    end do
+
+    ! Stable LSD radix sort of perm by key, 16 bits per pass
+    do pass = 0, 1
+      shift = -16 * pass
+      count = 0
+      do i = 1, n
+        d = iand(ishft(key(perm(i)), shift), 65535)
+        count(d + 1) = count(d + 1) + 1
+      end do
+      do d = 1, 65536
+        count(d) = count(d) + count(d - 1)
+      end do
+      do i = 1, n
+        d = iand(ishft(key(perm(i)), shift), 65535)
+        count(d) = count(d) + 1
+        tmp(count(d)) = perm(i)
+      end do
+      perm = tmp
+    end do
+
+    call particles_permute(particles, perm)
+
+    ! the Verlet list refers to the old indices
+    if (allocated(particles%verlet%x_ref)) deallocate(particles%verlet%x_ref, particles%verlet%y_ref)
+  end subroutine sort_particles
+
+  ! Interleave the bits of i and j (each below 2**15): ...j1 i1 j0 i0
+  pure integer function morton(i, j)
+    integer, intent(in) :: i, j
+    integer :: b
+
+    morton = 0
+    do b = 0, 14
+      if (btest(i, b)) morton = ibset(morton, 2*b)
+      if (btest(j, b)) morton = ibset(morton, 2*b + 1)
+    end do
+  end function morton
+
+  ! Largest deterministic displacement (forces and self-propulsion) of an
+  ! owned particle over one step of cfg%dt, for the adaptive time stepping
+  real function max_drift(particles, cfg)
+    type(Particles_t), intent(in) :: particles
+    type(Config_t),    intent(in) :: cfg
+    real    :: dx, dy, d2_max
     integer :: i
-    real    :: dx_total, dy_total, dr_total_2, dr_max_2
 
+    d2_max = 0.0
+    do i = 1, particles%n
+      dx = ((particles%fx(i) + particles%fx_pp(i)) / cfg%gamm_T + &
+            cfg%vact * cos(particles%phi(i))) * cfg%dt
+      dy = ((particles%fy(i) + particles%fy_pp(i)) / cfg%gamm_T + &
+            cfg%vact * sin(particles%phi(i))) * cfg%dt
+      d2_max = max(d2_max, dx**2 + dy**2)
+    end do
+    max_drift = sqrt(d2_max)
+  end function max_drift
+
+  ! Overdamped Langevin integration (Euler-Maruyama) of the owned particles
+  ! at step t (and substep, see main). The random numbers are drawn up
+  ! front, keyed by the global particle id (see mod_random), so that the
+  ! update itself is a plain loop over contiguous arrays.
+  ! A particle moving by more than a diameter ends the program, or, with ok
+  ! present, sets it to false and leaves the particles where they are.
+  subroutine integrate_particles(particles, cfg, t, substep, ok)
+    type(Particles_t), intent(inout) :: particles
+    type(Config_t),    intent(in)    :: cfg
+    integer,           intent(in)    :: t
+    integer, intent(in), optional    :: substep
+    logical, intent(out), optional   :: ok
+    real    :: amp_pos, amp_rot
+    integer :: i, n, wx, wy
+    real    :: dr_max_2, Lx, Ly
+    real, allocatable :: rnd(:,:), dx_total(:), dy_total(:)
+
+    if (present(ok)) ok = .true.
+    n = particles%n
+    Lx = real(cfg%Lx)
+    Ly = real(cfg%Ly)
     amp_pos = sqrt(2.0 * cfg%temperature * cfg%dt / cfg%gamm_T)
     amp_rot = sqrt(2.0 * cfg%temperature * cfg%dt / cfg%gamm_R)
 
     dr_max_2  =  ( 1.0 * cfg%diam )**2
+
+    ! rnd(1:3, i): noise on x, y and phi of particle i
+    allocate(rnd(4, n), dx_total(n), dy_total(n))
+    call rng_uniform(cfg%rng_seed, STREAM_PARTICLE_NOISE, t, particles%id(1:n), rnd, substep)
     
-    do i = 1, cfg%Np
-      call random_number(rx)
-      call random_number(ry)
-      call random_number(rphi)
-      
-      ! (Force-driven + Active-driven)
-      dx_total = ((particles(i)%fx + particles(i)%fx_pp) / cfg%gamm_T) * cfg%dt + &
-                 cfg%vact * cos(particles(i)%phi) * cfg%dt
-      
-      dy_total = ((particles(i)%fy + particles(i)%fy_pp) / cfg%gamm_T) * cfg%dt + &
-                 cfg%vact * sin(particles(i)%phi) * cfg%dt
+    associate (x => particles%x, y => particles%y, phi => particles%phi, &
+               fx => particles%fx, fy => particles%fy,                 &
+               fx_pp => particles%fx_pp, fy_pp => particles%fy_pp, &
+               ix => particles%ix, iy => particles%iy)
 
-      ! 2. Stability Check: Catch "explosions" before updating coordinates
-      dr_total_2 = dx_total**2 + dy_total**2
-      
-      if (dr_total_2 > dr_max_2) then
+    ! (Force-driven + Active-driven)
+    ! (separate loops: sin and cos of the same angle would be fused into a
+    ! sincos call, which does not vectorise)
+    do i = 1, n
+      dx_total(i) = ((fx(i) + fx_pp(i)) / cfg%gamm_T) * cfg%dt + &
+                    cfg%vact * cos(phi(i)) * cfg%dt
+    end do
+    do i = 1, n
+      dy_total(i) = ((fy(i) + fy_pp(i)) / cfg%gamm_T) * cfg%dt + &
+                    cfg%vact * sin(phi(i)) * cfg%dt
+    end do
+
+    ! 2. Stability Check: Catch "explosions" before updating coordinates
+    if (n > 0) then
+      i = maxloc(dx_total**2 + dy_total**2, dim=1)
+      if (dx_total(i)**2 + dy_total(i)**2 > dr_max_2) then
           print *, "--- INSTABILITY DETECTED ---"
-          print *, "Particle ID:", i
-          print *, "Total displacement:", sqrt( dr_total_2 )
+          print *, "Particle ID:", particles%id(i)
+          print *, "Total displacement:", sqrt( dx_total(i)**2 + dy_total(i)**2 )
           print *, "Limit (10% diam): ", sqrt( dr_max_2 )
-          print *, "Field Force: ", particles(i)%fx, particles(i)%fy
-          print *, "PP Force:    ", particles(i)%fx_pp, particles(i)%fy_pp
-          stop 1
+          print *, "Field Force: ", fx(i), fy(i)
+          print *, "PP Force:    ", fx_pp(i), fy_pp(i)
+          if (present(ok)) then
+            ok = .false.
+            return
+          end if
+          call par_abort(1)
       end if
+    end if
 
+    do i = 1, n
       ! 3. Apply updates including Noise
-      particles(i)%x = particles(i)%x + dx_total + amp_pos * (rx - 0.5) * 3.4641
-      particles(i)%y = particles(i)%y + dy_total + amp_pos * (ry - 0.5) * 3.4641
+      x(i) = x(i) + dx_total(i) + amp_pos * (rnd(1,i) - 0.5) * 3.4641
+      y(i) = y(i) + dy_total(i) + amp_pos * (rnd(2,i) - 0.5) * 3.4641
       
-      ! Periodic Boundary Conditions
-      particles(i)%x = modulo(particles(i)%x, real(cfg%Lx))
-      particles(i)%y = modulo(particles(i)%y, real(cfg%Ly))
+      ! Periodic Boundary Conditions, counting the images crossed
+      ! (written out with floor: the modulo intrinsic does not vectorise)
+      wx = floor(x(i) / Lx)
+      wy = floor(y(i) / Ly)
+      x(i) = x(i) - Lx * wx
+      y(i) = y(i) - Ly * wy
+      ! (a tiny negative coordinate can round up to L itself)
+      if (x(i) >= Lx) then
+        x(i) = 0.0
+        wx = wx + 1
+      end if
+      if (y(i) >= Ly) then
+        y(i) = 0.0
+        wy = wy + 1
+      end if
+      ix(i) = ix(i) + wx
+      iy(i) = iy(i) + wy
 
       ! 3.46 is sqrt(12), used to convert uniform random [-0.5, 0.5] to unit variance
-      particles(i)%phi = particles(i)%phi + amp_rot * (rphi - 0.5) * 3.46
+      phi(i) = phi(i) + amp_rot * (rnd(3,i) - 0.5) * 3.46
       
       ! Keep phi within [0, 2*pi]
-      particles(i)%phi = modulo(particles(i)%phi, 2.0 * pi)
-
+      phi(i) = phi(i) - TWO_PI * floor(phi(i) / TWO_PI)
     enddo
+
+    end associate
   end subroutine integrate_particles
 
-end module mod_particles
\ No newline at end of file
+end module mod_particles
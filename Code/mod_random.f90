@@ -0,0 +1,213 @@
+module mod_random
+  ! Counter-based random numbers: Philox4x32-10 (Salmon et al., "Parallel
+  ! random numbers: as easy as 1, 2, 3", SC'11).
+  !
+  ! Every draw is a pure function of (seed, stream, step, index), where the
+  ! stream names what the numbers are used for (see STREAM_*), step is the
+  ! time step and index a global cell or particle number (plus a substep
+  ! number for steps split by the adaptive time stepping). The numbers do not
+  ! depend on the order in which they are drawn, on the number of threads or
+  ! ranks, or on where the particles sit in memory, and the whole generator
+  ! state is the seed: a restart at step t draws exactly what the original
+  ! run drew at step t.
+  !
+  ! 32-bit words are held in 64-bit integers, as Fortran has no unsigned
+  ! type (see mulhilo32 for the 32 x 32 -> 64 bit products). Arrays of
+  ! counters are run through the elemental rounds at once (rng_uniform,
+  ! rng_uniform_run), which the compiler inlines into one loop over the
+  ! counters. The normal numbers (rng_normal, rng_normal_run) are made from
+  ! these by the Box-Muller transform, one array operation per component.
+  use mod_core_types, only: TWO_PI
+  implicit none
+  private
+  public :: philox4x32, rng_uniform4, rng_uniform, rng_uniform_run, rng_normal, &
+            rng_normal_run, rng_clock_seed
+
+  ! Streams
+  integer, parameter, public :: STREAM_FIELD_NOISE    = 1
+  integer, parameter, public :: STREAM_PARTICLE_NOISE = 2
+  integer, parameter, public :: STREAM_INIT_FIELD     = 3
+  integer, parameter, public :: STREAM_INIT_POSITION  = 4
+  integer, parameter, public :: STREAM_INIT_ANGLE     = 5
+
+  integer(kind=8), parameter :: MASK32 = 4294967295_8
+  ! multipliers 0xD2511F53 and 0xCD9E8D57, minus 2**32 (see mulhilo32)
+  integer(kind=8), parameter :: PHILOX_M0 = 3528531795_8 - 4294967296_8
+  integer(kind=8), parameter :: PHILOX_M1 = 3449720151_8 - 4294967296_8
+  integer(kind=8), parameter :: PHILOX_W0 = 2654435769_8    ! 0x9E3779B9
+  integer(kind=8), parameter :: PHILOX_W1 = 3144134277_8    ! 0xBB67AE85
+  real, parameter :: TWO_M24 = 1.0 / 16777216.0             ! 2**-24
+
+contains
+
+  ! High and low 32-bit words of the product (m + 2**32)*x of a multiplier
+  ! m + 2**32 and a 32-bit word x. With -2**31 < m < 0, as for both Philox
+  ! multipliers, the product q = m*x fits in a signed 64-bit integer, and
+  ! (m + 2**32)*x = q + x*2**32: the low word is that of q and the high
+  ! word x + floor(q / 2**32). One multiplication, without overflow.
+  elemental subroutine mulhilo32(m, x, hi, lo)
+    integer(kind=8), intent(in)  :: m, x
+    integer(kind=8), intent(out) :: hi, lo
+    integer(kind=8) :: q
+
+    q = m * x
+    lo = iand(q, MASK32)
+    hi = x + shifta(q, 32)
+  end subroutine mulhilo32
+
+  ! Philox4x32 with 10 rounds: four 32-bit words from a 4-word counter and
+  ! a 2-word key (all values in 0..2**32-1)
+  pure function philox4x32(ctr, key) result(x)
+    integer(kind=8), intent(in) :: ctr(4), key(2)
+    integer(kind=8) :: x(4)
+
+    call philox_rounds(ctr(1), ctr(2), ctr(3), ctr(4), key(1), key(2), &
+                       x(1), x(2), x(3), x(4))
+  end function philox4x32
+
+  elemental subroutine philox_rounds(c0, c1, c2, c3, key0, key1, x0, x1, x2, x3)
+    integer(kind=8), intent(in)  :: c0, c1, c2, c3, key0, key1
+    integer(kind=8), intent(out) :: x0, x1, x2, x3
+    integer(kind=8) :: k0, k1, hi0, lo0, hi1, lo1
+    integer :: r
+
+    x0 = c0; x1 = c1; x2 = c2; x3 = c3
+    k0 = key0
+    k1 = key1
+    do r = 1, 10
+      call mulhilo32(PHILOX_M0, x0, hi0, lo0)
+      call mulhilo32(PHILOX_M1, x2, hi1, lo1)
+      x0 = ieor(ieor(hi1, x1), k0)
+      x1 = lo1
+      x2 = ieor(ieor(hi0, x3), k1)
+      x3 = lo0
+      k0 = iand(k0 + PHILOX_W0, MASK32)
+      k1 = iand(k1 + PHILOX_W1, MASK32)
+    end do
+  end subroutine philox_rounds
+
+  ! Four uniform numbers in (0, 1) for (seed, stream, step, index[, substep])
+  ! (index < 2**48, substep < 2**16; substep 0 is the same as none)
+  pure subroutine rng_uniform4(seed, stream, step, index, u, substep)
+    integer,         intent(in)  :: seed, stream, step
+    integer(kind=8), intent(in)  :: index
+    real,            intent(out) :: u(4)
+    integer, intent(in), optional :: substep
+    integer(kind=8) :: x0, x1, x2, x3, c3
+
+    c3 = ishft(index, -32)
+    if (present(substep)) c3 = ior(c3, ishft(int(substep, 8), 16))
+    call philox_rounds(iand(index, MASK32), iand(int(step, 8), MASK32), &
+                       int(stream, 8), c3,                              &
+                       iand(int(seed, 8), MASK32), 0_8, x0, x1, x2, x3)
+    ! the top 24 bits, so that the result is exact in single precision
+    u(1) = (real(ishft(x0, -8)) + 0.5) * TWO_M24
+    u(2) = (real(ishft(x1, -8)) + 0.5) * TWO_M24
+    u(3) = (real(ishft(x2, -8)) + 0.5) * TWO_M24
+    u(4) = (real(ishft(x3, -8)) + 0.5) * TWO_M24
+  end subroutine rng_uniform4
+
+  ! u(:, k) = four uniform numbers for index(k), for a whole array of indices
+  pure subroutine rng_uniform(seed, stream, step, index, u, substep)
+    integer,         intent(in)  :: seed, stream, step
+    integer,         intent(in)  :: index(:)
+    real,            intent(out) :: u(:,:)     ! (4, size(index))
+    integer, intent(in), optional :: substep
+    integer(kind=8) :: c0(size(index)), c3(size(index))
+    integer :: sub
+
+    sub = 0
+    if (present(substep)) sub = substep
+    c0 = iand(int(index, 8), MASK32)
+    c3 = ior(ishft(int(index, 8), -32), ishft(int(sub, 8), 16))
+    call uniform_block(seed, stream, step, c0, c3, u)
+  end subroutine rng_uniform
+
+  ! u(:, k) = four uniform numbers for the index first + k - 1, for a run
+  ! of consecutive indices (a row of cells)
+  pure subroutine rng_uniform_run(seed, stream, step, first, u, substep)
+    integer,         intent(in)  :: seed, stream, step
+    integer(kind=8), intent(in)  :: first
+    real,            intent(out) :: u(:,:)     ! (4, n)
+    integer, intent(in), optional :: substep
+    integer(kind=8) :: c0(size(u, 2)), c3(size(u, 2)), index
+    integer :: k, sub
+
+    sub = 0
+    if (present(substep)) sub = substep
+    do k = 1, size(u, 2)
+      index = first + (k - 1)
+      c0(k) = iand(index, MASK32)
+      c3(k) = ior(ishft(index, -32), ishft(int(sub, 8), 16))
+    end do
+    call uniform_block(seed, stream, step, c0, c3, u)
+  end subroutine rng_uniform_run
+
+  ! The numbers of rng_uniform4 for the counter words c0(k), c3(k)
+  pure subroutine uniform_block(seed, stream, step, c0, c3, u)
+    integer,         intent(in)  :: seed, stream, step
+    integer(kind=8), intent(in)  :: c0(:), c3(:)
+    real,            intent(out) :: u(:,:)     ! (4, size(c0))
+    integer(kind=8) :: x0(size(c0)), x1(size(c0)), x2(size(c0)), x3(size(c0))
+
+    call philox_rounds(c0, iand(int(step, 8), MASK32), int(stream, 8), c3, &
+                       iand(int(seed, 8), MASK32), 0_8, x0, x1, x2, x3)
+    ! (the top 24 bits, through 32-bit integers whose conversion to real
+    ! vectorises)
+    u(1, :) = (real(int(ishft(x0, -8), 4)) + 0.5) * TWO_M24
+    u(2, :) = (real(int(ishft(x1, -8), 4)) + 0.5) * TWO_M24
+    u(3, :) = (real(int(ishft(x2, -8), 4)) + 0.5) * TWO_M24
+    u(4, :) = (real(int(ishft(x3, -8), 4)) + 0.5) * TWO_M24
+  end subroutine uniform_block
+
+  ! g(:, k) = four standard normal numbers for index(k), from the uniform
+  ! numbers of rng_uniform (Performance/random checks their moments)
+  pure subroutine rng_normal(seed, stream, step, index, g, substep)
+    integer,         intent(in)  :: seed, stream, step
+    integer,         intent(in)  :: index(:)
+    real,            intent(out) :: g(:,:)     ! (4, size(index))
+    integer, intent(in), optional :: substep
+
+    call rng_uniform(seed, stream, step, index, g, substep)
+    call box_muller(g)
+  end subroutine rng_normal
+
+  ! g(:, k) = four standard normal numbers for the index first + k - 1
+  pure subroutine rng_normal_run(seed, stream, step, first, g, substep)
+    integer,         intent(in)  :: seed, stream, step
+    integer(kind=8), intent(in)  :: first
+    real,            intent(out) :: g(:,:)     ! (4, n)
+    integer, intent(in), optional :: substep
+
+    call rng_uniform_run(seed, stream, step, first, g, substep)
+    call box_muller(g)
+  end subroutine rng_normal_run
+
+  ! Uniform numbers in (0, 1) to normal ones, in place: the pairs
+  ! (u(1), u(2)) and (u(3), u(4)) of each column give two numbers each
+  pure subroutine box_muller(u)
+    real, intent(inout) :: u(:,:)              ! (4, n)
+    real :: r(size(u, 2)), a(size(u, 2))
+
+    r = sqrt(-2.0 * log(u(1, :)))
+    a = TWO_PI * u(2, :)
+    u(1, :) = r * cos(a)
+    u(2, :) = r * sin(a)
+    r = sqrt(-2.0 * log(u(3, :)))
+    a = TWO_PI * u(4, :)
+    u(3, :) = r * cos(a)
+    u(4, :) = r * sin(a)
+  end subroutine box_muller
+
+  ! A positive seed from the clock, for runs that do not set one
+  integer function rng_clock_seed() result(seed)
+    integer(kind=8) :: count
+    integer(kind=8) :: x(4)
+
+    call system_clock(count)
+    x = philox4x32([iand(count, MASK32), ishft(count, -32), 0_8, 0_8], [0_8, 0_8])
+    seed = int(ishft(x(1), -1)) + 1
+    if (seed <= 0) seed = 1
+  end function rng_clock_seed
+
+end module mod_random
@@ -0,0 +1,532 @@
+module mod_simulation
+  ! The simulations run by the program: their parameters, state and
+  ! bookkeeping, and the steps from the initial state to the final output
+  ! (start_replica, step_replica, finish_replica). main runs one simulation,
+  ! or a batch of them side by side; the Python bindings (mod_capi) drive a
+  ! single one step by step.
+  use mod_core_types
+  use mod_field      ! Pure field thermodynamics and kinetics
+  use mod_coupling   ! The specific interaction logic you provided
+  use mod_particles  ! Pure particle repulsion and integration
+  use mod_io         ! Parameters and output
+  use mod_parallel   ! Domain decomposition (serial or MPI)
+  use mod_random     ! Counter-based random numbers
+  use mod_timers     ! Wall-clock time per phase
+  use mod_async_io   ! Output files written while stepping goes on
+  use mod_checkpoint ! Checkpoints for restarts
+  use mod_transport  ! Mean squared displacement and orientation correlation
+  implicit none
+  private :: fail, failed
+
+  ! One simulation: parameters, particles and bookkeeping. Its fields are
+  ! the slices (:,:,r) of the batched field arrays below.
+  type :: Replica_t
+    type(Config_t)    :: cfg
+    ! Particles owned by this process, followed by ghost copies of those of
+    ! neighbouring ranks (see Particles_t)
+    type(Particles_t) :: particles
+    type(Energy_t)    :: energy
+    type(Transport_t) :: transport
+    integer :: t                         ! next step to take
+    ! adaptive time stepping (see step_replica)
+    logical :: adaptive = .false.
+    integer :: n_safe = 0
+    integer(kind=8) :: n_substeps = 0
+    real    :: dt_min
+    ! wall-clock time per phase of the steps taken (see write_timings)
+    type(Timers_t) :: timers
+    integer :: steps_run = 0
+  end type Replica_t
+
+  ! (targets: the Python bindings map the fields and particle arrays, see
+  ! mod_capi)
+  type(Replica_t), allocatable, target :: rep(:)
+  integer :: nrep
+
+  ! Fields of all simulations, one after the other in memory. They carry ng
+  ! ghost layers: (1-ng:Lx+ng, 1-ng:ny+ng, r), own cells 1:Lx, 1:ny
+  real, allocatable, dimension(:,:,:), target :: psi
+  real, allocatable, dimension(:,:,:) :: mu_total
+  ! Pre-allocated noise buffers
+  real, allocatable, dimension(:,:,:) :: csi1, csi2
+  real, allocatable :: psi_prev(:,:,:)         ! field before the substep
+
+  ! adaptive time stepping (see step_replica)
+  integer, parameter :: MAX_DT_LEVEL = 12      ! smallest substep dt/2**12
+  integer, parameter :: SAFE_SUBSTEPS = 8      ! before two substeps are merged
+
+contains
+
+  ! The batched field arrays, for the nrep simulations of rep
+  subroutine alloc_fields()
+    integer :: r
+
+    associate (c => rep(1)%cfg)
+      allocate(psi(1-c%ng:c%Lx+c%ng, 1-c%ng:c%ny+c%ng, nrep))
+    end associate
+    allocate(mu_total, csi1, csi2, mold=psi)
+    psi = 0.0; mu_total = 0.0; csi1 = 0.0; csi2 = 0.0
+    if (any([(rep(r)%cfg%adapt_drift > 0.0 .or. rep(r)%cfg%adapt_dpsi > 0.0, r = 1, nrep)])) &
+      allocate(psi_prev, mold=psi)
+  end subroutine alloc_fields
+
+  subroutine free_fields()
+
+    deallocate(psi, mu_total, csi1, csi2)
+    if (allocated(psi_prev)) deallocate(psi_prev)
+  end subroutine free_fields
+
+  ! Simulations of a batch must share what the batched arrays and the
+  ! tables built on first use (coupling kernel, spectral multiplier) assume
+  subroutine check_batch()
+    type(Config_t) :: a, b
+    integer :: q
+
+    a = rep(1)%cfg
+    do q = 2, nrep
+      b = rep(q)%cfg
+      if (b%Lx /= a%Lx .or. b%Ly /= a%Ly .or. b%Reff /= a%Reff .or. &
+          b%coupling_table /= a%coupling_table) then
+        print*, 'the simulations of a batch must share Lx, Ly, Reff and the coupling table'
+        stop 1
+      end if
+      if (a%field_solver == 'spectral' .or. b%field_solver == 'spectral') then
+        if (b%field_solver /= a%field_solver .or. b%dt /= a%dt .or. b%M /= a%M .or. &
+            b%kappa /= a%kappa .or. b%spectral_A /= a%spectral_A .or. &
+            a%adapt_drift + a%adapt_dpsi + b%adapt_drift + b%adapt_dpsi > 0.0) then
+          print*, 'with the spectral solver, the simulations of a batch must share'
+          print*, 'dt, M, kappa and spectral_A, and use a fixed dt'
+          stop 1
+        end if
+      end if
+    end do
+  end subroutine check_batch
+
+  ! '[directory] ' in front of the messages of a simulation of a batch
+  function label(r) result(s)
+    integer, intent(in) :: r
+    character(len=:), allocatable :: s
+
+    s = ''
+    if (nrep > 1) s = '[' // trim(rep(r)%cfg%dir(1:len_trim(rep(r)%cfg%dir)-1)) // '] '
+  end function label
+
+  ! A simulation that cannot go on ends the program, unless the caller asked
+  ! for ok (the Python bindings, see mod_capi)
+  subroutine fail(ok)
+    logical, intent(out), optional :: ok
+
+    if (present(ok)) then
+      ok = .false.
+    else
+      call par_abort(1)
+    end if
+  end subroutine fail
+
+  ! Whether ok, if present, reports a failure
+  logical function failed(ok)
+    logical, intent(in), optional :: ok
+
+    failed = .false.
+    if (present(ok)) failed = .not. ok
+  end function failed
+
+  ! Initial (or restart) state of simulation r, the dry run for the
+  ! energies and the output of the initial state. A restart without a
+  ! usable checkpoint ends the program, or, with ok present, sets it to
+  ! false.
+  subroutine start_replica(r, ok)
+    integer, intent(in) :: r
+    logical, intent(out), optional :: ok
+    ! Global initial state, built by the first process
+    real, allocatable  :: psi_init(:,:)
+    type(Particles_t)  :: particles_init
+    real    :: psieq, err_psic, err_dpsic
+    integer :: t, k, seed, level
+    ! restart variables
+    logical :: restart_found, equilibrated_found, exists, loaded
+    character(len=:), allocatable :: ckpt
+
+    associate (cfg => rep(r)%cfg, particles => rep(r)%particles)
+
+    if (present(ok)) ok = .true.
+    if (nrep > 1) print*, 'simulation ', r, ': ', trim(cfg%dir)
+
+    ! seed from the clock unless one is given (rank 0's is broadcast below;
+    ! a restart takes the one stored in the checkpoint)
+    if (cfg%rng_seed == 0) cfg%rng_seed = rng_clock_seed()
+
+    ! conversions
+    psieq = sqrt( cfg%tau  / cfg%u )
+    if (rank == 0) then
+      print*, 'Equilibirum psi=',psieq
+      print*, 'affinity before scaling = ',cfg%affinity
+    end if
+    cfg%affinity = cfg%affinity * psieq
+    if (rank == 0) print*, 'affinity after scaling = ',cfg%affinity
+
+    ! Initialize field noise and random particle positions
+    ! CHECK FOR RESTART: checkpoint.bin or, should it be missing or damaged,
+    ! the older ones kept next to it (see mod_checkpoint)
+    restart_found = .false.
+    do k = 0, cfg%checkpoint_keep - 1
+      inquire(file=rotated_name(trim(cfg%dir)//'checkpoint.bin', k), exist=exists)
+      restart_found = restart_found .or. exists
+    end do
+
+    ! CHECK FOR START FROM EQUILIBRATION
+    inquire(file=trim(cfg%dir)//'equilibrated.bin', exist=equilibrated_found)
+
+    ! The first process builds (or loads) the whole state, which is then
+    ! broadcast and cut into the slabs of the decomposition
+    allocate(psi_init(cfg%Lx, cfg%Ly))
+    call particles_alloc(particles_init, cfg%Np)
+    particles_init%n = cfg%Np
+    if (rank == 0) then
+      if (restart_found) then
+          print *, ">>> RESTART FILE DETECTED. Loading state..."
+          ! the newest checkpoint that passes the checks (this also restores
+          ! the random seed and adaptive dt level of the run)
+          seed = cfg%rng_seed
+          level = cfg%dt_level
+          loaded = .false.
+          do k = 0, cfg%checkpoint_keep - 1
+            ckpt = rotated_name(trim(cfg%dir)//'checkpoint.bin', k)
+            inquire(file=ckpt, exist=exists)
+            if (.not. exists) cycle
+            call load_checkpoint(ckpt, cfg, t, psi_init, particles_init, loaded, seed, level, &
+                                 rep(r)%transport)
+            if (loaded) exit
+          end do
+          if (.not. loaded) then
+            print *, "no usable checkpoint; remove the checkpoint.bin* files to start afresh"
+            call fail(ok)
+            return
+          end if
+          if (k > 0) print *, "restarting from ", ckpt
+          cfg%rng_seed = seed
+          cfg%dt_level = level
+          rep(r)%t = t + 1
+      elseif (equilibrated_found) then
+          print *, ">>> EQUILIBRATED FILE DETECTED. Loading state..."
+          call load_checkpoint(trim(cfg%dir)//'equilibrated.bin', cfg, t, psi_init, &
+                               particles_init, loaded)
+          if (.not. loaded) then
+            call fail(ok)
+            return
+          end if
+          rep(r)%t = 1
+      else
+          print *, ">>> No restart file. Initializing new system."
+          if (cfg%custom_init) then
+            print*, 'initialising with a custom-defined state'
+            print*, 'by default: sinusoidal spanning whole system'
+            print*, 'to modify initial custom state: ``initialize_custom_system.f90``'
+            print*, ''
+            call initialize_custom_system(particles_init, psi_init, cfg)
+          else
+            print*, 'initialise completely random state'
+            call initialize_system(particles_init, psi_init, cfg)
+          endif
+          rep(r)%t = 1
+      end if
+    end if
+    call par_bcast(rep(r)%t)
+    call par_bcast(cfg%rng_seed)
+    call par_bcast(cfg%dt_level)
+    call par_bcast(psi_init)
+    call par_bcast(particles_init)
+    call distribute_state(psi_init, particles_init, psi(:,:,r), particles, cfg)
+    deallocate(psi_init)
+    call particles_alloc(particles_init, 0)
+    call halo_exchange(psi(:,:,r), cfg)
+
+    ! transport statistics: continued from the checkpoint, else starting
+    ! with the initial state as the first sample
+    call transport_init(rep(r)%transport, cfg)
+    if (cfg%transport_interval > 0 .and. rep(r)%t == 1) &
+      call transport_sample(rep(r)%transport, particles, cfg)
+
+    ! Print Header to Screen
+    if (rank == 0) then
+      print *, "----------------------------------------------"
+      print *, "Simulation Started"
+      print "(A, I4, A, I4)", " Grid Size: ", cfg%Lx, " x ", cfg%Ly
+      print "(A, I6)",         " Particles: ", cfg%Np
+      print "(A, I10)",        " Total Steps: ", cfg%total_steps
+      print *, "----------------------------------------------"
+      print *, "Additional parameters"
+      print*, "particle surface fraction ", &
+                cfg%Np * pi * cfg%R0**2 / ( cfg%Lx* cfg%Ly )
+      print*, "Pe ", cfg%vact / ( cfg%diam * cfg%temperature / cfg%gamm_R )
+      print*, "field solver ", trim(cfg%field_solver)
+      print*, "random seed ", cfg%rng_seed
+      if (cfg%coupling_table > 0) then
+        call coupling_table_error(cfg, err_psic, err_dpsic)
+        print "(A, I8, A, ES9.2, A, ES9.2)", " coupling table: ", cfg%coupling_table, &
+              " bins, max rel. error psic ", err_psic, ", dpsic ", err_dpsic
+      end if
+      print *, "----------------------------------------------"
+    end if
+
+    t = rep(r)%t
+    if (rank == 0) print*, 'do a <<dry>> run at t=',t, 'to calculate properties'
+    call calculate_mu_pure(mu_total(:,:,r), psi(:,:,r), cfg, rep(r)%energy%field)
+    call exchange_ghosts(particles, cfg)
+    call compute_pp_forces(particles, cfg, rep(r)%energy%pp)
+    call coupling(mu_total(:,:,r), psi(:,:,r), particles, cfg, rep(r)%energy%coupling)
+
+    if (rank == 0) print*, 'save initial state'
+    call write_stats(t, psi(:,:,r), particles, cfg, rep(r)%energy)
+    call write_data(psi(:,:,r), particles, t, cfg)
+    ! Print status to screen
+    if (rank == 0) print "(2A, I10, A, F6.2, A)", label(r), " >> Step: ", t, &
+          " (", (real(t)/real(cfg%total_steps))*100.0, "%) - Data Saved."
+
+    rep(r)%adaptive = (cfg%adapt_drift > 0.0 .or. cfg%adapt_dpsi > 0.0)
+    rep(r)%n_substeps = 0
+    rep(r)%dt_min = cfg%dt / 2**cfg%dt_level
+
+    end associate
+  end subroutine start_replica
+
+  ! Step t = rep(r)%t of simulation r, with its output. An unstable step
+  ! ends the program, or, with ok present, sets it to false (the step is
+  ! left half done: the field has been advanced, the particles have not).
+  subroutine step_replica(r, ok)
+    integer, intent(in) :: r
+    logical, intent(out), optional :: ok
+    type(Config_t) :: scfg                       ! cfg with the substep dt
+    logical :: energy_step            ! evaluate the energies in this step
+    real    :: ratio
+    integer :: t, k
+
+    associate (cfg => rep(r)%cfg, particles => rep(r)%particles, tm => rep(r)%timers)
+    if (present(ok)) ok = .true.
+    t = rep(r)%t
+    call timer_reset(tm)
+
+    ! The energies are only evaluated for write_stats: on stats steps and
+    ! on the last step (reported with the final state)
+    energy_step = (mod(t, cfg%stats_interval) == 0 .or. t == cfg%total_steps)
+
+    if (.not. rep(r)%adaptive) then
+      call advance(r, cfg, 0, energy_step, ratio, ok)
+      if (failed(ok)) return
+    else
+      ! Adaptive stepping: step t is covered by 2**dt_level substeps of
+      ! dt/2**dt_level, so that output and stats stay on the grid of dt.
+      ! A substep that would exceed a limit (ratio > 1) is undone and redone
+      ! as two of half the size; after SAFE_SUBSTEPS substeps well inside
+      ! the limits, two substeps are merged again (up to dt itself). The
+      ! random numbers of substep k at level L are keyed by 2**L + k - 1,
+      ! so refined substeps draw new ones and level 0 matches fixed dt.
+      k = 0
+      do while (k < 2**cfg%dt_level)
+        scfg = cfg
+        scfg%dt = cfg%dt / 2**cfg%dt_level
+        call advance(r, scfg, 2**cfg%dt_level + k - 1, &
+                     energy_step .and. k == 2**cfg%dt_level - 1, ratio, ok)
+        if (failed(ok)) return
+        if (ratio > 1.0 .and. cfg%dt_level < MAX_DT_LEVEL) then
+          psi(:,:,r) = psi_prev(:,:,r)
+          call timer_lap(tm, PH_EVOLVE)
+          cfg%dt_level = cfg%dt_level + 1
+          k = 2 * k
+          rep(r)%n_safe = 0
+          rep(r)%dt_min = min(rep(r)%dt_min, cfg%dt / 2**cfg%dt_level)
+          call log_dt(r, k, 'refine')
+          cycle
+        end if
+        k = k + 1
+        rep(r)%n_substeps = rep(r)%n_substeps + 1
+        rep(r)%n_safe = merge(rep(r)%n_safe + 1, 0, ratio < 0.5)
+        if (rep(r)%n_safe >= SAFE_SUBSTEPS .and. cfg%dt_level > 0 .and. mod(k, 2) == 0) then
+          cfg%dt_level = cfg%dt_level - 1
+          k = k / 2
+          rep(r)%n_safe = 0
+          call log_dt(r, k, 'coarsen')
+        end if
+      end do
+    end if
+
+    if (cfg%sort_interval > 0) then
+      if (mod(t, cfg%sort_interval) == 0) call sort_particles(particles, cfg)
+    end if
+    call timer_lap(tm, PH_SORT)
+
+    if (cfg%transport_interval > 0) then
+      if (mod(t, cfg%transport_interval) == 0) call transport_sample(rep(r)%transport, particles, cfg)
+    end if
+    call timer_lap(tm, PH_STATS)
+
+    ! D. I/O and Standard Output
+    if (mod(t, cfg%save_interval) == 0) then
+        ! Print status to screen
+        if (rank == 0) print "(2A, I10, A, F6.2, A)", label(r), " >> Step: ", t, &
+              " (", (real(t)/real(cfg%total_steps))*100.0, "%) - Data Saved."
+
+        call write_data(psi(:,:,r), particles, t, cfg)
+    end if
+    call timer_lap(tm, PH_IO)
+
+    ! Statistical Saving (Summary file)
+    if (mod(t, cfg%stats_interval) == 0) then
+      call write_stats(t, psi(:,:,r), particles, cfg, rep(r)%energy)
+      call write_transport(rep(r)%transport, cfg)
+    endif
+    call timer_lap(tm, PH_STATS)
+
+    ! PERIODIC CHECKPOINT (e.g., every save_interval)
+    if (mod(t, cfg%save_interval) == 0) then
+        call save_checkpoint(trim(cfg%dir)//'checkpoint.bin', t, psi(:,:,r), particles, cfg, &
+                             rep(r)%transport)
+    end if
+    call timer_lap(tm, PH_IO)
+
+    rep(r)%steps_run = rep(r)%steps_run + 1
+    rep(r)%t = t + 1
+    end associate
+  end subroutine step_replica
+
+  ! Final output of simulation r
+  subroutine finish_replica(r)
+    integer, intent(in) :: r
+    integer :: t
+
+    associate (cfg => rep(r)%cfg, particles => rep(r)%particles)
+    t = rep(r)%t
+
+    ! save final state
+    if (rank == 0) then
+      print*, label(r), "saving final state at t=",t
+      print*, label(r), 'saving state at *.txt, stats at *.dat and checkpoint.bin'
+    end if
+    call write_data(psi(:,:,r), particles, t, cfg)
+    call write_stats(t, psi(:,:,r), particles, cfg, rep(r)%energy)
+    call write_transport(rep(r)%transport, cfg)
+    ! (t is one past the last step here: the checkpoint holds the state after
+    ! step t-1, so that a restart continues with the random numbers of step t)
+    call save_checkpoint(trim(cfg%dir)//'checkpoint.bin', t - 1, psi(:,:,r), particles, cfg, &
+                         rep(r)%transport)
+
+    if (rep(r)%adaptive .and. rank == 0) then
+      print "(2A, I12, A, ES12.4)", label(r), " adaptive dt: substeps ", rep(r)%n_substeps, &
+            ", smallest dt ", rep(r)%dt_min
+    end if
+    end associate
+  end subroutine finish_replica
+
+  ! One step of scfg%dt of simulation r: field and particles from time t to
+  ! t + scfg%dt. substep keys the random numbers (0 without adaptive
+  ! stepping). With adaptive stepping, ratio is the larger of (particle
+  ! drift)/(drift limit) and (deterministic change of psi)/(dpsi limit); if
+  ! it exceeds 1 the particles have not been moved and psi_prev holds the
+  ! field before the step. ok as for step_replica.
+  subroutine advance(r, scfg, substep, energy, ratio, ok)
+    integer,        intent(in) :: r
+    type(Config_t), intent(in) :: scfg
+    integer,        intent(in) :: substep
+    logical,        intent(in) :: energy
+    real,           intent(out) :: ratio
+    logical,        intent(out), optional :: ok
+    real :: dpsi_max
+    integer :: i, j
+
+    if (present(ok)) ok = .true.
+    associate (particles => rep(r)%particles, curr_energy => rep(r)%energy, &
+               t => rep(r)%t, tm => rep(r)%timers)
+
+    ratio = 0.0
+    if (rep(r)%adaptive) psi_prev(:,:,r) = psi(:,:,r)
+
+    ! A. Thermodynamics: Field & Interaction
+    ! 1. Pure Field Chemical Potential (Cahn-Hilliard bulk + surface)
+    call calculate_mu_pure(mu_total(:,:,r), psi(:,:,r), scfg, curr_energy%field, energy)
+    call timer_lap(tm, PH_MU)
+
+    ! 2. Coupling (Your specific logic: psic bump, dpsi, and integrated forces)
+    ! This updates mu_total and fills particles%fx and %fy
+    if ( scfg%sigma>0.0 ) call coupling(mu_total(:,:,r), psi(:,:,r), particles, scfg, &
+                                        curr_energy%coupling, energy)
+    call timer_lap(tm, PH_COUPLING)
+
+    ! B. Field Kinetics: Diffusion Step (Model B)
+    ! d_psi/dt = M * Laplacian(mu_total)
+    if (scfg%field_solver == 'spectral') then
+      call evolve_field_spectral(psi(:,:,r), mu_total(:,:,r), scfg)
+    else
+      call halo_exchange(mu_total(:,:,r), scfg)
+      call timer_lap(tm, PH_HALO)
+      call evolve_field_model_b(psi(:,:,r), mu_total(:,:,r), scfg)
+    end if
+
+    ! (the limit on the change of psi applies to the deterministic update:
+    ! the noise scales as sqrt(dt) and would keep the step small)
+    if (rep(r)%adaptive .and. scfg%adapt_dpsi > 0.0) then
+      dpsi_max = 0.0
+      !$omp parallel do private(i) reduction(max:dpsi_max) schedule(static)
+      do j = 1, scfg%ny
+        do i = 1, scfg%Lx
+          dpsi_max = max(dpsi_max, abs(psi(i,j,r) - psi_prev(i,j,r)))
+        end do
+      end do
+      !$omp end parallel do
+      ratio = par_max(dpsi_max) / scfg%adapt_dpsi
+      call timer_lap(tm, PH_EVOLVE)
+      if (ratio > 1.0 .and. scfg%dt_level < MAX_DT_LEVEL) return
+    end if
+
+    call timer_lap(tm, PH_EVOLVE)
+    if ( scfg%noiseStrength > 0.0) call noise(psi(:,:,r), scfg, csi1(:,:,r), csi2(:,:,r), &
+                                              t, substep)
+    call timer_lap(tm, PH_NOISE)
+
+    ! refresh the periodic ghost layers of the updated field
+    call halo_exchange(psi(:,:,r), scfg)
+
+    ! C. Particle Kinetics: Repulsion & Motion
+    ! 1. Pure Particle-Particle Repulsion (using hard-core R0)
+    !    (ghost copies of the neighbours' boundary particles are appended)
+    call exchange_ghosts(particles, scfg)
+    call timer_lap(tm, PH_HALO)
+    call compute_pp_forces(particles, scfg, curr_energy%pp, energy)
+
+    if (rep(r)%adaptive .and. scfg%adapt_drift > 0.0) then
+      ratio = max(ratio, par_max(max_drift(particles, scfg)) / (scfg%adapt_drift * scfg%diam))
+      call timer_lap(tm, PH_PP)
+      if (ratio > 1.0 .and. scfg%dt_level < MAX_DT_LEVEL) return
+    end if
+
+    ! 2. Integrate Brownian Motion (Langevin / Euler-Maruyama)
+    ! Uses combined forces: F_total = F_coupling + F_repulsion
+    call timer_lap(tm, PH_PP)
+    call integrate_particles(particles, scfg, t, substep, ok)
+    call timer_lap(tm, PH_INTEGRATE)
+    if (failed(ok)) return
+    call migrate_particles(particles, scfg)
+    call timer_lap(tm, PH_HALO)
+    end associate
+  end subroutine advance
+
+  ! Append a change of the substep of simulation r (k substeps of the new
+  ! size into step t) to dt_history.dat
+  subroutine log_dt(r, k, event)
+    integer,          intent(in) :: r, k
+    character(len=*), intent(in) :: event
+    integer :: iunit
+    logical :: exists
+
+    if (rank /= 0) return
+    associate (cfg => rep(r)%cfg, t => rep(r)%t)
+    inquire(file=trim(cfg%dir)//'dt_history.dat', exist=exists)
+    open(newunit=iunit, file=trim(cfg%dir)//'dt_history.dat', status='unknown', &
+         position='append')
+    if (.not. exists) write(iunit, '(A)') '#      step          time            dt  level  event'
+    write(iunit, '(I11, 2ES14.6, I7, 2X, A)') t, (t - 1 + real(k) / 2**cfg%dt_level) * cfg%dt, &
+          cfg%dt / 2**cfg%dt_level, cfg%dt_level, event
+    close(iunit)
+    end associate
+  end subroutine log_dt
+
+end module mod_simulation
@@ -1,36 +1,81 @@
 module mod_stats
     use mod_core_types
+    use mod_parallel
+    use mod_fft
     implicit none
 
+    ! FFT plans of structure_factor (shared by the simulations of a batch,
+    ! which have the same lattice)
+    type(Fft1d_t), save, private :: sk_fx, sk_fy
+
+    ! Topology of the phase psi < psimean as a cubical complex on the
+    ! periodic lattice: its sites are the vertices, bonds between two of
+    ! them the edges and 2x2 plaquettes of four of them the faces. The
+    ! Euler characteristic V - E + F is the number of domains of the phase
+    ! minus the number of holes in them (domains wrapping around the
+    ! periodic box count 0). The interface length is the number of bonds
+    ! cut by the interface psi = psimean, in lattice spacings.
+    type :: Topology_t
+        integer :: nv, ne, nf
+        integer :: euler
+        integer :: length
+    end type Topology_t
+
 contains
 
-    subroutine calculate_domain_size(psi, cfg, avg_size)
-        real,    intent(in)  :: psi(:,:)
+    ! psi is ghost-padded (see mod_parallel) with valid ghost layers.
+    ! With topo, the topology of the phase psi < psimean is counted in the
+    ! same pass (see Topology_t).
+    subroutine calculate_domain_size(psi, cfg, avg_size, topo)
         type(Config_t), intent(in) :: cfg
+        real,    intent(in)  :: psi(1-cfg%ng:, 1-cfg%ng:)
         real,    intent(out) :: avg_size
-        integer :: i, j, crossings
-        real :: psi_mean
+        type(Topology_t), intent(out), optional :: topo
+        integer :: i, j, crossings, nv, ne, nf, s00, s10, s01, s11
+        real :: psi_mean, d00, d10, d01
 
         crossings = 0
+        nv = 0; ne = 0; nf = 0
         psi_mean = cfg%psimean
 
-        ! Count horizontal crossings
-        do j = 1, cfg%Ly
-            do i = 1, cfg%Lx
-                if ((psi(i,j) - psi_mean) * (psi(modulo(i, cfg%Lx)+1, j) - psi_mean) < 0.0) then
-                    crossings = crossings + 1
-                end if
+        ! Count horizontal and vertical crossings; with topo, the site
+        ! (i,j), with its bonds and plaquette towards i+1 and j+1, is also a
+        ! vertex, up to two edges and a face of the phase psi < psi_mean
+        ! when those of its corners are (same pass over the field)
+        if (present(topo)) then
+            do j = 1, cfg%ny
+                do i = 1, cfg%Lx
+                    d00 = psi(i,j) - psi_mean
+                    d10 = psi(i+1, j) - psi_mean
+                    d01 = psi(i, j+1) - psi_mean
+                    crossings = crossings + merge(1, 0, d00 * d10 < 0.0) + merge(1, 0, d00 * d01 < 0.0)
+                    s00 = merge(1, 0, d00 < 0.0)
+                    s10 = merge(1, 0, d10 < 0.0)
+                    s01 = merge(1, 0, d01 < 0.0)
+                    s11 = merge(1, 0, psi(i+1, j+1) < psi_mean)
+                    nv = nv + s00
+                    ne = ne + s00 * (s10 + s01)
+                    nf = nf + s00 * s10 * s01 * s11
+                end do
             end do
-        end do
-
-        ! Count vertical crossings
-        do i = 1, cfg%Lx
-            do j = 1, cfg%Ly
-                if ((psi(i,j) - psi_mean) * (psi(i, modulo(j, cfg%Ly)+1) - psi_mean) < 0.0) then
-                    crossings = crossings + 1
-                end if
+        else
+            do j = 1, cfg%ny
+                do i = 1, cfg%Lx
+                    d00 = psi(i,j) - psi_mean
+                    crossings = crossings + merge(1, 0, d00 * (psi(i+1, j) - psi_mean) < 0.0) &
+                                          + merge(1, 0, d00 * (psi(i, j+1) - psi_mean) < 0.0)
+                end do
             end do
-        end do
+        end if
+
+        crossings = par_sum(crossings)
+        if (present(topo)) then
+            topo%nv = par_sum(nv)
+            topo%ne = par_sum(ne)
+            topo%nf = par_sum(nf)
+            topo%euler = topo%nv - topo%ne + topo%nf
+            topo%length = crossings
+        end if
 
         ! Avoid division by zero: Domain size ~ System Area / Crossings
         if (crossings > 0) then
@@ -41,15 +86,152 @@ contains
     end subroutine calculate_domain_size
 
     subroutine psi_averages(psi, cfg , psiavg, psiabsavg)
-        real,    intent(in)  :: psi(:,:)
         type(Config_t), intent(in) :: cfg
+        real,    intent(in)  :: psi(1-cfg%ng:, 1-cfg%ng:)
         real,    intent(out) :: psiavg, psiabsavg
-        !integer :: i, j 
+        real :: ncells
+
+        ncells = real(cfg%Lx) * real(cfg%Ly)
 
-        psiavg = sum( psi ) / real( size(psi) )
+        psiavg = par_sum( sum( psi(1:cfg%Lx, 1:cfg%ny) ) ) / ncells
 
-        psiabsavg = sum( abs( psi - psiavg ) ) / real( size(psi) )
+        psiabsavg = par_sum( sum( abs( psi(1:cfg%Lx, 1:cfg%ny) - psiavg ) ) ) / ncells
 
     end subroutine psi_averages 
 
+    ! Circularly averaged structure factor of psi,
+    !   S(k) = < |psi_q|^2 > / (Lx Ly)  over the wave vectors q with nint(|q|/dk) = n,
+    !   k = n dk,  n = 1 .. min(Lx,Ly)/2,  dk = 2 pi / min(Lx,Ly),
+    ! psi_q being the Fourier transform of psi - <psi>, and its first moment
+    ! k1 = sum k S(k) / sum S(k), whose inverse 2 pi / k1 measures the domain
+    ! size. The field is gathered on the first process, which alone returns
+    ! sk and k1.
+    subroutine structure_factor(psi, cfg, sk, k1)
+        type(Config_t), intent(in) :: cfg
+        real,    intent(in)  :: psi(1-cfg%ng:, 1-cfg%ng:)
+        real,    intent(out) :: sk(:)   ! min(Lx,Ly)/2 shells
+        real,    intent(out) :: k1
+        real,    allocatable :: g(:,:)
+        complex, allocatable :: a(:,:)
+        real(kind=8) :: ssum(size(sk)), dk, qx, qy
+        integer :: nmodes(size(sk)), i, j, n, nk
+
+        nk = size(sk)
+        allocate(g(cfg%Lx, merge(cfg%Ly, 0, rank == 0)))
+        call par_gather_field(psi, g, cfg)
+        sk = 0.0
+        k1 = 0.0
+        if (rank /= 0) return
+
+        !$omp critical (sk_plans)
+        if (sk_fx%n /= cfg%Lx .or. sk_fy%n /= cfg%Ly) then
+            call fft_plan(sk_fx, cfg%Lx)
+            call fft_plan(sk_fy, cfg%Ly)
+        end if
+        !$omp end critical (sk_plans)
+
+        allocate(a(cfg%Lx, cfg%Ly))
+        a = cmplx(g - real(sum(real(g, 8)) / (real(cfg%Lx, 8) * cfg%Ly)), 0.0)
+        call fft_2d(sk_fx, sk_fy, a, -1)
+
+        ! shells of |q|, with the wave numbers folded into [-pi, pi)
+        dk = 2.0d0 * PI_DP / min(cfg%Lx, cfg%Ly)
+        ssum = 0.0d0
+        nmodes = 0
+        do j = 1, cfg%Ly
+            qy = 2.0d0 * PI_DP * (modulo(j - 1 + cfg%Ly / 2, cfg%Ly) - cfg%Ly / 2) / cfg%Ly
+            do i = 1, cfg%Lx
+                qx = 2.0d0 * PI_DP * (modulo(i - 1 + cfg%Lx / 2, cfg%Lx) - cfg%Lx / 2) / cfg%Lx
+                n = nint(sqrt(qx**2 + qy**2) / dk)
+                if (n >= 1 .and. n <= nk) then
+                    ssum(n) = ssum(n) + abs(a(i,j))**2
+                    nmodes(n) = nmodes(n) + 1
+                end if
+            end do
+        end do
+        ssum = ssum / (max(nmodes, 1) * (real(cfg%Lx, 8) * cfg%Ly))
+        sk = real(ssum)
+        if (sum(ssum) > 0.0d0) k1 = real(dk * sum([(n * ssum(n), n = 1, nk)]) / sum(ssum))
+    end subroutine structure_factor
+
+    ! Droplets: clusters of the sites with psi < threshold, joined to their
+    ! neighbours along x and y (as ndimage.label does) across the periodic
+    ! boundaries, by union-find on the field gathered on the first process,
+    ! which alone returns the sizes (in sites) of the ndrop droplets.
+    subroutine label_droplets(psi, cfg, threshold, sizes, ndrop)
+        type(Config_t), intent(in) :: cfg
+        real,    intent(in)  :: psi(1-cfg%ng:, 1-cfg%ng:)
+        real,    intent(in)  :: threshold
+        integer, allocatable, intent(out) :: sizes(:)
+        integer, intent(out) :: ndrop
+        real,    allocatable :: g(:,:)
+        integer, allocatable :: parent(:), nsites(:)
+        integer :: nx, ny, i, j, c
+
+        nx = cfg%Lx
+        ny = cfg%Ly
+        allocate(g(nx, merge(ny, 0, rank == 0)))
+        call par_gather_field(psi, g, cfg)
+        ndrop = 0
+        if (rank /= 0) then
+            allocate(sizes(0))
+            return
+        end if
+
+        ! parent(c) of the site c = i + (j-1)*nx, 0 outside the droplets;
+        ! every site is joined to its left and lower neighbours, then the
+        ! first column and row to the last ones
+        allocate(parent(nx * ny))
+        parent = 0
+        do j = 1, ny
+            do i = 1, nx
+                if (g(i,j) >= threshold) cycle
+                c = i + (j - 1) * nx
+                parent(c) = c
+                if (i > 1) call join(c, c - 1)
+                if (j > 1) call join(c, c - nx)
+            end do
+        end do
+        do j = 1, ny
+            call join(1 + (j - 1) * nx, j * nx)
+        end do
+        do i = 1, nx
+            call join(i, i + (ny - 1) * nx)
+        end do
+
+        allocate(nsites(nx * ny))
+        nsites = 0
+        do c = 1, nx * ny
+            if (parent(c) /= 0) then
+                i = find(c)
+                nsites(i) = nsites(i) + 1
+            end if
+        end do
+        sizes = pack(nsites, nsites > 0)
+        ndrop = size(sizes)
+
+    contains
+
+        ! Root of the cluster of site c, halving the path on the way
+        integer function find(c0) result(c)
+            integer, intent(in) :: c0
+            c = c0
+            do while (parent(c) /= c)
+                parent(c) = parent(parent(c))
+                c = parent(c)
+            end do
+        end function find
+
+        ! Merge the clusters of two droplet sites (the lower root wins)
+        subroutine join(a, b)
+            integer, intent(in) :: a, b
+            integer :: ra, rb
+            if (parent(a) == 0 .or. parent(b) == 0) return
+            ra = find(a)
+            rb = find(b)
+            parent(max(ra, rb)) = min(ra, rb)
+        end subroutine join
+
+    end subroutine label_droplets
+
 end module mod_stats
\ No newline at end of file
@@ -0,0 +1,101 @@
+module mod_timers
+  ! Wall-clock time per phase of the time step (system_clock based, so that
+  ! it stays meaningful with threads). A Timers_t is advanced lap by lap:
+  ! timer_lap(tm, phase) charges the time since the previous lap to phase.
+  ! Every simulation of a batch keeps its own Timers_t (see main).
+  use mod_core_types
+  use mod_parallel
+  implicit none
+  private
+  public :: Timers_t, timer_reset, timer_lap, timer_seconds, write_timings
+
+  integer, parameter, public :: PH_MU = 1, PH_COUPLING = 2, PH_EVOLVE = 3, PH_NOISE = 4, &
+                                PH_HALO = 5, PH_PP = 6, PH_INTEGRATE = 7, PH_SORT = 8, &
+                                PH_STATS = 9, PH_IO = 10
+  integer, parameter, public :: NPHASES = 10
+  character(len=12), parameter :: PHASE_NAME(NPHASES) = [character(len=12) :: &
+    'field_mu', 'coupling', 'field_evolve', 'noise', 'halo', 'pp_forces', &
+    'integrate', 'sort', 'stats', 'io']
+
+  type :: Timers_t
+    integer(kind=8) :: last = 0               ! clock at the previous lap
+    integer(kind=8) :: ticks(NPHASES) = 0     ! accumulated per phase
+  end type Timers_t
+
+contains
+
+  ! Start timing from now (the time since the last lap is not charged)
+  subroutine timer_reset(tm)
+    type(Timers_t), intent(inout) :: tm
+
+    call system_clock(tm%last)
+  end subroutine timer_reset
+
+  ! Charge the time since the previous lap to phase
+  subroutine timer_lap(tm, phase)
+    type(Timers_t), intent(inout) :: tm
+    integer,        intent(in)    :: phase
+    integer(kind=8) :: now
+
+    call system_clock(now)
+    tm%ticks(phase) = tm%ticks(phase) + (now - tm%last)
+    tm%last = now
+  end subroutine timer_lap
+
+  ! Seconds spent in phase so far
+  real function timer_seconds(tm, phase)
+    type(Timers_t), intent(in) :: tm
+    integer,        intent(in) :: phase
+    integer(kind=8) :: rate
+
+    call system_clock(count_rate=rate)
+    timer_seconds = real(tm%ticks(phase)) / real(rate)
+  end function timer_seconds
+
+  ! Summary as JSON: the time loop took wall seconds for steps steps
+  ! (substeps substeps of the particles, see the adaptive time stepping).
+  ! With MPI the slowest rank's time is reported for each phase.
+  subroutine write_timings(filename, tm, cfg, steps, substeps, wall, nthreads)
+    character(len=*), intent(in) :: filename
+    type(Timers_t),   intent(in) :: tm
+    type(Config_t),   intent(in) :: cfg
+    integer,          intent(in) :: steps, nthreads
+    integer(kind=8),  intent(in) :: substeps
+    real,             intent(in) :: wall
+    real    :: sec(NPHASES), total, steps_wall
+    integer :: iunit, k
+
+    do k = 1, NPHASES
+      sec(k) = par_max(timer_seconds(tm, k))
+    end do
+    if (rank /= 0) return
+    total = sum(sec)
+    steps_wall = max(wall, tiny(wall))
+
+    open(newunit=iunit, file=filename, status='replace')
+    write(iunit, '(A)') '{'
+    write(iunit, '(A, I0, A, I0, A)') '  "lattice": [', cfg%Lx, ', ', cfg%Ly, '],'
+    write(iunit, '(A, I0, A)') '  "particles": ', cfg%Np, ','
+    write(iunit, '(A, I0, A)') '  "threads": ', nthreads, ','
+    write(iunit, '(A, I0, A)') '  "ranks": ', nranks, ','
+    write(iunit, '(3A)') '  "precision": "', WP_NAME, '",'
+    write(iunit, '(A, I0, A)') '  "steps": ', steps, ','
+    write(iunit, '(A, I0, A)') '  "substeps": ', substeps, ','
+    write(iunit, '(A, ES12.5, A)') '  "wall_seconds": ', wall, ','
+    write(iunit, '(A, ES12.5, A)') '  "timed_seconds": ', total, ','
+    write(iunit, '(A, ES12.5, A)') '  "steps_per_second": ', steps / steps_wall, ','
+    write(iunit, '(A, ES12.5, A)') '  "particle_updates_per_second": ', &
+          real(cfg%Np) * real(substeps) / steps_wall, ','
+    write(iunit, '(A)') '  "phases": {'
+    do k = 1, NPHASES
+      write(iunit, '(3A, ES12.5, A, ES12.5, A, F7.4, 2A)') '    "', trim(PHASE_NAME(k)), &
+            '": {"seconds": ', sec(k), ', "ms_per_step": ', 1000.0 * sec(k) / max(steps, 1), &
+            ', "fraction": ', sec(k) / max(total, tiny(total)), '}', &
+            trim(merge(',', ' ', k < NPHASES))
+    end do
+    write(iunit, '(A)') '  }'
+    write(iunit, '(A)') '}'
+    close(iunit)
+  end subroutine write_timings
+
+end module mod_timers
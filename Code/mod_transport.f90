@@ -0,0 +1,266 @@
+module mod_transport
+  ! Transport statistics of the particles, accumulated during the run: the
+  ! mean squared displacement of the unwrapped positions (see Particles_t)
+  ! and the orientation autocorrelation <cos(phi(t+tau) - phi(t))>, at
+  ! log-spaced lags tau (multi-tau scheme).
+  !
+  ! Every transport_interval steps the positions and angles of all
+  ! particles are sampled. Level l of the scheme keeps the last TR_P
+  ! samples of those taken every 2**l sampling intervals, and compares each
+  ! sample entering it with the ones before it: level 0 gives the lags
+  ! 1 .. TR_P-1, level l > 0 the lags k*2**l with TR_P/2 <= k < TR_P (the
+  ! shorter ones being those of the level below). The samples are
+  ! decimated, not averaged, so every estimate is the exact average over
+  ! the particles and the time origins used, which are all those available
+  ! on the grid of the level. Memory and work grow with the logarithm of
+  ! the length of the run, not with the number of samples.
+  !
+  ! The samples are gathered on the first process, which alone holds the
+  ! state; it is stored in the checkpoint (see mod_checkpoint), so that a
+  ! restart continues the averages. write_transport rewrites msd.dat with
+  ! the current estimates.
+  !
+  ! Each level keeps an origin per particle (in double precision) and its
+  ! samples relative to it in single precision; the origin moves to the
+  ! newest sample whenever the ring of the level starts over, so that the
+  ! stored values never exceed the displacements over a few lags of the
+  ! level. State and checkpoint take 120 bytes per particle and level
+  ! (TRANSPORT_LEVEL_BYTES), with about log2(total_steps / (7 interval))
+  ! + 1 levels: 1.8 GB for 10**6 particles and 15 levels.
+  use mod_core_types
+  use mod_parallel
+  implicit none
+  private
+  public :: Transport_t, transport_init, transport_sample, write_transport, &
+            transport_words, transport_restore
+
+  integer, parameter :: TR_P = 8                ! samples kept per level
+  integer, parameter, public :: TRANSPORT_LEVEL_BYTES = 3 * (8 + 4 * TR_P)  ! per particle
+
+  type, public :: Transport_t
+    integer :: interval = 0                      ! steps between samples (0 = off)
+    integer :: nlev = 0                          ! levels 0 .. nlev-1
+    integer(kind=8) :: nsample = 0               ! samples taken
+    ! origin(id, c, l) of level l: unwrapped x, y (c = 1, 2) and phi
+    ! (c = 3) of particle id; ring of the samples of each level relative to
+    ! its origin, hist(id, c, slot, l) (first process only)
+    real(kind=8), allocatable :: origin(:,:,:)
+    real(kind=4), allocatable :: hist(:,:,:,:)
+    ! sums over the particles and origins of the squared displacement and
+    ! of cos(dphi) for the lag k*2**l, and the number of origins
+    real(kind=8),    allocatable :: msd(:,:), ori(:,:)   ! (1:TR_P-1, 0:nlev-1)
+    integer(kind=8), allocatable :: norig(:,:)
+  end type Transport_t
+
+contains
+
+  ! Start the statistics of the run (interval cfg%transport_interval), or
+  ! continue those restored from a checkpoint, adding levels if the run
+  ! has been extended. Statistics sampled with another interval are
+  ! dropped.
+  subroutine transport_init(tr, cfg)
+    type(Transport_t), intent(inout) :: tr
+    type(Config_t),    intent(in)    :: cfg
+    type(Transport_t) :: old
+    integer(kind=8) :: c
+    integer :: nlev, l
+
+    ! enough levels for lags up to the length of the run
+    nlev = 1
+    do while (int(TR_P - 1, 8) * 2_8**(nlev - 1) * cfg%transport_interval < cfg%total_steps &
+              .and. nlev < 40)
+      nlev = nlev + 1
+    end do
+
+    if (tr%interval /= cfg%transport_interval .or. cfg%transport_interval == 0) then
+      if (tr%interval > 0 .and. rank == 0) &
+        print *, "transport statistics sampled every ", tr%interval, " steps dropped"
+      tr = Transport_t()
+      tr%interval = cfg%transport_interval
+      if (tr%interval == 0) return
+      tr%nlev = nlev
+      call alloc_levels(tr, merge(cfg%Np, 0, rank == 0))
+      call report_size(tr, cfg)
+      return
+    end if
+
+    if (nlev <= tr%nlev) then
+      call report_size(tr, cfg)
+      return
+    end if
+    call move_alloc(tr%origin, old%origin)
+    call move_alloc(tr%hist, old%hist)
+    call move_alloc(tr%msd, old%msd)
+    call move_alloc(tr%ori, old%ori)
+    call move_alloc(tr%norig, old%norig)
+    call alloc_levels(tr, merge(cfg%Np, 0, rank == 0), nlev)
+    tr%origin(:, :, 0:tr%nlev-1) = old%origin
+    tr%hist(:, :, :, 0:tr%nlev-1) = old%hist
+    tr%msd(:, 0:tr%nlev-1) = old%msd
+    tr%ori(:, 0:tr%nlev-1) = old%ori
+    tr%norig(:, 0:tr%nlev-1) = old%norig
+    ! The top level never wraps (it holds at most TR_P - 1 lags of the run),
+    ! so the samples a new level has missed are all in the level below; too
+    ! few of them to make any pair of its lags yet
+    do l = tr%nlev, nlev - 1
+      tr%origin(:, :, l) = tr%origin(:, :, l - 1)
+      do c = 0, (tr%nsample - 1) / 2_8**l
+        tr%hist(:, :, c, l) = tr%hist(:, :, 2 * c, l - 1)
+      end do
+    end do
+    tr%nlev = nlev
+    call report_size(tr, cfg)
+  end subroutine transport_init
+
+  ! Levels and memory (on the first process) of the statistics
+  subroutine report_size(tr, cfg)
+    type(Transport_t), intent(in) :: tr
+    type(Config_t),    intent(in) :: cfg
+    character(len=16) :: mib
+
+    write(mib, '(F16.1)') real(TRANSPORT_LEVEL_BYTES, 8) * cfg%Np * tr%nlev / 2.0d0**20
+    if (rank == 0) print "(A, I0, 3A)", " transport statistics: ", tr%nlev, " levels, ", &
+      trim(adjustl(mib)), " MiB"
+  end subroutine report_size
+
+  subroutine alloc_levels(tr, np, nlev)
+    type(Transport_t), intent(inout) :: tr
+    integer,           intent(in)    :: np
+    integer, intent(in), optional    :: nlev
+    integer :: n
+
+    n = tr%nlev
+    if (present(nlev)) n = nlev
+    allocate(tr%origin(np, 3, 0:n-1), tr%hist(np, 3, 0:TR_P-1, 0:n-1))
+    allocate(tr%msd(TR_P-1, 0:n-1), tr%ori(TR_P-1, 0:n-1), tr%norig(TR_P-1, 0:n-1))
+    tr%origin = 0.0d0
+    tr%hist = 0.0
+    tr%msd = 0.0d0
+    tr%ori = 0.0d0
+    tr%norig = 0
+  end subroutine alloc_levels
+
+  ! Take the next sample (by all processes)
+  subroutine transport_sample(tr, particles, cfg)
+    type(Transport_t), intent(inout) :: tr
+    type(Particles_t), intent(in)    :: particles
+    type(Config_t),    intent(in)    :: cfg
+    real(kind=8), allocatable :: vals(:,:), g(:,:)
+    integer(kind=8) :: c
+    integer :: n, l, k, m, slot, s0
+
+    n = particles%n
+    allocate(vals(3, n), g(3, merge(cfg%Np, 0, rank == 0)))
+    vals(1,:) = real(particles%x(1:n), 8) + real(particles%ix(1:n), 8) * cfg%Lx
+    vals(2,:) = real(particles%y(1:n), 8) + real(particles%iy(1:n), 8) * cfg%Ly
+    vals(3,:) = real(particles%phi(1:n), 8)
+    call par_gather_particles(vals, particles%id, n, g)
+
+    if (rank == 0) then
+      associate (h => tr%hist, o => tr%origin)
+      ! the sample enters the levels l with 2**l dividing its index
+      do l = 0, tr%nlev - 1
+        if (mod(tr%nsample, 2_8**l) /= 0) exit
+        c = tr%nsample / 2_8**l
+        slot = int(mod(c, int(TR_P, 8)))
+        if (slot == 0) then
+          ! the ring starts over: the sample becomes the origin, and the
+          ! samples still in the ring are moved to it
+          do m = 1, 3
+            if (c > 0) then
+              do k = 1, TR_P - 1
+                h(:, m, k, l) = real(h(:, m, k, l) - (g(m,:) - o(:, m, l)), 4)
+              end do
+            end if
+            o(:, m, l) = g(m,:)
+          end do
+        end if
+        do m = 1, 3
+          h(:, m, slot, l) = real(g(m,:) - o(:, m, l), 4)
+        end do
+        do k = merge(1, TR_P / 2, l == 0), TR_P - 1
+          if (c < k) exit
+          s0 = int(mod(c - k, int(TR_P, 8)))
+          tr%msd(k, l) = tr%msd(k, l) + &
+            sum((real(h(:, 1, slot, l), 8) - h(:, 1, s0, l))**2 + &
+                (real(h(:, 2, slot, l), 8) - h(:, 2, s0, l))**2)
+          tr%ori(k, l) = tr%ori(k, l) + sum(cos(real(h(:, 3, slot, l), 8) - h(:, 3, s0, l)))
+          tr%norig(k, l) = tr%norig(k, l) + 1
+        end do
+      end do
+      end associate
+    end if
+    tr%nsample = tr%nsample + 1
+  end subroutine transport_sample
+
+  ! msd.dat: lag (steps and time), mean squared displacement, orientation
+  ! autocorrelation and number of time origins of every lag reached so far
+  subroutine write_transport(tr, cfg)
+    type(Transport_t), intent(in) :: tr
+    type(Config_t),    intent(in) :: cfg
+    integer(kind=8) :: lag
+    integer :: iunit, l, k
+
+    if (rank /= 0 .or. tr%interval == 0) return
+    open(newunit=iunit, file=trim(cfg%dir)//'msd.dat', status='replace')
+    write(iunit, '(A12, 3A15, A12)') "# Lag_steps", "Lag_time", "MSD", "C_phi", "Origins"
+    do l = 0, tr%nlev - 1
+      do k = merge(1, TR_P / 2, l == 0), TR_P - 1
+        if (tr%norig(k, l) == 0) cycle
+        lag = int(k, 8) * 2_8**l * tr%interval
+        write(iunit, '(I12, 3ES15.6, I12)') lag, real(lag, 8) * cfg%dt, &
+              tr%msd(k, l) / (tr%norig(k, l) * cfg%Np), &
+              tr%ori(k, l) / (tr%norig(k, l) * cfg%Np), tr%norig(k, l)
+      end do
+    end do
+    close(iunit)
+  end subroutine write_transport
+
+  ! The state but for the origins and samples of the levels, as 32-bit
+  ! words for the checkpoint (none if off): 32-bit integers interval, nlev,
+  ! TR_P and Np, then 64-bit nsample, msd, ori and norig (first process
+  ! only). The levels are stored as records of their own, origin(:, :, l)
+  ! followed by hist(:, :, :, l) (see mod_checkpoint).
+  function transport_words(tr) result(w)
+    type(Transport_t), intent(in) :: tr
+    integer(kind=4), allocatable :: w(:)
+    integer(kind=4) :: mold(1)
+
+    if (tr%interval == 0 .or. rank /= 0) then
+      allocate(w(0))
+      return
+    end if
+    w = [integer(kind=4) :: tr%interval, tr%nlev, TR_P, size(tr%hist, 1), &
+         transfer(tr%nsample, mold, 2), transfer(tr%msd, mold), transfer(tr%ori, mold), &
+         transfer(tr%norig, mold)]
+  end function transport_words
+
+  ! Inverse of transport_words, with room for the levels; ok is false (and
+  ! tr untouched) if the words do not hold the state of np particles
+  subroutine transport_restore(tr, w, np, ok)
+    type(Transport_t), intent(inout) :: tr
+    integer(kind=4),   intent(in)    :: w(:)
+    integer,           intent(in)    :: np
+    logical,           intent(out)   :: ok
+    integer(kind=8) :: k, nsum
+
+    ok = .false.
+    if (size(w) < 6) return
+    if (w(3) /= TR_P .or. w(4) /= np .or. w(1) <= 0 .or. w(2) <= 0) return
+    nsum = 2_8 * (TR_P - 1) * w(2)
+    if (size(w, kind=8) /= 6 + 3 * nsum) return
+    tr = Transport_t()
+    tr%interval = w(1)
+    tr%nlev = w(2)
+    call alloc_levels(tr, np)
+    tr%nsample = transfer(w(5:6), tr%nsample)
+    k = 6
+    tr%msd = reshape(transfer(w(k+1:k+nsum), 1.0d0, nsum / 2), shape(tr%msd))
+    k = k + nsum
+    tr%ori = reshape(transfer(w(k+1:k+nsum), 1.0d0, nsum / 2), shape(tr%ori))
+    k = k + nsum
+    tr%norig = reshape(transfer(w(k+1:k+nsum), 1_8, nsum / 2), shape(tr%norig))
+    ok = .true.
+  end subroutine transport_restore
+
+end module mod_transport
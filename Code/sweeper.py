@@ -8,6 +8,8 @@ from input_creator import write_parameters_file
 # --- 1. CONFIGURATION ---
 RUN_SIMS = False  # Set to True to actually launch simulation.exe
                   # Set to False for a "Dry Run" (folder/file creation only)
+LOCKSTEP = False  # Set to True to run all folders in one simulation.exe
+                  # (a batch, see main.f90; they must share Lx, Ly and Reff)
 
 # Target any keys defined in the 'p' dictionary in input_creator.py
 var1_key = "phip"           
@@ -27,6 +29,7 @@ def run_sweep():
         return
 
     print(f"Starting sweep: {var1_key} vs {var2_key}")
+    folders = []
 
     for i, val1 in enumerate(data_vec1):
         for j, val2 in enumerate(data_vec2):
@@ -60,11 +63,14 @@ def run_sweep():
                     f.write(f"{key}: {value}\n")
 
             print(f"  -> Created {folder}")
+            folders.append(folder)
 
             # --- START EXECUTION IN BACKGROUND ---
             print(f"Launching {folder} in background...")
             
-            if RUN_SIMS:
+            if RUN_SIMS and LOCKSTEP:
+                print(f"  -> {folder} added to the batch.")
+            elif RUN_SIMS:
                 print(f"  -> Launching {folder} in background...")
                 log_path = os.path.join(folder, "output.log")
                 with open(log_path, "w") as f_log:
@@ -77,6 +83,12 @@ def run_sweep():
                 print(f"  -> {folder} prepared (Dry Run).")
             print(f"Finished {folder}.")
 
+    if RUN_SIMS and LOCKSTEP:
+        # One process advances all the simulations, one OpenMP thread each
+        print(f"Launching the batch of {len(folders)} simulations in background...")
+        with open("batch_output.log", "w") as f_log:
+            subprocess.Popen([executable] + folders, stdout=f_log, stderr=f_log)
+
     print(f"\nSuccess. {len(data_vec1)*len(data_vec2)} simulation folders prepared.")
 
 if __name__ == "__main__":
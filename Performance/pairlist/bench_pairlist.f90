@@ -0,0 +1,97 @@
+program bench_pairlist
+  ! Cost of the particle-particle forces (compute_pp_forces) with the
+  ! linked-cell list rebuilt every step (skin = 0) and with Verlet lists of
+  ! several skins, over a range of packing fractions. The field is left
+  ! out: the particles only feel repulsion, activity and thermal noise.
+  ! Writes one line per (phip, skin) to pairlist_benchmark.dat.
+  use mod_core_types
+  use mod_particles
+  implicit none
+
+  ! --- Benchmark settings (same particle parameters as input_creator.py)
+  integer, parameter :: L = 256, nsteps = 2000, nrelax = 200
+  real, parameter :: phip_vec(5) = [0.1, 0.2, 0.4, 0.5, 0.6]
+  real, parameter :: skin_vec(6) = [0.0, 0.5, 1.0, 1.5, 2.0, 3.0]
+
+  type(Config_t) :: cfg
+  type(Particles_t) :: particles, start
+  real :: e_pp, ms_per_step, t_cell, a, u
+  integer :: ip, is, i, t, nside, seed_size, builds
+  integer(kind=8) :: c1, c2, rate, ticks
+  integer, allocatable :: seed(:)
+
+  cfg%Lx = L; cfg%Ly = L
+  cfg%y0 = 0; cfg%ny = L; cfg%ng = 1
+  cfg%dt = 0.0816326530612245
+  cfg%temperature = 0.05
+  cfg%gamm_T = 1.077572; cfg%gamm_R = 4.152243
+  cfg%vact = 0.40941728602765515
+  cfg%epsilon = 10.0; cfg%R0 = 1.7
+  cfg%diam = 2.0 * cfg%R0
+  cfg%d_2 = cfg%diam**2
+  cfg%r_cut_sq = cfg%diam**2
+  cfg%psimean = 0.0
+  cfg%rng_seed = 12345
+
+  call random_seed(size=seed_size)
+  allocate(seed(seed_size))
+  seed = 12345
+
+  open(unit=20, file='pairlist_benchmark.dat', status='replace')
+  write(20, '(A)') '#   phip      Np    skin   ms_per_step       speedup  rebuilds/step'
+  print '(A)', '   phip      Np    skin   ms_per_step       speedup  rebuilds/step'
+
+  do ip = 1, size(phip_vec)
+    cfg%Np = int(phip_vec(ip) * L * L / (PI * cfg%R0**2))
+    call particles_alloc(particles, cfg%Np)
+    particles%n = cfg%Np
+
+    ! Square lattice with random orientations (random insertion jams at
+    ! high packing), relaxed with the cell list before timing
+    call random_seed(put=seed)
+    nside = ceiling(sqrt(real(cfg%Np)))
+    a = real(L) / nside
+    do i = 1, cfg%Np
+      particles%x(i) = (mod(i - 1, nside) + 0.5) * a
+      particles%y(i) = ((i - 1) / nside + 0.5) * a
+      call random_number(u)
+      particles%phi(i) = TWO_PI * u
+      particles%id(i) = i
+    end do
+    particles%fx = 0.0
+    particles%fy = 0.0
+    cfg%verlet_skin = 0.0
+    do t = 1, nrelax
+      call compute_pp_forces(particles, cfg, e_pp)
+      call integrate_particles(particles, cfg, t)
+    end do
+    start = particles
+
+    do is = 1, size(skin_vec)
+      cfg%verlet_skin = skin_vec(is)
+      ! (same noise for every skin: it only depends on the step and the particle)
+      particles = start
+
+      ! only the force evaluation (including list rebuilds) is timed
+      ticks = 0
+      builds = verlet_builds
+      do t = 1, nsteps
+        call system_clock(c1, rate)
+        call compute_pp_forces(particles, cfg, e_pp)
+        call system_clock(c2)
+        ticks = ticks + (c2 - c1)
+        call integrate_particles(particles, cfg, nrelax + t)
+      end do
+      builds = verlet_builds - builds
+
+      ms_per_step = 1.0e3 * real(ticks) / real(rate) / nsteps
+      if (is == 1) t_cell = ms_per_step
+      write(20, '(F8.2, I8, F8.2, 3F14.5)') phip_vec(ip), cfg%Np, cfg%verlet_skin, &
+                     ms_per_step, t_cell / ms_per_step, real(builds) / nsteps
+      print '(F8.2, I8, F8.2, 3F14.5)', phip_vec(ip), cfg%Np, cfg%verlet_skin, &
+                 ms_per_step, t_cell / ms_per_step, real(builds) / nsteps
+    end do
+  end do
+  close(20)
+
+end program bench_pairlist
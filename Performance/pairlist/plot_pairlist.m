@@ -0,0 +1,47 @@
+clc; clear; close all;
+
+% Output of bench_pairlist.exe:
+% phip, Np, skin, ms_per_step, speedup, rebuilds/step
+data = dlmread('pairlist_benchmark.dat', '', 1, 0);
+
+phip_vec = unique(data(:,1));
+skin_vec = unique(data(:,3));
+
+markers={'o','s','d','<','>','^','v','p','h','*','x','.','+'};
+
+figure('Color', 'w');
+
+% Cost of the pair forces per step
+subplot(1,2,1)
+for k=1:length(skin_vec)
+    sel = data(:,3) == skin_vec(k);
+    if skin_vec(k) == 0
+        name = 'cell list';
+    else
+        name = sprintf('Verlet, skin=%.2f', skin_vec(k));
+    end
+    p = semilogy(data(sel,1), data(sel,4), '-o','DisplayName',name);
+    p.Marker = markers{k};
+    hold on
+end
+xlabel('packing fraction \phi_p')
+ylabel('pp forces per step / ms')
+grid on
+legend Location northwest
+
+% Speed-up with respect to the cell list
+subplot(1,2,2)
+for k=2:length(skin_vec)
+    sel = data(:,3) == skin_vec(k);
+    p = plot(data(sel,1), data(sel,5), '-o', ...
+             'DisplayName',sprintf('skin=%.2f', skin_vec(k)));
+    p.Marker = markers{k};
+    hold on
+end
+plot(phip_vec, ones(size(phip_vec)), '--k','DisplayName','cell list')
+xlabel('packing fraction \phi_p')
+ylabel('speed-up  t_{cell} / t_{Verlet}')
+grid on
+legend Location northeast
+
+exportgraphics(gcf, 'pairlist_benchmark.png')
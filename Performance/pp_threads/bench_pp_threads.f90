@@ -0,0 +1,99 @@
+program bench_pp_threads
+  ! Thread scaling of the particle-particle forces (compute_pp_forces) with
+  ! the cell list (skin 0) and with a Verlet list (skin 1.5), for 10^4 to
+  ! 10^6 particles in two states: a homogeneous one (jittered square lattice
+  ! at phip = 0.4) and a clustered one (a single dense patch at touching
+  ! distance, phip = 0.2 overall), where most cells are empty and the rest
+  ! are full. The forces of every thread count are compared with the ones
+  ! of a single thread. Writes one line per (state, Np, skin, threads) to
+  ! pp_threads_benchmark.dat.
+  use omp_lib
+  use mod_core_types
+  use mod_particles
+  implicit none
+
+  integer, parameter :: nsteps = 20
+  integer, parameter :: np_vec(3) = [10000, 100000, 1000000]
+  real, parameter :: skin_vec(2) = [0.0, 1.5]
+  character(len=9), parameter :: state_name(2) = ['uniform  ', 'clustered']
+
+  type(Config_t) :: cfg
+  type(Particles_t) :: particles
+  real, allocatable :: fx_ref(:), fy_ref(:)
+  real :: e_pp, phip, a, u, v, ms_per_step, t_one, dev
+  integer :: is, ip, isk, nthr, max_thr, i, t, nside
+  integer(kind=8) :: c1, c2, rate
+
+  ! up to the number of cores, or OMP_NUM_THREADS if that is larger
+  max_thr = max(omp_get_num_procs(), omp_get_max_threads())
+
+  cfg%epsilon = 10.0; cfg%R0 = 1.7
+  cfg%diam = 2.0 * cfg%R0
+  cfg%d_2 = cfg%diam**2
+  cfg%r_cut_sq = cfg%diam**2
+
+  open(unit=20, file='pp_threads_benchmark.dat', status='replace')
+  write(20, '(A)') '# state(1=uniform,2=clustered)      Np  skin  threads  ms_per_step  speedup  max_force_dev'
+  print '(A)', '     state       Np  skin threads  ms_per_step   speedup  max_force_dev'
+
+  do is = 1, 2
+    phip = merge(0.4, 0.2, is == 1)
+    do ip = 1, size(np_vec)
+      cfg%Np = np_vec(ip)
+      cfg%Lx = nint(sqrt(cfg%Np * PI * cfg%R0**2 / phip))
+      cfg%Ly = cfg%Lx
+      cfg%y0 = 0; cfg%ny = cfg%Ly; cfg%ng = 1
+
+      call particles_alloc(particles, cfg%Np)
+      particles%n = cfg%Np
+      nside = ceiling(sqrt(real(cfg%Np)))
+      if (is == 1) then
+        a = real(cfg%Lx) / nside
+      else
+        a = 0.98 * cfg%diam
+      end if
+      do i = 1, cfg%Np
+        call random_number(u)
+        call random_number(v)
+        particles%x(i) = (mod(i - 1, nside) + 0.5 + 0.2 * (u - 0.5)) * a
+        particles%y(i) = ((i - 1) / nside + 0.5 + 0.2 * (v - 0.5)) * a
+        particles%phi(i) = 0.0
+        particles%id(i) = i
+      end do
+      call sort_particles(particles, cfg)
+
+      do isk = 1, size(skin_vec)
+        cfg%verlet_skin = skin_vec(isk)
+        nthr = 1
+        do while (nthr <= max_thr)
+          call omp_set_num_threads(nthr)
+          ! first call builds the Verlet list; the positions do not change,
+          ! so the timed steps are pure force evaluations
+          call compute_pp_forces(particles, cfg, e_pp)
+          call system_clock(c1, rate)
+          do t = 1, nsteps
+            call compute_pp_forces(particles, cfg, e_pp)
+          end do
+          call system_clock(c2)
+          ms_per_step = 1.0e3 * real(c2 - c1) / real(rate) / nsteps
+
+          if (nthr == 1) then
+            t_one = ms_per_step
+            fx_ref = particles%fx_pp(1:cfg%Np)
+            fy_ref = particles%fy_pp(1:cfg%Np)
+          end if
+          dev = max(maxval(abs(particles%fx_pp(1:cfg%Np) - fx_ref)), &
+                    maxval(abs(particles%fy_pp(1:cfg%Np) - fy_ref)))
+
+          write(20, '(I3, I10, F6.2, I6, 2F12.4, ES12.3)') is, cfg%Np, cfg%verlet_skin, &
+                      nthr, ms_per_step, t_one / ms_per_step, dev
+          print '(A10, I9, F6.2, I6, 2F12.4, ES12.3)', state_name(is), cfg%Np, &
+                 cfg%verlet_skin, nthr, ms_per_step, t_one / ms_per_step, dev
+          nthr = 2 * nthr
+        end do
+      end do
+    end do
+  end do
+  close(20)
+
+end program bench_pp_threads
@@ -0,0 +1,45 @@
+clc; clear; close all;
+
+% Output of bench_pp_threads.exe:
+% state (1 uniform, 2 clustered), Np, skin, threads, ms_per_step, speedup, max_force_dev
+data = dlmread('pp_threads_benchmark.dat', '', 1, 0);
+
+np_vec = unique(data(:,2));
+state_name = {'uniform \phi_p=0.4', 'clustered'};
+skin_name = @(s) ifelse_skin(s);
+
+markers={'o','s','d','<','>','^','v','p','h','*','x','.','+'};
+
+figure('Color', 'w');
+
+for st=1:2
+    subplot(1,2,st)
+    k = 0;
+    for skin = [0 1.5]
+        for n=1:length(np_vec)
+            sel = data(:,1) == st & data(:,2) == np_vec(n) & data(:,3) == skin;
+            k = k + 1;
+            p = plot(data(sel,4), data(sel,6), '-o', ...
+                     'DisplayName', sprintf('N=%d, %s', np_vec(n), skin_name(skin)));
+            p.Marker = markers{k};
+            hold on
+        end
+    end
+    thr = unique(data(:,4));
+    plot(thr, thr, '--k', 'DisplayName', 'ideal')
+    xlabel('threads')
+    ylabel('speed-up of compute\_pp\_forces')
+    title(state_name{st})
+    grid on
+    legend Location northwest
+end
+
+exportgraphics(gcf, 'pp_threads_benchmark.png')
+
+function name = ifelse_skin(s)
+    if s == 0
+        name = 'cell list';
+    else
+        name = sprintf('Verlet, skin=%.1f', s);
+    end
+end
@@ -0,0 +1,88 @@
+import os
+import sys
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join("..", "..", "Code"))
+from input_creator import write_parameters_file
+
+# Single vs double working precision (simulation_single.exe and
+# simulation_double.exe, see the Makefile): throughput for several system
+# sizes, and how far the energies of the two builds drift apart. Both
+# builds draw the same random numbers, so any difference between them is
+# due to round-off. Runs are one after the other, on one thread.
+precisions = ["single", "double"]
+data_vec = [128, 256, 512]      # lateral system size
+n_steps = 2000
+stats_interval = 20
+seed = 12345
+
+def set_line(path, k, value):
+    # replace the value of line k (1-based) of parameters.in
+    with open(path) as f:
+        lines = f.readlines()
+    lines[k - 1] = f"{value:<25} ! {lines[k - 1].split('!', 1)[1].strip()}\n"
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+def wall_time(folder):
+    with open(os.path.join(folder, "performance.txt")) as f:
+        for line in f:
+            if "Wall_Time_Seconds" in line:
+                return float(line.split()[-1])
+
+def run_bench():
+    for prec in precisions:
+        if not os.path.exists(f"./simulation_{prec}.exe"):
+            print(f"Error: 'simulation_{prec}.exe' not found, run make first.")
+            return
+
+    rows = []
+    for L in data_vec:
+        ms = {}
+        energy = {}
+        psi_avg = {}
+        for prec in precisions:
+            folder = f"PREC_{prec}_L{L}"
+            os.makedirs(folder, exist_ok=True)
+            for f in os.listdir(folder):
+                os.remove(os.path.join(folder, f))
+            write_parameters_file(folder, overrides={"Lx": L, "Ly": L, "nthreads": 1,
+                                                     "rng_seed": seed})
+            params = os.path.join(folder, "parameters.in")
+            set_line(params, 3, n_steps)
+            set_line(params, 4, n_steps)
+            set_line(params, 5, stats_interval)
+
+            print(f"  -> Running {folder}...")
+            with open(os.path.join(folder, "output.log"), "w") as f_log:
+                subprocess.run([os.path.abspath(f"simulation_{prec}.exe")], cwd=folder,
+                               stdout=f_log, stderr=f_log, check=True)
+            ms[prec] = 1000.0 * wall_time(folder) / n_steps
+            e = np.loadtxt(os.path.join(folder, "free_energy.dat"))
+            s = np.loadtxt(os.path.join(folder, "stats.dat"))
+            energy[prec] = e[:, [0, 4]]
+            psi_avg[prec] = s[:, 2]
+
+        # relative difference of the total energies, and drift of the
+        # (conserved) mean of psi from its initial value
+        e_s, e_d = energy["single"][:, 1], energy["double"][:, 1]
+        rel_dev = np.abs(e_s - e_d) / np.abs(e_d)
+        drift = {p: np.abs(psi_avg[p] - psi_avg[p][0]).max() for p in precisions}
+        rows.append([L, ms["single"], ms["double"], ms["double"] / ms["single"],
+                     rel_dev.max(), drift["single"], drift["double"]])
+
+        np.savetxt(f"precision_drift_L{L}.dat",
+                   np.column_stack([energy["double"][:, 0], e_s, e_d, rel_dev,
+                                    psi_avg["single"], psi_avg["double"]]),
+                   header="step E_total_single E_total_double rel_dev "
+                          "avg_psi_single avg_psi_double")
+
+    np.savetxt("precision_benchmark.dat", np.array(rows),
+               fmt=["%6d", "%12.4f", "%12.4f", "%8.3f", "%12.3e", "%12.3e", "%12.3e"],
+               header="L ms_per_step_single ms_per_step_double slowdown "
+                      "max_rel_dE psi_drift_single psi_drift_double")
+    print("Written precision_benchmark.dat and precision_drift_L*.dat")
+
+if __name__ == "__main__":
+    run_bench()
@@ -0,0 +1,35 @@
+clc; clear; close all;
+
+% Output of bench_precision.py:
+% L, ms_per_step_single, ms_per_step_double, slowdown, max_rel_dE,
+% psi_drift_single, psi_drift_double
+data = dlmread('precision_benchmark.dat', '', 1, 0);
+L_vec = data(:,1);
+
+figure('Color', 'w');
+
+subplot(1,2,1)
+loglog(L_vec, data(:,2), '-o', 'DisplayName', 'single')
+hold on
+loglog(L_vec, data(:,3), '-s', 'DisplayName', 'double')
+xlabel('L')
+ylabel('wall time per step (ms)')
+grid on
+legend Location northwest
+
+% step, E_total_single, E_total_double, rel_dev, avg_psi_single, avg_psi_double
+subplot(1,2,2)
+markers={'o','s','d','<','>','^','v'};
+for n=1:length(L_vec)
+    drift = dlmread(sprintf('precision_drift_L%d.dat', L_vec(n)), '', 1, 0);
+    p = semilogy(drift(:,1), drift(:,4), '-', ...
+                 'DisplayName', sprintf('L=%d', L_vec(n)));
+    p.Marker = markers{n};
+    hold on
+end
+xlabel('step')
+ylabel('|E_{single} - E_{double}| / |E_{double}|')
+grid on
+legend Location southeast
+
+exportgraphics(gcf, 'precision_benchmark.png')
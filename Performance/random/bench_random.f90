@@ -0,0 +1,113 @@
+program bench_random
+  ! Cost per number of the uniform (rng_uniform_run) and normal
+  ! (rng_normal_run) draws over rows of counters, as the field noise draws
+  ! them, and the moments of the normal numbers against those of N(0, 1).
+  ! Each moment is given with its deviation in standard errors of the
+  ! estimate; beyond 5 the check fails. Also checks that the two array
+  ! forms agree and that a substep draws other numbers.
+  ! Writes the timings and the moments to random_benchmark.dat.
+  use mod_random
+  implicit none
+
+  ! --- Benchmark settings: rows of a 1024 x 1024 lattice, 20 steps
+  integer, parameter :: nrow = 1024, npairs = 512, nsteps = 20, seed = 12345
+  ! moments 1..4 of N(0, 1), and the variances of x**k
+  real(kind=8), parameter :: mom_ref(4) = [0d0, 1d0, 0d0, 3d0]
+  real(kind=8), parameter :: var_ref(4) = [1d0, 2d0, 15d0, 96d0]
+
+  real :: u(4, npairs), g(4, npairs), g2(4, npairs)
+  real(kind=8) :: mom(4), x, nsum, dev, ns_uniform, ns_normal, tail, sink
+  integer :: t, j, k, c, index(npairs)
+  integer(kind=8) :: c1, c2, rate
+  logical :: pass
+
+  call system_clock(count_rate=rate)
+
+  ! 1. Cost per number (sink keeps the draws from being optimised away)
+  nsum = 4d0 * npairs * nrow * nsteps
+  sink = 0d0
+  call system_clock(c1)
+  do t = 1, nsteps
+    do j = 0, nrow - 1
+      call rng_uniform_run(seed, STREAM_FIELD_NOISE, t, int(j, 8) * npairs, u)
+      sink = sink + u(1, 1)
+    end do
+  end do
+  call system_clock(c2)
+  ns_uniform = 1d9 * real(c2 - c1, 8) / rate / nsum
+
+  call system_clock(c1)
+  do t = 1, nsteps
+    do j = 0, nrow - 1
+      call rng_normal_run(seed, STREAM_FIELD_NOISE, t, int(j, 8) * npairs, g)
+      sink = sink + g(1, 1)
+    end do
+  end do
+  call system_clock(c2)
+  ns_normal = 1d9 * real(c2 - c1, 8) / rate / nsum
+
+  ! 2. Moments of the same numbers (accumulated in double precision)
+  mom = 0d0
+  tail = 0d0
+  do t = 1, nsteps
+    do j = 0, nrow - 1
+      call rng_normal_run(seed, STREAM_FIELD_NOISE, t, int(j, 8) * npairs, g)
+      do k = 1, npairs
+        do c = 1, 4
+          x = g(c, k)
+          mom = mom + [x, x**2, x**3, x**4]
+          if (abs(x) > 3d0) tail = tail + 1d0
+        end do
+      end do
+    end do
+  end do
+  mom = mom / nsum
+  tail = tail / nsum
+
+  open(unit=20, file='random_benchmark.dat', status='replace')
+  write(20, '(A, F8.2, A)') '# uniform: ', ns_uniform, ' ns per number'
+  write(20, '(A, F8.2, A)') '# normal:  ', ns_normal, ' ns per number'
+  print '(A, F8.2, A)', ' uniform: ', ns_uniform, ' ns per number'
+  print '(A, F8.2, A)', ' normal:  ', ns_normal, ' ns per number'
+
+  pass = .true.
+  write(20, '(A)') '# k    <x**k>       N(0,1)    deviation/se'
+  print '(A, I0, A)', ' moments of ', int(nsum, 8), ' normal numbers:'
+  print '(A)', '  k    <x**k>       N(0,1)    deviation/se'
+  do k = 1, 4
+    dev = (mom(k) - mom_ref(k)) / sqrt(var_ref(k) / nsum)
+    if (abs(dev) > 5d0) pass = .false.
+    write(20, '(I3, 2F12.6, F12.2)') k, mom(k), mom_ref(k), dev
+    print '(I3, 2F12.6, F12.2)', k, mom(k), mom_ref(k), dev
+  end do
+  ! P(|x| > 3) = 0.0026998 for N(0, 1)
+  dev = (tail - 0.0026998d0) / sqrt(0.0026998d0 * (1d0 - 0.0026998d0) / nsum)
+  if (abs(dev) > 5d0) pass = .false.
+  write(20, '(A, F12.7, F12.2)') '# P(|x| > 3) ', tail, dev
+  print '(A, F12.7, A, F12.2)', ' P(|x| > 3) = ', tail, ' (0.0026998), deviation/se', dev
+
+  ! 3. The index-array form gives the same numbers, a substep other ones
+  do k = 1, npairs
+    index(k) = 7 * npairs + k - 1
+  end do
+  call rng_normal_run(seed, STREAM_PARTICLE_NOISE, 3, int(7 * npairs, 8), g)
+  call rng_normal(seed, STREAM_PARTICLE_NOISE, 3, index, g2)
+  if (any(g /= g2)) then
+    print *, 'rng_normal and rng_normal_run differ'
+    pass = .false.
+  end if
+  call rng_normal(seed, STREAM_PARTICLE_NOISE, 3, index, g2, substep=1)
+  if (count(g == g2) > 0) then
+    print *, 'substep 1 repeats numbers of substep 0'
+    pass = .false.
+  end if
+  close(20)
+
+  if (sink == 0d0) print *, ''
+  if (pass) then
+    print *, 'moment check passed'
+  else
+    print *, 'moment check FAILED'
+    stop 1
+  end if
+end program bench_random
@@ -18,7 +18,8 @@ def write_parameters_file(target_dir, overrides=None):
         'gamma_T': 1.0,
         'Pe': 0.0,
         'phip': 0.2,
-        'init_custom': "false" 
+        'init_custom': "false",
+        'nthreads': 0
     }
 
     # 2. Update with whatever the Sweeper wants to change
@@ -66,7 +67,8 @@ def write_parameters_file(target_dir, overrides=None):
         (f"{p['gamma_T']:.6f} {gamma_R:.6f}", "Gammas"),
         (f"{vact}", "vact"),
         (f"{noise}", "noise strength"),
-        (f"{p['init_custom']}", "custom initial condition")
+        (f"{p['init_custom']}", "custom initial condition"),
+        (f"{p['nthreads']}", "OpenMP threads (0 = OMP_NUM_THREADS)")
     ]
 
     # Write to target folder
@@ -4,6 +4,7 @@ program main
   use mod_coupling   ! The specific interaction logic you provided
   use mod_particles  ! Pure particle repulsion and integration
   use mod_io         ! Parameters and output
+  !$ use omp_lib
   implicit none
 
   ! Data structures
@@ -19,6 +20,9 @@ program main
 
   ! CPU time variables 
   real :: t1,t2
+  ! Wall-clock time (cpu_time adds up all threads once OpenMP is active)
+  integer(kind=8) :: wc1, wc2, wc_rate
+  integer :: nthreads_used
 
   ! restart variables 
   logical :: restart_found,equilibrated_found
@@ -26,11 +30,18 @@ program main
 
   ! time code starts
   call cpu_time(t1)
+  call system_clock(wc1, wc_rate)
 
   ! 1. SETUP
   ! load_parameters now populates Reff_2 and R0_2 for efficiency
   call load_parameters(cfg)
 
+  ! threads for the OpenMP field kernels
+  nthreads_used = 1
+  !$ if (cfg%nthreads > 0) call omp_set_num_threads(cfg%nthreads)
+  !$ nthreads_used = omp_get_max_threads()
+  print*, 'OpenMP threads =', nthreads_used
+
   ! conversions 
   psieq = sqrt( cfg%tau  / cfg%u )
   print*, 'Equilibirum psi=',psieq
@@ -161,8 +172,11 @@ program main
 
   ! performance information 
   call cpu_time(t2)
+  call system_clock(wc2)
   open(unit=10, file='performance.txt', status='replace')
   write(10,*) 'CPU_Time_Seconds:', t2 - t1
+  write(10,*) 'Wall_Time_Seconds:', real(wc2 - wc1) / real(wc_rate)
+  write(10,*) 'Threads:', nthreads_used
   close(10)
 
   ! closing message
@@ -38,6 +38,9 @@ module mod_core_types
     ! initialisation flag 
     logical :: custom_init
 
+    ! Parallel execution (optional entries at the end of parameters.in)
+    integer :: nthreads            ! OpenMP threads (0 = OMP_NUM_THREADS default)
+
   end type Config_t
 
   ! Structure for individual particle data
@@ -7,6 +7,7 @@ contains
 
   subroutine load_parameters(cfg)
     type(Config_t), intent(out) :: cfg
+    integer :: ios
     
     open(unit=10, file='parameters.in', status='old', action='read')
     
@@ -32,6 +33,12 @@ contains
     read(10,* ) cfg%noiseStrength
     read(10, *) cfg%custom_init
 
+    ! Optional entries: older parameter files simply stop above, in which
+    ! case the defaults below are kept
+    cfg%nthreads = 0
+    read(10, *, iostat=ios) cfg%nthreads
+    if (ios /= 0) cfg%nthreads = 0
+
     close(10)
 
     ! Pre-calculate squared radii for performance
@@ -246,7 +253,7 @@ subroutine write_stats(t, psi, particles, cfg, energy)
         open(41, file='stats.dat', status='unknown', position='append')
         
         if (.not. file_exists) then
-            write(41, '(A10, A20)') "# Step", "Domain_Size"
+            write(41, '(A10, 3A20)') "# Step", "Domain_Size", "Avg_psi", "Avg_abs_psi"
         end if
     end if
     write(41, '(I10, 3ES20.8E2)') t, domain_size, psiavg, psiabsavg
@@ -319,4 +326,4 @@ subroutine write_stats(t, psi, particles, cfg, energy)
     close(iunit)
   end subroutine
 
-end module mod_io
\ No newline at end of file
+end module mod_io
@@ -0,0 +1,47 @@
+clc; clear; close all;
+
+% Vectors based on sweeper_threads.py
+data_vec1 = [1 2 4 8 16 32 64];   % OpenMP threads
+data_vec2 = 2.^(8:10);            % L
+
+% Phases as named in timings.json
+phases = {'field_mu','coupling','field_evolve','noise','halo', ...
+          'pp_forces','integrate','sort','stats','io'};
+
+% Milliseconds per step of every phase (threads x L x phase)
+ms_step = NaN(length(data_vec1), length(data_vec2), length(phases));
+
+% Loop through the known folder structure THR_i_j
+for i = 0:length(data_vec1)-1
+    for j = 0:length(data_vec2)-1
+
+        % Construct the path
+        folder_name = sprintf('THR_%d_%d', i, j);
+        file_path = fullfile(folder_name, 'timings.json');
+
+        if exist(file_path, 'file')
+            timings = jsondecode(fileread(file_path));
+            for k = 1:length(phases)
+                ms_step(i+1, j+1, k) = timings.phases.(phases{k}).ms_per_step;
+            end
+        else
+            fprintf('Warning: %s not found\n', file_path);
+        end
+    end
+end
+
+%% Plotting: one panel per system size, one stacked bar per thread count
+figure('Color', 'w', 'Position', [100 100 1200 400]);
+
+for j = 1:length(data_vec2)
+    subplot(1, length(data_vec2), j)
+    bar(categorical(string(data_vec1), string(data_vec1)), ...
+        squeeze(ms_step(:, j, :)), 'stacked')
+    title(['L=', sprintf('%d', data_vec2(j))])
+    xlabel('OpenMP threads')
+    ylabel('wall time per step (ms)')
+    grid on
+end
+legend(strrep(phases, '_', ' '), 'Location', 'northeast')
+
+exportgraphics(gcf, 'phases_threads.png')
@@ -0,0 +1,73 @@
+clc; clear; close all;
+
+% Vectors based on sweeper_threads.py
+data_vec1 = [1 2 4 8 16 32 64];   % OpenMP threads
+data_vec2 = 2.^(8:10);            % L
+
+% Preallocate matrix for wall-clock times (Rows = threads, Cols = L)
+wall_matrix = zeros(length(data_vec1), length(data_vec2));
+
+% Loop through the known folder structure THR_i_j
+for i = 0:length(data_vec1)-1
+    for j = 0:length(data_vec2)-1
+
+        % Construct the path
+        folder_name = sprintf('THR_%d_%d', i, j);
+        file_path = fullfile(folder_name, 'performance.txt');
+
+        if exist(file_path, 'file')
+            % Read the file
+            fid = fopen(file_path, 'r');
+            file_content = fread(fid, '*char')';
+            fclose(fid);
+
+            % Wall-clock time (CPU time adds up all threads)
+            val = regexp(file_content, '(?<=Wall_Time_Seconds:\s+)[0-9.E+-]+', 'match');
+
+            if ~isempty(val)
+                wall_matrix(i+1, j+1) = str2double(val{1});
+            end
+        else
+            fprintf('Warning: %s not found\n', file_path);
+            wall_matrix(i+1, j+1) = NaN;
+        end
+    end
+end
+
+%% Plotting
+figure('Color', 'w');
+
+threads = data_vec1;
+L_vec = data_vec2;
+
+markers={'o','s','d','<','>','^','v','p','h','*','x','.','+'};
+
+% Speed-up with respect to the single-thread run
+subplot(1,2,1)
+for j=1:length(L_vec)
+    speedup = wall_matrix(1,j) ./ wall_matrix(:,j);
+    p = loglog(threads, speedup, '-o','DisplayName',['L=',sprintf('%d',L_vec(j))]);
+    p.Marker = markers{j};
+    hold on
+end
+loglog(threads, threads, '--k','DisplayName','ideal')
+ylabel('speed-up  t_1 / t_n')
+xlabel('OpenMP threads')
+grid on
+legend Location northwest
+
+% Parallel efficiency
+subplot(1,2,2)
+for j=1:length(L_vec)
+    efficiency = wall_matrix(1,j) ./ ( wall_matrix(:,j) .* threads' );
+    p = semilogx(threads, efficiency, '-o','DisplayName',['L=',sprintf('%d',L_vec(j))]);
+    p.Marker = markers{j};
+    hold on
+end
+ylabel('parallel efficiency')
+xlabel('OpenMP threads')
+ylim([0 1.1])
+grid on
+legend Location southwest
+
+exportgraphics(gcf, 'wallTime_threads.png')
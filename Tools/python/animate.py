@@ -1,9 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import glob
 import re
 import sys
 import os
+from snapshot_io import load_field, load_particles, snapshot_files
 
 # --- Command Line Argument Handling ---
 # Usage: python script.py [path_to_data] [--save]
@@ -56,11 +56,9 @@ LX, LY, TAU, U, DT = get_params(data_path)
 PSI_EQ = np.sqrt(TAU / U)
 V_MIN, V_MAX = -1.1, 1.1
 
-def natural_sort_key(s):
-    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
-
-p_files = sorted(glob.glob(os.path.join(data_path, 'particles_*.txt')), key=natural_sort_key)
-f_files = sorted(glob.glob(os.path.join(data_path, 'field_psi_*.txt')), key=natural_sort_key)
+# (text, binary or packed snapshots, in the order of their steps)
+p_files = [str(f) for f in snapshot_files(data_path, 'particles').values()]
+f_files = [str(f) for f in snapshot_files(data_path, 'field_psi').values()]
 
 if not p_files or not f_files:
     print(f"Error: No data files found in: {os.path.abspath(data_path)}")
@@ -70,8 +68,8 @@ if not p_files or not f_files:
 fig, ax = plt.subplots(figsize=(8, 7))
 
 # Initialize objects
-p_data = np.loadtxt(p_files[0], ndmin=2)
-f_data = np.loadtxt(f_files[0])
+p_data = np.asarray(load_particles(p_files[0]))
+f_data = np.asarray(load_field(f_files[0]))
 
 def reshape_field(data, lx, ly):
     if data.ndim == 1: return data.reshape((ly, lx))
@@ -97,8 +95,8 @@ plt.colorbar(im, ax=ax, label='Field $\psi / \psi_{eq}$')
 # --- Animation/Saving Loop ---
 for i in range(len(p_files)):
     try:
-        p_curr = np.loadtxt(p_files[i], ndmin=2)
-        f_curr = np.loadtxt(f_files[i])
+        p_curr = np.asarray(load_particles(p_files[i]))
+        f_curr = np.asarray(load_field(f_files[i]))
     except Exception:
         continue
     
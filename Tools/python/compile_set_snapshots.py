@@ -1,10 +1,10 @@
 import os
 import sys
 import glob
-import re  # Added for regex
 import numpy as np
 import matplotlib.pyplot as plt
 import plot_config as cfg
+from snapshot_io import load_field, load_particles, snapshot_files
 
 def get_info_text(folder):
     info_path = os.path.join(folder, 'sweep_info.txt')
@@ -13,14 +13,6 @@ def get_info_text(folder):
         lines = [l.strip() for l in f if not l.startswith('#')]
         return " | ".join(lines)
 
-def sort_by_timestep(file_list):
-    """Sorts a list of file paths by the last integer found in the filename."""
-    def extract_number(filepath):
-        numbers = re.findall(r'\d+', os.path.basename(filepath))
-        return int(numbers[-1]) if numbers else 0
-    
-    return sorted(file_list, key=extract_number)
-
 def analyze_sweep(parent_dir):
     sim_folders = sorted(glob.glob(os.path.join(parent_dir, 'SIM_*')))
     
@@ -28,8 +20,9 @@ def analyze_sweep(parent_dir):
         LX, LY = cfg.get_params(folder)
         
         # Grab and sort files numerically by timestep
-        p_files = sort_by_timestep(glob.glob(os.path.join(folder, 'particles_*.txt')))
-        f_files = sort_by_timestep(glob.glob(os.path.join(folder, 'field_psi_*.txt')))
+        # (text, binary or packed snapshots)
+        p_files = list(snapshot_files(folder, 'particles').values())
+        f_files = list(snapshot_files(folder, 'field_psi').values())
         
         if not p_files or not f_files: 
             print(f"Skipping {folder}: Files missing.")
@@ -39,8 +32,8 @@ def analyze_sweep(parent_dir):
             # Now p_files[-1] is guaranteed to be the highest timestep
             print(f"Processing latest: {p_files[-1]}")
             
-            p_data = np.loadtxt(p_files[-1])
-            f_data = np.loadtxt(f_files[-1])
+            p_data = np.asarray(load_particles(p_files[-1]))
+            f_data = np.asarray(load_field(f_files[-1]))
             psi = cfg.reshape_field(f_data, LX, LY)
 
             fig, ax = plt.subplots(figsize=(8, 7))
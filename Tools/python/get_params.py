@@ -14,7 +14,7 @@ def get_params(path):
                 for line in lines:
                     val_part = line.split('!')[0].strip()
                     comment_part = line.split('!')[-1].lower() if '!' in line else ""
-                    if "dt" in comment_part:
+                    if comment_part.strip() == "dt":
                         dt = float(val_part)
                     if "field params" in comment_part:
                         parts = val_part.split()
@@ -0,0 +1,141 @@
+"""
+Reader of the snapshots written by write_data: field_psi_<step>.{txt,bin}
+and particles_<step>.{txt,bin}.
+
+Binary files (output format 'bin' in parameters.in) start with a 64-byte
+header: the magic b'HABPSNAP', then 32-bit integers version, kind
+(1 = field, 2 = particles), step, Lx, Ly, Np, bytes per real and values per
+record, then zero padding. The data that follow are mapped into memory
+without copying:
+
+    from snapshot_io import load_field, load_particles, unwrap
+    psi = load_field("SIM_0_0/field_psi_10000.bin")       # psi[j, i], (Ly, Lx)
+    p = load_particles("SIM_0_0/particles_10000.bin")      # (Np, 5): x, y, phi, ix, iy
+    xy = unwrap(p, 256, 256)                               # (Np, 2) unwrapped x, y
+
+ix and iy count the periodic images a particle has crossed since the start
+of the run, so that x + ix*Lx, y + iy*Ly follow it across the boundaries
+(mean squared displacements, trajectories). Snapshots of version 1 and
+text files of earlier runs have the first three columns only.
+
+Packed field snapshots (output format 'packed') are binary snapshots of
+kind 3: psi quantised to `bits` bits (bits, block size, psimin and the step
+dq follow in the header padding) and packed in blocks of varying bit width,
+see write_field_packed in Code/mod_io.f90. load_field decodes them into an
+array with psi restored to within dq/2 (header["max_error"]).
+
+Text files are read with np.loadtxt into arrays of the same shapes, so that
+the tools work with either format.
+"""
+import re
+from pathlib import Path
+import numpy as np
+
+MAGIC = b"HABPSNAP"
+HEADER_BYTES = 64
+VERSION = 2                     # 1: particles without ix, iy
+KIND_FIELD, KIND_PARTICLES, KIND_PACKED = 1, 2, 3
+
+
+def read_header(path):
+    """Header of a binary snapshot as a dict (dtype: numpy dtype of the reals)."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_BYTES)
+    if len(raw) < HEADER_BYTES or raw[:8] != MAGIC:
+        raise ValueError(f"{path} is not a binary snapshot")
+    # the file is in the byte order of the machine that wrote it
+    for order in "<>":
+        ints = np.frombuffer(raw, dtype=f"{order}i4", count=8, offset=8)
+        if 1 <= ints[0] <= VERSION:
+            break
+    else:
+        raise ValueError(f"{path}: unknown snapshot version")
+    version, kind, step, lx, ly, n_p, real_bytes, ncols = (int(v) for v in ints)
+    h = {"version": version, "kind": kind, "step": step, "Lx": lx, "Ly": ly,
+         "Np": n_p, "ncols": ncols, "dtype": np.dtype(f"{order}f{real_bytes}")}
+    if kind == KIND_PACKED:
+        bits, block = (int(v) for v in np.frombuffer(raw, dtype=f"{order}i4", count=2, offset=40))
+        psimin, dq = (float(v) for v in np.frombuffer(raw, dtype=f"{order}f8", count=2, offset=48))
+        h.update(bits=bits, block=block, psimin=psimin, dq=dq, max_error=dq / 2)
+    return h
+
+
+def snapshot_step(path):
+    """Step of a snapshot, from its file name."""
+    m = re.search(r"_(\d+)\.(txt|bin)$", str(path))
+    return int(m.group(1)) if m else None
+
+
+def load_field(path):
+    """psi[j, i] of a field snapshot, shape (Ly, Lx)."""
+    path = Path(path)
+    if path.suffix == ".bin":
+        h = read_header(path)
+        if h["kind"] == KIND_PACKED:
+            return unpack_field(path, h)
+        if h["kind"] != KIND_FIELD:
+            raise ValueError(f"{path} is not a field snapshot")
+        return np.memmap(path, dtype=h["dtype"], mode="r", offset=HEADER_BYTES,
+                         shape=(h["Ly"], h["Lx"]))
+    data = np.loadtxt(path, ndmin=2)
+    if data.shape[1] < 3:
+        return data[:, 0]           # bare column of psi: the shape is unknown
+    lx = int(data[:, 0].max())
+    return data[:, 2].reshape(-1, lx)
+
+
+def unpack_field(path, h):
+    """psi[j, i] of a packed field snapshot with header h, shape (Ly, Lx)."""
+    raw = np.fromfile(path, dtype=np.uint8, offset=HEADER_BYTES)
+    block = h["block"]
+    nbx = -(-h["Lx"] // block)
+    nblocks = h["Ly"] * nbx
+    widths = raw[:nblocks].astype(np.int64)
+    nbytes = widths * block // 8
+    starts = nblocks + np.cumsum(nbytes) - nbytes
+    if nblocks + nbytes.sum() > raw.size:
+        raise ValueError(f"{path} is truncated")
+    # the blocks of each width at once: bytes -> bits -> values
+    z = np.zeros((nblocks, block), dtype=np.int64)
+    for w in np.unique(widths[widths > 0]):
+        sel = np.flatnonzero(widths == w)
+        blk = raw[starts[sel, None] + np.arange(w * block // 8)]
+        bits = np.unpackbits(blk, axis=1, bitorder="little").reshape(sel.size, block, w)
+        z[sel] = bits.astype(np.int64) @ (1 << np.arange(w, dtype=np.int64))
+    d = np.where(z & 1, -(z >> 1) - 1, z >> 1)
+    k = np.cumsum(d.reshape(h["Ly"], nbx * block), axis=1)[:, :h["Lx"]]
+    # (in double precision, which keeps the bound dq/2 for any bits)
+    return h["psimin"] + k * h["dq"]
+
+
+def load_particles(path):
+    """x, y, phi, ix, iy of the particles of a snapshot, shape (Np, 5)
+    (Np, 3 for snapshots without the image counters)."""
+    path = Path(path)
+    if path.suffix == ".bin":
+        h = read_header(path)
+        if h["kind"] != KIND_PARTICLES:
+            raise ValueError(f"{path} is not a particle snapshot")
+        return np.memmap(path, dtype=h["dtype"], mode="r", offset=HEADER_BYTES,
+                         shape=(h["Np"], h["ncols"]))
+    return np.loadtxt(path, ndmin=2)
+
+
+def unwrap(particles, lx, ly):
+    """Unwrapped positions x + ix*Lx, y + iy*Ly of load_particles, (Np, 2)."""
+    p = np.asarray(particles, dtype=np.float64)
+    if p.shape[1] < 5:
+        raise ValueError("the snapshot has no image counters (written before version 2)")
+    return np.stack([p[:, 0] + p[:, 3] * lx, p[:, 1] + p[:, 4] * ly], axis=1)
+
+
+def snapshot_files(folder, prefix):
+    """Snapshots prefix_<step>.{txt,bin} of a folder as {step: path}
+    (the binary file wins if both exist)."""
+    files = {}
+    for ext in ("txt", "bin"):
+        for f in Path(folder).glob(f"{prefix}_*.{ext}"):
+            step = snapshot_step(f)
+            if step is not None:
+                files[step] = f
+    return dict(sorted(files.items()))
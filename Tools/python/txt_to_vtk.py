@@ -5,6 +5,7 @@ import argparse
 import re
 import sys
 from get_params import get_params
+from snapshot_io import load_field, load_particles
 
 def extract_time_and_key(fname):
     m = re.search(r"(\d+)", fname.name)
@@ -12,18 +13,22 @@ def extract_time_and_key(fname):
         return None, None
     return int(m.group(1)), m.group(1)
 
+def snapshots(indir, prefix):
+    # {key: (time, file)} of the text and binary snapshots (binary wins)
+    files = {}
+    for ext in ("txt", "bin"):
+        for f in indir.glob(f"{prefix}_*.{ext}"):
+            t, key = extract_time_and_key(f)
+            if key:
+                files[key] = (t, f)
+    return files
+
 def convert(pol_file, colls_file, time_key, Nx, Ny, dx, dy, output_dir):
     # ======================
     # Field (psi) - Transposed
     # ======================
-    psi_raw = np.loadtxt(pol_file, delimiter=None)
-
-    if psi_raw.ndim == 1:
-        psi = psi_raw
-    elif psi_raw.ndim == 2 and psi_raw.shape[1] == 3:
-        psi = psi_raw[:, 2]
-    else:
-        raise ValueError(f"Unexpected shape {psi_raw.shape} in {pol_file}")
+    # (text or binary, rows of psi[j, :] one after the other)
+    psi = np.ravel(load_field(pol_file))
 
     if psi.size != Nx * Ny:
         raise ValueError(f"Size {psi.size} != {Nx}x{Ny} in {pol_file}")
@@ -43,7 +48,7 @@ def convert(pol_file, colls_file, time_key, Nx, Ny, dx, dy, output_dir):
     # ======================
     # Particles + orientation
     # ======================
-    data = np.loadtxt(colls_file)
+    data = np.asarray(load_particles(colls_file))
     if data.shape[1] < 3:
         raise ValueError(f"{colls_file} must contain x y phi columns")
 
@@ -57,7 +62,7 @@ def convert(pol_file, colls_file, time_key, Nx, Ny, dx, dy, output_dir):
     poly.save(output_dir / f"colls_{time_key}.vtp")
 
 def main():
-    parser = argparse.ArgumentParser(description="Convert simulation TXT to VTK")
+    parser = argparse.ArgumentParser(description="Convert simulation TXT (or binary) snapshots to VTK")
     parser.add_argument("input_dir", type=str, help="Path to the simulation folder")
     parser.add_argument("--Nx", type=int, help="Override Grid X")
     parser.add_argument("--Ny", type=int, help="Override Grid Y")
@@ -76,11 +81,8 @@ def main():
 
     print(f"Using Grid: {Nx}x{Ny} (dt={dt})")
 
-    pol_map = {extract_time_and_key(f)[1]: (extract_time_and_key(f)[0], f) 
-               for f in indir.glob("field_psi_*.txt") if extract_time_and_key(f)[1]}
-    
-    colls_map = {extract_time_and_key(f)[1]: (extract_time_and_key(f)[0], f) 
-                 for f in indir.glob("particles_*.txt") if extract_time_and_key(f)[1]}
+    pol_map = snapshots(indir, "field_psi")
+    colls_map = snapshots(indir, "particles")
 
     common_keys = sorted(set(pol_map) & set(colls_map), key=lambda k: pol_map[k][0])
 
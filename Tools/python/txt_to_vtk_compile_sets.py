@@ -4,7 +4,7 @@ import sys
 
 # Import the logic from your existing script
 try:
-    from txt_to_vtk import convert, extract_time_and_key
+    from txt_to_vtk import convert, snapshots
     from get_params import get_params
 except ImportError:
     print("Error: Ensure txt_to_vtk_loop_angles.py and get_params.py are in this folder.")
@@ -29,16 +29,9 @@ def process_parent_folder(parent_path, dx, dy):
         lx, ly, tau, u, dt = get_params(str(sim_dir))
         
         # 2. Map the files inside this subfolder
-        pol_map = {}
-        colls_map = {}
-
-        for f in sim_dir.glob("field_psi_*.txt"):
-            t_int, t_key = extract_time_and_key(f)
-            if t_key: pol_map[t_key] = (t_int, f)
-
-        for f in sim_dir.glob("particles_*.txt"):
-            t_int, t_key = extract_time_and_key(f)
-            if t_key: colls_map[t_key] = (t_int, f)
+        # (text, binary or packed snapshots)
+        pol_map = snapshots(sim_dir, "field_psi")
+        colls_map = snapshots(sim_dir, "particles")
 
         common_keys = sorted(set(pol_map) & set(colls_map), key=lambda k: pol_map[k][0])
 